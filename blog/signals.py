@@ -0,0 +1,19 @@
+"""
+Keep cached blog responses and the frontend in sync with Wagtail publishing.
+"""
+from wagtail.signals import page_published, page_unpublished
+
+from products.cache import cache
+from products.invalidation import publisher
+
+
+def _blog_page_changed(sender, instance, **kwargs):
+    cache.delete_many(['blog_articles', 'blog_slugs', f'blog_article_{instance.slug}'])
+    publisher.blog_changed(instance.slug)
+
+
+def connect_signals():
+    from blog.models import BlogPage
+
+    page_published.connect(_blog_page_changed, sender=BlogPage, dispatch_uid='blog_page_published')
+    page_unpublished.connect(_blog_page_changed, sender=BlogPage, dispatch_uid='blog_page_unpublished')
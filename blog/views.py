@@ -1,4 +1,8 @@
-from django.http import JsonResponse
+import time
+
+from django.conf import settings
+from products.cache import get_cached_response, cache_response
+from products.renderers import ORJSONResponse
 from .models import BlogPage
 
 CATEGORY_COLORS = {
@@ -37,23 +41,43 @@ def serialize_article(page):
     }
 
 
+def _blog_cache_duration():
+    return getattr(settings, 'CACHE_BLOG_DURATION', 300)
+
+
 def article_list(request):
     """GET /api/blog/articles/ — list all live blog articles."""
+    cached = get_cached_response(request, 'blog_articles')
+    if cached is not None:
+        return cached
+    started = time.monotonic()
     articles = BlogPage.objects.live().order_by('-first_published_at')
     data = [serialize_article(a) for a in articles]
-    return JsonResponse(data, safe=False)
+    return cache_response(request, 'blog_articles', data, _blog_cache_duration(),
+                          cost=time.monotonic() - started)
 
 
 def article_detail(request, slug):
     """GET /api/blog/articles/<slug>/ — single article by slug."""
+    cache_key = f'blog_article_{slug}'
+    cached = get_cached_response(request, cache_key)
+    if cached is not None:
+        return cached
+    started = time.monotonic()
     try:
         article = BlogPage.objects.live().get(slug=slug)
-        return JsonResponse(serialize_article(article))
     except BlogPage.DoesNotExist:
-        return JsonResponse({'error': 'Article not found'}, status=404)
+        return ORJSONResponse({'error': 'Article not found'}, status=404)
+    return cache_response(request, cache_key, serialize_article(article), _blog_cache_duration(),
+                          cost=time.monotonic() - started)
 
 
 def article_slugs(request):
     """GET /api/blog/slugs/ — all published slugs for generateStaticParams."""
+    cached = get_cached_response(request, 'blog_slugs')
+    if cached is not None:
+        return cached
+    started = time.monotonic()
     slugs = list(BlogPage.objects.live().values_list('slug', flat=True))
-    return JsonResponse(slugs, safe=False)
+    return cache_response(request, 'blog_slugs', slugs, _blog_cache_duration(),
+                          cost=time.monotonic() - started)
@@ -143,11 +143,17 @@ KAUFLAND_URI = os.getenv('MONGODB_KAUFLAND_URI', 'mongodb+srv://stronglimitless7
 KAUFLAND_DB = os.getenv('MONGODB_KAUFLAND_DB', 'Kaufland')
 KAUFLAND_COLLECTION = os.getenv('MONGODB_KAUFLAND_COLLECTION', 'Db')
 
+# Derived data Database Configuration (tables precomputed by batch jobs,
+# e.g. similar products); defaults to the Saturn cluster
+DERIVED_URI = os.getenv('MONGODB_DERIVED_URI', SATURN_URI)
+DERIVED_DB = os.getenv('MONGODB_DERIVED_DB', 'Preisradio')
+
 # Build full URIs with database names
 SATURN_FULL_URI = f"{SATURN_URI}{SATURN_DB}?retryWrites=true&w=majority"
 MEDIAMARKT_FULL_URI = f"{MEDIAMARKT_URI}{MEDIAMARKT_DB}?retryWrites=true&w=majority"
 OTTO_FULL_URI = f"{OTTO_URI}{OTTO_DB}?retryWrites=true&w=majority"
 KAUFLAND_FULL_URI = f"{KAUFLAND_URI}{KAUFLAND_DB}?retryWrites=true&w=majority"
+DERIVED_FULL_URI = f"{DERIVED_URI}{DERIVED_DB}?retryWrites=true&w=majority"
 
 # Print configuration for debugging
 print(f"📊 MongoDB Configuration:")
@@ -155,6 +161,7 @@ print(f"   Saturn DB: {SATURN_DB}, Collection: {SATURN_COLLECTION}")
 print(f"   MediaMarkt DB: {MEDIAMARKT_DB}, Collection: {MEDIAMARKT_COLLECTION}")
 print(f"   Otto DB: {OTTO_DB}, Collection: {OTTO_COLLECTION}")
 print(f"   Kaufland DB: {KAUFLAND_DB}, Collection: {KAUFLAND_COLLECTION}")
+print(f"   Derived DB: {DERIVED_DB}")
 
 # Initialize MongoDB connections
 # Disconnect existing connections to avoid duplicate registration errors
@@ -178,6 +185,11 @@ try:
 except:
     pass
 
+try:
+    mongoengine.disconnect(alias='derived')
+except:
+    pass
+
 # Connect to Saturn database
 try:
     mongoengine.connect(
@@ -236,10 +248,42 @@ try:
 except Exception as e:
     print(f"✗ Kaufland database connection failed: {e}")
 
+# Connect to the derived data database
+try:
+    mongoengine.connect(
+        alias='derived',
+        host=DERIVED_FULL_URI,
+        connectTimeoutMS=30000,
+        serverSelectionTimeoutMS=30000,
+        socketTimeoutMS=30000,
+        maxPoolSize=50,
+    )
+    print("✓ Derived database connected successfully")
+except Exception as e:
+    print(f"✗ Derived database connection failed: {e}")
+
 
 # Google Merchant Center Configuration
 GOOGLE_MERCHANT_ID = config('GOOGLE_MERCHANT_ID', default='5698148813')
 GOOGLE_SERVICE_ACCOUNT_KEY = os.path.join(BASE_DIR, 'astute-pride-262723-7f9bd77e07a5.json')
+MERCHANT_SYNC_BATCH_SIZE = 500          # products hashed (and uploaded) per checkpoint
+MERCHANT_SYNC_SWEEP_INTERVAL = 24 * 3600  # seconds between sweeps for deleted products
+MERCHANT_UPLOAD_BATCH_SIZE = 1000      # products per custombatch call (API maximum)
+MERCHANT_UPLOAD_WORKERS = 4            # concurrent custombatch calls
+MERCHANT_UPLOAD_RETRIES = 3            # retries of transient failures (backoff 1s, 2s, 4s)
+MERCHANT_UPLOAD_TIMEOUT = 60           # seconds per custombatch call
+MERCHANT_TOKEN_REFRESH_MARGIN = 300    # refresh the access token this many seconds before expiry
+
+# Frontend revalidation (POST /api/revalidate on the Next.js app)
+# Disabled while the token is empty. FRONTEND_REVALIDATE_TRANSPORT may name a
+# callable (url, payload, timeout) -> status code to replace the HTTP client.
+FRONTEND_REVALIDATE_URL = config('FRONTEND_REVALIDATE_URL', default='https://preisradio.de/api/revalidate')
+FRONTEND_REVALIDATE_TOKEN = config('FRONTEND_REVALIDATE_TOKEN', default='')
+FRONTEND_REVALIDATE_TRANSPORT = config('FRONTEND_REVALIDATE_TRANSPORT', default='') or None
+FRONTEND_REVALIDATE_FLUSH_INTERVAL = 30   # seconds between batched POSTs
+FRONTEND_REVALIDATE_BATCH_SIZE = 50       # paths per POST
+FRONTEND_REVALIDATE_MIN_INTERVAL = 1.0    # rate limit: seconds between requests
+FRONTEND_REVALIDATE_MAX_RETRIES = 3
 
 # Groq API Configuration (AI article generation)
 GROQ_API_KEY = config('GROQ_API_KEY', default='')
@@ -262,12 +306,88 @@ CACHES = {
         'OPTIONS': {
             'MAX_ENTRIES': 1000,  # Maximum cached items
         }
-    }
+    },
+    # Per-product entries (detail pages and their 404s, best offers per GTIN or
+    # group, see products/cache.py),
+    # kept apart so crawling product IDs can't cull the shared entries above.
+    # Sizing: an entry is ~2-5 KB (JSON body + gzip copy), so 20000 entries
+    # are at most ~100 MB per worker; LocMemCache culls a third when full.
+    'products': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'preisradio-products',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        }
+    },
 }
 
 # Cache durations (in seconds)
 CACHE_HOMEPAGE_DURATION = 3600  # 1 hour for homepage (no filters)
 CACHE_SEARCH_DURATION = 600     # 10 minutes for search results
+CACHE_BLOG_DURATION = 300       # 5 minutes for blog articles
+CACHE_FACETS_DURATION = 900     # 15 minutes for search facet counts (?facets=1)
+CACHE_HISTOGRAM_DURATION = 900  # 15 minutes for price histograms
+CACHE_DEALS_DURATION = 900      # 15 minutes for deals per category
+CACHE_PRICE_DROPS_DURATION = 300  # 5 minutes for the latest price drops
+
+# Cache statistics (GET /api/status/cache/, staff only) track the expiry of
+# up to this many keys to detect LocMemCache evictions
+CACHE_STATS_MAX_TRACKED_KEYS = 10000
+
+# Cached API responses are stored as encoded JSON bytes; bodies above this size
+# also get a gzip copy served to clients sending Accept-Encoding: gzip
+CACHE_GZIP_MIN_BYTES = 1024
+CACHE_GZIP_LEVEL = 6
+
+# Category/brand facet tables are kept in memory and rebuilt in the background
+FACET_REFRESH_INTERVAL = 900    # 15 minutes
+
+# Category statistics (count per retailer, min/median/max price...) are
+# refreshed incrementally; every Nth refresh rebuilds them from scratch
+CATEGORY_STATS_REFRESH_INTERVAL = 600   # 10 minutes
+CATEGORY_STATS_FULL_REFRESH_EVERY = 24
+
+# Canonical categories with per-retailer aliases, built offline by
+# `python manage.py build_category_map`; the overrides file (optional) maps a
+# category spelling to the canonical name it must be grouped under
+CATEGORY_MAP_PATH = BASE_DIR / 'data' / 'category_map.json'
+CATEGORY_MAP_OVERRIDES_PATH = BASE_DIR / 'data' / 'category_overrides.json'
+CATEGORY_MAP_CHECK_INTERVAL = 60    # seconds between checks for a rebuilt map
+
+# Similar products: MinHash/LSH index over titles, refreshed incrementally in
+# the background (full rebuild every Nth refresh drops deleted products)
+SIMILARITY_REFRESH_INTERVAL = 1800  # 30 minutes
+SIMILARITY_FULL_REFRESH_EVERY = 24
+SIMILARITY_PRICE_WEIGHT = 0.2       # weight of price proximity next to title similarity
+SIMILAR_PRECOMPUTE_TOP_K = 12       # similar products stored per product by precompute_similar
+
+# Best-offer index (cheapest offer per GTIN/product group, update_best_offers)
+BEST_OFFER_TTL = 300                # 5 minutes per cached key
+BEST_OFFERS_MAX_KEYS = 100          # keys per batch request
+
+# Price drops (detected by record_price_history)
+PRICE_DROP_MIN_PCT = 1.0            # smaller decreases are not recorded as drops
+
+# Price alerts (send_price_alerts, sent through EMAIL_BACKEND)
+SITE_URL = config('SITE_URL', default='https://preisradio.de')
+PRICE_ALERTS_PER_EMAIL = 50         # active alerts one address may hold
+PRICE_ALERT_EMAIL_BATCH = 50        # messages per send_messages() call
+PRICE_ALERT_EMAIL_RETRIES = 3
+
+# Pre-rendered product sitemaps (generate_sitemaps), served at /sitemap-products-*
+SITEMAP_DIR = BASE_DIR / 'data' / 'sitemaps'
+SITEMAP_SHARD_SIZE = 50000          # URLs per shard (sitemap protocol maximum)
+SITEMAP_MAX_AGE = 3600              # Cache-Control max-age of the served files
+
+# Pre-generated Google Merchant feed (generate_merchant_feed)
+MERCHANT_FEED_PATH = BASE_DIR / 'data' / 'feeds' / 'google_merchant.xml.gz'
+MERCHANT_FEED_MAX_AGE = 26 * 3600   # older files are ignored and the feed is streamed live
+
+# Product detail lookups by ID (shared by retrieve and similar)
+PRODUCT_DETAIL_TTL = 600        # 10 minutes for serialized products
+PRODUCT_NOT_FOUND_TTL = 60      # 1 minute for unknown/deleted IDs
+PRODUCT_LOOKUP_ERROR_TTL = 10   # unknown IDs while a retailer DB is failing
 
 
 # Password validation
@@ -341,6 +461,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'MAX_PAGE_SIZE': 10000,  # Allow up to 10000 items per page for sitemap generation
+    # orjson for all API responses; the browsable API only in development
+    'DEFAULT_RENDERER_CLASSES': [
+        'products.renderers.ORJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -7,6 +7,8 @@ from wagtail.admin import urls as wagtailadmin_urls
 from wagtail import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
+from products.views import sitemap_file
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('wagtail-admin/', include(wagtailadmin_urls)),
@@ -14,6 +16,8 @@ urlpatterns = [
     path('api/', include('products.urls')),
     path('api/contact/', include('contact.urls')),
     path('api/blog/', include('blog.urls')),
+    # Pre-rendered product sitemaps (generate_sitemaps)
+    re_path(r'^(?P<name>sitemap-products-[\w.]+)$', sitemap_file, name='sitemap-file'),
 ]
 
 if settings.DEBUG:
@@ -13,6 +13,16 @@ const nextConfig: NextConfig = {
       },
     ],
   },
+  async rewrites() {
+    return [
+      // Pre-rendered product sitemaps (generate_sitemaps), served by the API;
+      // their index lists them under this host
+      {
+        source: '/sitemap-products-:name',
+        destination: 'https://api.preisradio.de/sitemap-products-:name',
+      },
+    ];
+  },
   async headers() {
     return [
       {
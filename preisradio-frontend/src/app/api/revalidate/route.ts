@@ -4,6 +4,9 @@ import { revalidatePath } from 'next/cache';
 // Secret token to protect the endpoint
 const REVALIDATE_TOKEN = process.env.REVALIDATE_TOKEN || 'your-secret-token-here';
 
+// Max paths accepted in one batched request from the backend
+const MAX_PATHS = 200;
+
 export async function POST(request: NextRequest) {
   try {
     // Check for secret token
@@ -16,16 +19,28 @@ export async function POST(request: NextRequest) {
       );
     }
 
-    // Get path from request body
+    // Get path(s) from request body: { path } or batched { paths: [...] }
     const body = await request.json();
-    const path = body.path || '/';
+    const paths: string[] = Array.isArray(body.paths)
+      ? body.paths.filter((p: unknown): p is string => typeof p === 'string' && p.startsWith('/'))
+      : [body.path || '/'];
+
+    if (paths.length > MAX_PATHS) {
+      return NextResponse.json(
+        { message: `Too many paths (max ${MAX_PATHS})` },
+        { status: 400 }
+      );
+    }
 
-    // Revalidate the path
-    revalidatePath(path);
+    // Revalidate the path(s)
+    for (const path of paths) {
+      revalidatePath(path);
+    }
 
     return NextResponse.json({
       revalidated: true,
-      path,
+      path: paths[0],
+      paths,
       now: Date.now()
     });
   } catch (err) {
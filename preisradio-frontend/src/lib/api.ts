@@ -1,6 +1,6 @@
 // Client API pour communiquer avec le backend Django
 
-import { Product, Retailer, ApiResponse, HealthResponse, StatusResponse, CategoriesResponse, BrandsResponse } from './types';
+import { Product, Retailer, ApiResponse, HealthResponse, StatusResponse, CategoriesResponse, BrandsResponse, PriceHistogram, BestOffersResponse, PriceHistory, PriceDrop, CategoryStats, CategoryStatsResponse } from './types';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'https://preisradio.de';
 const API_PATH = process.env.NEXT_PUBLIC_API_BASE || '/api';
@@ -57,6 +57,7 @@ class ApiClient {
     min_price?: string | number;
     max_price?: string | number;
     sort?: string;
+    facets?: boolean;
   }): Promise<ApiResponse<Product>> {
     const queryParams = new URLSearchParams();
 
@@ -69,6 +70,7 @@ class ApiClient {
     if (params?.min_price) queryParams.append('min_price', params.min_price.toString());
     if (params?.max_price) queryParams.append('max_price', params.max_price.toString());
     if (params?.sort) queryParams.append('sort', params.sort);
+    if (params?.facets) queryParams.append('facets', '1');
 
     const query = queryParams.toString();
     const endpoint = query ? `/products/?${query}` : '/products/';
@@ -122,12 +124,14 @@ class ApiClient {
 
   async getBrands(params?: {
     search?: string;
+    mode?: 'prefix';  // Only brands starting with search (typeahead)
     page?: number;
     page_size?: number;
   }): Promise<BrandsResponse> {
     const queryParams = new URLSearchParams();
 
     if (params?.search) queryParams.append('search', params.search);
+    if (params?.mode) queryParams.append('mode', params.mode);
     if (params?.page) queryParams.append('page', params.page.toString());
     if (params?.page_size) queryParams.append('page_size', params.page_size.toString());
 
@@ -137,6 +141,33 @@ class ApiClient {
     return this.request<BrandsResponse>(endpoint);
   }
 
+  async getPriceHistogram(params?: {
+    search?: string;
+    category?: string;
+    brand?: string;
+    retailer?: string;
+    min_price?: number;
+    max_price?: number;
+    buckets?: number;
+    mode?: 'fixed' | 'quantile';
+  }): Promise<PriceHistogram> {
+    const queryParams = new URLSearchParams();
+
+    if (params?.search) queryParams.append('search', params.search);
+    if (params?.category) queryParams.append('category', params.category);
+    if (params?.brand) queryParams.append('brand', params.brand);
+    if (params?.retailer) queryParams.append('retailer', params.retailer);
+    if (params?.min_price !== undefined) queryParams.append('min_price', params.min_price.toString());
+    if (params?.max_price !== undefined) queryParams.append('max_price', params.max_price.toString());
+    if (params?.buckets) queryParams.append('buckets', params.buckets.toString());
+    if (params?.mode) queryParams.append('mode', params.mode);
+
+    const query = queryParams.toString();
+    const endpoint = query ? `/products/price_histogram/?${query}` : '/products/price_histogram/';
+
+    return this.request<PriceHistogram>(endpoint);
+  }
+
   async getProduct(id: string): Promise<Product> {
     return this.request<Product>(`/products/${id}/`);
   }
@@ -169,6 +200,97 @@ class ApiClient {
     return this.getProducts({ search: gtin, page_size: 10 });
   }
 
+  async getDeals(params?: {
+    category?: string;
+    retailer?: string;
+    limit?: number;
+  }): Promise<{ count: number; results: Product[] }> {
+    const queryParams = new URLSearchParams();
+
+    if (params?.category) queryParams.append('category', params.category);
+    if (params?.retailer) queryParams.append('retailer', params.retailer);
+    if (params?.limit) queryParams.append('limit', params.limit.toString());
+
+    const query = queryParams.toString();
+    const endpoint = query ? `/products/deals/?${query}` : '/products/deals/';
+
+    return this.request<{ count: number; results: Product[] }>(endpoint);
+  }
+
+  async getPriceDrops(params?: {
+    hours?: number;
+    retailer?: string;
+    min_pct?: number;
+    limit?: number;
+  }): Promise<{ count: number; results: PriceDrop[] }> {
+    const queryParams = new URLSearchParams();
+
+    if (params?.hours) queryParams.append('hours', params.hours.toString());
+    if (params?.retailer) queryParams.append('retailer', params.retailer);
+    if (params?.min_pct) queryParams.append('min_pct', params.min_pct.toString());
+    if (params?.limit) queryParams.append('limit', params.limit.toString());
+
+    const query = queryParams.toString();
+    const endpoint = query ? `/products/price_drops/?${query}` : '/products/price_drops/';
+
+    return this.request<{ count: number; results: PriceDrop[] }>(endpoint);
+  }
+
+  // Alerte prix : un e-mail quand le prix passe sous le seuil (produit ou GTIN)
+  async createPriceAlert(params: {
+    email: string;
+    threshold: number;
+    product_id?: string;
+    gtin?: string;
+  }): Promise<{ id: string; threshold: number; product_id: string | null; gtin: string | null }> {
+    return this.request('/products/alerts/', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(params),
+    });
+  }
+
+  async getCategoryStats(params?: {
+    search?: string;
+    ordering?: 'count' | 'name';
+    page?: number;
+    page_size?: number;
+  }): Promise<CategoryStatsResponse> {
+    const queryParams = new URLSearchParams();
+
+    if (params?.search) queryParams.append('search', params.search);
+    if (params?.ordering) queryParams.append('ordering', params.ordering);
+    if (params?.page) queryParams.append('page', params.page.toString());
+    if (params?.page_size) queryParams.append('page_size', params.page_size.toString());
+
+    const query = queryParams.toString();
+    const endpoint = query ? `/products/category_stats/?${query}` : '/products/category_stats/';
+
+    return this.request<CategoryStatsResponse>(endpoint);
+  }
+
+  async getCategoryStatsFor(category: string): Promise<CategoryStats> {
+    return this.request<CategoryStats>(`/products/category_stats/?category=${encodeURIComponent(category)}`);
+  }
+
+  async getPriceHistory(id: string, days: number = 365): Promise<PriceHistory> {
+    return this.request<PriceHistory>(`/products/${id}/history/?days=${days}`);
+  }
+
+  // Un seul appel pour toutes les cartes d'une page ("ab X € bei Y")
+  async getBestOffers(params: { gtins?: string[]; groups?: string[] }): Promise<BestOffersResponse> {
+    const queryParams = new URLSearchParams();
+
+    if (params.gtins?.length) queryParams.append('gtin', params.gtins.join(','));
+    if (params.groups?.length) queryParams.append('group', params.groups.join(','));
+
+    return this.request<BestOffersResponse>(`/products/best_offers/?${queryParams.toString()}`);
+  }
+
+  async getProductsByGroup(group: string): Promise<{ results: Product[] }> {
+    return this.request<{ results: Product[] }>(`/products/by_group/?group=${encodeURIComponent(group)}`);
+  }
+
   // Retailers
   async getRetailers(): Promise<ApiResponse<Retailer>> {
     return this.request<ApiResponse<Retailer>>('/retailers/');
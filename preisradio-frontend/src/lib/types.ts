@@ -35,6 +35,8 @@ export interface Product {
   title: string;  // Nom du produit
   url: string;  // URL vers le produit sur le site du retailer
   retailer?: string;  // Retailer source: 'saturn' ou 'mediamarkt'
+  product_group?: string | null;  // Même produit chez d'autres retailers (getProductsByGroup)
+  discount_pct?: number | null;  // Remise en %, calculée à partir de old_price/price
 }
 
 export interface ApiResponse<T> {
@@ -42,6 +44,85 @@ export interface ApiResponse<T> {
   next: string | null;
   previous: string | null;
   results: T[];
+  facets?: SearchFacets | null;  // Only with facets: true
+}
+
+// Counts for the active filters, returned by /products/?facets=1
+export interface SearchFacets {
+  retailers: { name: string; count: number }[];
+  brands: { name: string; count: number }[];
+  categories: { name: string; count: number }[];
+  price_ranges: { min: number; max: number | null; count: number }[];
+  price: { min: number | null; max: number | null };
+}
+
+// Bucketed price counts, returned by /products/price_histogram/
+export interface PriceHistogram {
+  mode: 'fixed' | 'quantile';
+  count: number;
+  min?: number;
+  max?: number;
+  buckets: { min: number; max: number; count: number }[];
+}
+
+// Cheapest current offer of a GTIN or product group, from /products/best_offers/
+export interface BestOffer {
+  best_retailer: string;
+  best_product_id: string;
+  best_price: number;
+  max_price: number;
+  spread: number;
+  offer_count: number;
+  offers: { retailer: string; id: string; price: number }[];
+  updated_at: string | null;
+}
+
+export interface BestOffersResponse {
+  gtins: Record<string, BestOffer>;
+  groups: Record<string, BestOffer>;
+}
+
+// Historique des prix : tableaux parallèles (timestamps en secondes epoch)
+// En résolution day/week : début de chaque période, dernier prix et min/max
+export interface PriceHistory {
+  product_id: string;
+  from: string;
+  to: string;
+  resolution: 'raw' | 'day' | 'week';
+  count: number;
+  timestamps: number[];
+  prices: number[];
+  min?: number[];
+  max?: number[];
+}
+
+export interface PriceDrop {
+  product: Product;
+  old_price: number;
+  price: number;
+  drop: number;
+  drop_pct: number;
+  detected_at: string;
+}
+
+export interface CategoryStats {
+  name: string;
+  count: number;
+  retailers: Record<string, number>;
+  min_price: number | null;
+  median_price: number | null;
+  max_price: number | null;
+  newest: string | null;
+  image_share: number | null;
+}
+
+export interface CategoryStatsResponse {
+  count: number;
+  page: number;
+  page_size: number;
+  total_pages: number;
+  updated_at: string | null;
+  results: CategoryStats[];
 }
 
 export interface HealthResponse {
@@ -67,6 +148,15 @@ export interface StatusResponse {
 // The backend simplified the response to return only brand names
 export type Brand = string;
 
+// Facet row returned next to the names by /categories/ and /brands/
+export interface FacetItem {
+  name: string;
+  count: number;
+  min_price: number | null;
+  max_price: number | null;
+  last_seen: string | null;
+}
+
 export interface BrandsResponse {
   count: number;
   next: string | null;
@@ -75,6 +165,7 @@ export interface BrandsResponse {
   page_size: number;
   total_pages: number;
   results: string[];  // Array of brand names
+  items?: FacetItem[];  // Same page with product counts and price range
 }
 
 // Category is now just a string (category name)
@@ -89,4 +180,5 @@ export interface CategoriesResponse {
   page_size: number;
   total_pages: number;
   results: string[];  // Array of category names
+  items?: FacetItem[];  // Same page with product counts and price range
 }
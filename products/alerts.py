@@ -0,0 +1,273 @@
+"""
+Price alerts: "notify me below X €" on a product or a GTIN.
+
+Matching: the send_price_alerts command loads all active alerts into an
+AlertIndex, one sorted threshold array per target ('product:<id>' or
+'gtin:<gtin>'). An alert fires when the price is at or below its
+threshold, so the alerts a price triggers are the suffix of the array
+starting at bisect_left(thresholds, price): each scraped product is matched
+against all alerts with two lookups. The command walks the retailers by
+scraped_at watermark, so a run costs time proportional to the scraped
+products.
+
+Delivery: notifications are grouped per recipient and sent through one
+EMAIL_BACKEND connection that stays open for the whole run, in batches of
+PRICE_ALERT_EMAIL_BATCH messages. The messages of a batch are handed to
+the connection one at a time, so when sending fails only the messages not
+sent yet are retried (exponential backoff, fresh connection) and nobody
+gets an alert twice. Alerts fire once: they are
+deactivated once their email is sent, and stay active (to fire on a later
+price change) when it could not be.
+"""
+
+import logging
+import secrets
+import smtplib
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from pymongo import UpdateOne
+
+from .best_offers import normalize_gtin
+from .models import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+
+def alert_target(alert):
+    """Index key of an alert document"""
+    if alert.get('product_id'):
+        return f"product:{alert['product_id']}"
+    return f"gtin:{alert['gtin']}"
+
+
+def product_targets(product_id, gtin=None):
+    """Index keys a scraped product is matched against"""
+    targets = [f'product:{product_id}']
+    gtin = normalize_gtin(gtin)
+    if gtin:
+        targets.append(f'gtin:{gtin}')
+    return targets
+
+
+class AlertIndex:
+    """Active alerts grouped per target, thresholds sorted ascending"""
+
+    def __init__(self, alerts):
+        """`alerts` are PriceAlert documents (dicts)"""
+        self.alerts = {}
+        grouped = {}
+        for alert in alerts:
+            self.alerts[alert['_id']] = alert
+            grouped.setdefault(alert_target(alert), []).append((alert['threshold'], alert['_id']))
+
+        self._thresholds = {}
+        self._ids = {}
+        for target, entries in grouped.items():
+            entries.sort(key=lambda entry: entry[0])
+            self._thresholds[target] = array('d', (threshold for threshold, _ in entries))
+            self._ids[target] = [alert_id for _, alert_id in entries]
+
+    def __len__(self):
+        return len(self.alerts)
+
+    @classmethod
+    def load(cls):
+        return cls(PriceAlert._get_collection().find({'active': True}))
+
+    def triggered(self, target, price):
+        """IDs of the alerts of a target whose threshold is at or above a price"""
+        thresholds = self._thresholds.get(target)
+        if thresholds is None:
+            return []
+        return self._ids[target][bisect_left(thresholds, price):]
+
+    def match(self, products):
+        """{alert_id: cheapest triggering product} for a batch of scraped products.
+
+        `products` are dicts with 'id', 'retailer', 'gtin', 'price'.
+        """
+        matches = {}
+        for product in products:
+            price = product.get('price')
+            if price is None:
+                continue
+            for target in product_targets(product['id'], product.get('gtin')):
+                for alert_id in self.triggered(target, price):
+                    best = matches.get(alert_id)
+                    if best is None or price < best['price']:
+                        matches[alert_id] = product
+        return matches
+
+    def discard(self, alert_ids):
+        """Remove fired alerts so they don't match again in the same run"""
+        alert_ids = set(alert_ids)
+        for target, ids in self._ids.items():
+            if not alert_ids.intersection(ids):
+                continue
+            kept = [i for i, alert_id in enumerate(ids) if alert_id not in alert_ids]
+            self._thresholds[target] = array('d', (self._thresholds[target][i] for i in kept))
+            self._ids[target] = [ids[i] for i in kept]
+        for alert_id in alert_ids:
+            self.alerts.pop(alert_id, None)
+
+
+def create_alert(email, threshold, product_id=None, retailer=None, gtin=None):
+    """Store a new active alert and return it"""
+    return PriceAlert(
+        email=email,
+        product_id=product_id,
+        retailer=retailer,
+        gtin=normalize_gtin(gtin) if gtin else None,
+        threshold=threshold,
+        token=secrets.token_urlsafe(24),
+        created_at=datetime.utcnow(),
+    ).save()
+
+
+def _format_price(price):
+    return f'{price:,.2f} €'.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+def alert_message(email, notifications):
+    """EmailMessage for one recipient: [(alert, product)]"""
+    site_url = getattr(settings, 'SITE_URL', 'https://preisradio.de')
+    lines = []
+    for alert, product in notifications:
+        lines.append(
+            f"{product.get('title') or 'Produkt'}\n"
+            f"Jetzt {_format_price(product['price'])} bei {product['retailer'].capitalize()} "
+            f"(Ihr Wunschpreis: {_format_price(alert['threshold'])})\n"
+            f"{site_url}/product/{product['id']}\n"
+            f"Preisalarm abbestellen: {site_url}/api/products/alerts/unsubscribe/?token={alert['token']}\n"
+        )
+
+    if len(notifications) == 1:
+        subject = f"Preisalarm: {notifications[0][1].get('title') or 'Produkt'} ist jetzt günstiger"
+    else:
+        subject = f"Preisalarm: {len(notifications)} Produkte sind jetzt günstiger"
+    body = (
+        "Gute Nachrichten! Folgende Produkte haben Ihren Wunschpreis erreicht:\n\n"
+        + "\n".join(lines)
+        + "\nMit freundlichen Grüßen\nDas Preisradio Team\n"
+    )
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [email])
+
+
+class AlertMailer:
+    """Send messages through one reused connection, in batches, with retries"""
+
+    def __init__(self, batch_size=50, max_retries=3, retry_backoff=2.0, connection=None):
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.connection = connection or get_connection(fail_silently=False)
+        self.stats = {'sent': 0, 'failed': 0, 'batches': 0, 'retries': 0}
+
+    @classmethod
+    def from_settings(cls, connection=None):
+        return cls(
+            batch_size=getattr(settings, 'PRICE_ALERT_EMAIL_BATCH', 50),
+            max_retries=getattr(settings, 'PRICE_ALERT_EMAIL_RETRIES', 3),
+            connection=connection,
+        )
+
+    def __enter__(self):
+        self.connection.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+    def send(self, messages):
+        """Send messages; returns the ones that were delivered"""
+        delivered = []
+        for i in range(0, len(messages), self.batch_size):
+            batch = messages[i:i + self.batch_size]
+            self.stats['batches'] += 1
+            sent = self._send_batch(batch)
+            delivered.extend(sent)
+            self.stats['sent'] += len(sent)
+            self.stats['failed'] += len(batch) - len(sent)
+        return delivered
+
+    def _send_batch(self, batch):
+        """Send a batch; returns the messages delivered.
+
+        With fail_silently=False a backend raises at the first message it
+        can't send, after the earlier ones went out, so messages are sent
+        one per call and a retry resumes at the failed one.
+        """
+        delivered = []
+        position = 0
+        failures = 0
+        while position < len(batch):
+            message = batch[position]
+            try:
+                if failures:
+                    self.stats['retries'] += 1
+                    time.sleep(self.retry_backoff ** (failures - 1))
+                    # The server may have dropped the connection: start over
+                    self.connection.close()
+                    self.connection.open()
+                self.connection.send_messages([message])
+            except smtplib.SMTPRecipientsRefused as e:
+                # Permanent for this recipient: skip it, keep the batch going
+                logger.warning(f"Price alert email to {message.to} refused: {e}")
+                position += 1
+                failures = 0
+                continue
+            except (smtplib.SMTPException, OSError) as e:
+                failures += 1
+                logger.warning(f"Sending price alert emails failed after {len(delivered)} of {len(batch)}: {e}")
+                if failures > self.max_retries:
+                    logger.error(
+                        f"Giving up sending {len(batch) - position} price alert emails "
+                        f"after {self.max_retries} retries"
+                    )
+                    break
+                continue
+            delivered.append(message)
+            position += 1
+            failures = 0
+        return delivered
+
+
+def deliver(index, matches, mailer):
+    """Email the matched alerts, one message per recipient, and deactivate
+    the delivered ones. Returns the number of alerts delivered."""
+    per_email = {}
+    for alert_id, product in matches.items():
+        alert = index.alerts[alert_id]
+        per_email.setdefault(alert['email'], []).append((alert, product))
+
+    messages = [
+        (alert_message(email, notifications), notifications)
+        for email, notifications in per_email.items()
+    ]
+    sent = {id(message) for message in mailer.send([message for message, _ in messages])}
+    delivered = [
+        (alert, product)
+        for message, notifications in messages if id(message) in sent
+        for alert, product in notifications
+    ]
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne({'_id': alert['_id']}, {'$set': {
+            'active': False,
+            'triggered_at': now,
+            'triggered_price': product['price'],
+            'triggered_product': f"{product['retailer']}:{product['id']}",
+        }})
+        for alert, product in delivered
+    ]
+    if operations:
+        PriceAlert._get_collection().bulk_write(operations, ordered=False)
+    # Undelivered alerts stay active but must not fire again in this run
+    index.discard(matches)
+    return len(delivered)
@@ -0,0 +1,206 @@
+"""
+Best-offer index: cheapest current offer per GTIN and per product group.
+
+For every GTIN (and every product_group written by match_products) the
+BestOffer collection holds the offers of all retailers sorted by price, the
+cheapest retailer and price, the spread between the cheapest and the most
+expensive offer and the number of offers, so a list page can show
+"ab X € bei Y" for all its cards with one batch request.
+
+`update_best_offers` keeps it current: products scraped since the job's
+watermark tell which keys changed, and only those keys are recomputed from
+the retailer collections (indexed gtin/product_group lookups). Changes
+that do not touch scraped_at (product groups rewritten by match_products)
+are queued with mark_keys_changed and picked up by the next run. Web
+processes cache each key for BEST_OFFER_TTL seconds, which bounds how long
+they may show an offer the job has already replaced.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from pymongo import DeleteOne, ReplaceOne
+
+from .cache import cache
+from .checkpoints import add_to_state
+from .models import RETAILER_MODELS, BestOffer
+
+logger = logging.getLogger(__name__)
+
+# Job checkpoint of update_best_offers
+CHECKPOINT = 'best_offers'
+
+# Checkpoint state list of keys queued by mark_keys_changed
+PENDING_KEYS = 'pending_keys'
+
+# Keys recomputed per batch of retailer queries
+KEY_BATCH_SIZE = 500
+
+# Marker cached for keys without a best offer
+_NO_OFFER = '__none__'
+
+
+def normalize_gtin(gtin):
+    """GTIN without surrounding spaces and leading zeros (None if empty)"""
+    if gtin is None:
+        return None
+    # JSON bodies and some feeds carry GTINs as numbers
+    return str(gtin).strip().lstrip('0') or None
+
+
+def gtin_variants(gtin):
+    """Spellings of a normalized GTIN as retailers store it (zero-padded)"""
+    return sorted({gtin} | {gtin.zfill(length) for length in (8, 12, 13, 14) if len(gtin) < length})
+
+
+def offer_keys(doc):
+    """BestOffer keys a product document contributes to"""
+    keys = []
+    gtin = normalize_gtin(doc.get('gtin'))
+    if gtin:
+        keys.append(f'gtin:{gtin}')
+    if doc.get('product_group'):
+        keys.append(f"group:{doc['product_group']}")
+    return keys
+
+
+def mark_keys_changed(keys):
+    """Queue keys for the next update_best_offers run"""
+    add_to_state(CHECKPOINT, PENDING_KEYS, keys)
+
+
+def _load_offers(keys):
+    """{key: [offers]} for a batch of keys, one query per retailer in parallel"""
+    gtins = [key[5:] for key in keys if key.startswith('gtin:')]
+    groups = [key[6:] for key in keys if key.startswith('group:')]
+    conditions = []
+    if gtins:
+        conditions.append({'gtin': {'$in': [v for gtin in gtins for v in gtin_variants(gtin)]}})
+    if groups:
+        conditions.append({'product_group': {'$in': groups}})
+    wanted = set(keys)
+
+    def load(item):
+        retailer_name, model = item
+        docs = model._get_collection().find(
+            {'$or': conditions}, {'gtin': 1, 'product_group': 1, 'price': 1}
+        )
+        return retailer_name, list(docs)
+
+    offers = {key: [] for key in keys}
+    with ThreadPoolExecutor(max_workers=len(RETAILER_MODELS)) as executor:
+        for retailer_name, docs in executor.map(load, RETAILER_MODELS.items()):
+            for doc in docs:
+                if doc.get('price') is None:
+                    continue
+                offer = {'retailer': retailer_name, 'id': str(doc['_id']), 'price': doc['price']}
+                for key in offer_keys(doc):
+                    if key in wanted:
+                        offers[key].append(offer)
+    return offers
+
+
+def build_best_offer(key, offers, now):
+    """BestOffer document (as a dict) for a key's offers, None without offers"""
+    if not offers:
+        return None
+    offers = sorted(offers, key=lambda o: (o['price'], o['retailer'], o['id']))
+    best, dearest = offers[0], offers[-1]
+    return {
+        '_id': key,
+        'offers': offers,
+        'best_retailer': best['retailer'],
+        'best_product_id': best['id'],
+        'best_price': best['price'],
+        'max_price': dearest['price'],
+        'spread': round(dearest['price'] - best['price'], 2),
+        'offer_count': len(offers),
+        'updated_at': now,
+    }
+
+
+def recompute_best_offers(keys):
+    """Recompute and store the best offers of some keys: (written, deleted)"""
+    collection = BestOffer._get_collection()
+    keys = sorted(set(keys))
+    written = deleted = 0
+    for i in range(0, len(keys), KEY_BATCH_SIZE):
+        batch = keys[i:i + KEY_BATCH_SIZE]
+        now = datetime.utcnow()
+        operations = []
+        for key, offers in _load_offers(batch).items():
+            doc = build_best_offer(key, offers, now)
+            if doc is None:
+                operations.append(DeleteOne({'_id': key}))
+                deleted += 1
+            else:
+                operations.append(ReplaceOne({'_id': key}, doc, upsert=True))
+                written += 1
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        cache.delete_many([f'best_offer_{key}' for key in batch])
+    return written, deleted
+
+
+def changed_keys(model, since, until=None):
+    """(keys, newest scraped_at) of the products of a retailer scraped after `since`"""
+    query = {}
+    if since is not None:
+        query['scraped_at'] = {'$gt': since}
+    if until is not None:
+        query.setdefault('scraped_at', {})['$lte'] = until
+    keys, newest = set(), since
+    cursor = model._get_collection().find(query, {'gtin': 1, 'product_group': 1, 'scraped_at': 1})
+    for doc in cursor.batch_size(5000):
+        keys.update(offer_keys(doc))
+        scraped_at = doc.get('scraped_at')
+        if scraped_at is not None and (newest is None or scraped_at > newest):
+            newest = scraped_at
+    return keys, newest
+
+
+def _serialize(doc):
+    return {
+        'best_retailer': doc['best_retailer'],
+        'best_product_id': doc['best_product_id'],
+        'best_price': doc['best_price'],
+        'max_price': doc['max_price'],
+        'spread': doc['spread'],
+        'offer_count': doc['offer_count'],
+        'offers': doc['offers'],
+        'updated_at': doc['updated_at'].isoformat() if doc.get('updated_at') else None,
+    }
+
+
+def get_best_offers(keys):
+    """{key: best offer} for a batch of keys (keys without offers are left out).
+
+    Cached per key in the per-product cache alias (up to BEST_OFFERS_MAX_KEYS
+    entries per request); the misses are read with a single `_id $in` query.
+    """
+    keys = list(dict.fromkeys(keys))
+    cached = cache.get_many([f'best_offer_{key}' for key in keys])
+    found = {}
+    missing = []
+    for key in keys:
+        value = cached.get(f'best_offer_{key}')
+        if value is None:
+            missing.append(key)
+        elif value != _NO_OFFER:
+            found[key] = value
+
+    if missing:
+        started = time.monotonic()
+        docs = {doc['_id']: doc for doc in BestOffer._get_collection().find({'_id': {'$in': missing}})}
+        cost = (time.monotonic() - started) / len(missing)
+        ttl = getattr(settings, 'BEST_OFFER_TTL', 300)
+        for key in missing:
+            doc = docs.get(key)
+            value = _serialize(doc) if doc is not None else _NO_OFFER
+            cache.set(f'best_offer_{key}', value, ttl, cost=cost)
+            if doc is not None:
+                found[key] = value
+    return found
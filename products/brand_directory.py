@@ -0,0 +1,116 @@
+"""
+Brand directory for the /marken page and the BrandSearch typeahead.
+
+Built once per facet refresh from the brand facet table: sorted parallel
+arrays of normalized names, display names and product counts. Matching is
+case- and umlaut-insensitive because names are normalized at build time
+(normalize_name), so a query only has to be normalized once.
+
+- prefix queries: two bisects on the sorted normalized names,
+- substring queries: a small n-gram index (bigrams and trigrams) narrows the
+  candidates, which are then verified with `in`.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left
+
+from .facets import facet_store, get_facet_table, normalize_name
+from .models import RETAILER_MODELS
+
+NGRAM_SIZES = (2, 3)
+
+
+def _ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class BrandDirectory:
+    """Sorted brand arrays with bisect prefix lookup and an n-gram index"""
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda r: (r['normalized'], r['name']))
+        self.rows = rows
+        self.normalized = [row['normalized'] for row in rows]
+        self.display = [row['name'] for row in rows]
+        self.counts = array('I', (row['count'] for row in rows))
+
+        index = {}
+        for position, name in enumerate(self.normalized):
+            for n in NGRAM_SIZES:
+                for gram in _ngrams(name, n):
+                    index.setdefault(gram, array('I')).append(position)
+        self._ngrams = index
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _prefix_range(self, needle):
+        lo = bisect_left(self.normalized, needle)
+        hi = bisect_left(self.normalized, needle + '\uffff', lo)
+        return lo, hi
+
+    def prefix(self, query):
+        """Positions of brands whose normalized name starts with the query"""
+        needle = normalize_name(query)
+        lo, hi = self._prefix_range(needle)
+        return list(range(lo, hi))
+
+    def substring(self, query):
+        """Positions of brands whose normalized name contains the query"""
+        needle = normalize_name(query)
+        if not needle:
+            return list(range(len(self.rows)))
+
+        n = max((size for size in NGRAM_SIZES if size <= len(needle)), default=None)
+        if n is None:
+            # Single character: nothing to look up, scan the names
+            return [i for i, name in enumerate(self.normalized) if needle in name]
+
+        postings = []
+        for gram in _ngrams(needle, n):
+            positions = self._ngrams.get(gram)
+            if positions is None:
+                return []
+            postings.append(positions)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            candidates.intersection_update(positions)
+            if not candidates:
+                return []
+        return sorted(i for i in candidates if needle in self.normalized[i])
+
+    def search(self, query, prefix_only=False):
+        """Matching facet rows: prefix matches first, then other substring matches"""
+        if not normalize_name(query):
+            return sorted(self.rows, key=lambda r: r['name'])
+
+        prefix_positions = self.prefix(query)
+        results = [self.rows[i] for i in prefix_positions]
+        if not prefix_only:
+            seen = set(prefix_positions)
+            results += [self.rows[i] for i in self.substring(query) if i not in seen]
+        return results
+
+
+_directories = {}
+_directories_built_at = None
+_lock = threading.Lock()
+
+
+def get_brand_directory(retailer='all'):
+    """BrandDirectory for a retailer, rebuilt when the facet tables refresh"""
+    global _directories_built_at
+
+    if retailer not in RETAILER_MODELS:
+        retailer = 'all'
+    table = get_facet_table('brand', retailer)
+    with _lock:
+        if _directories_built_at != facet_store.built_at:
+            _directories.clear()
+            _directories_built_at = facet_store.built_at
+        directory = _directories.get(retailer)
+        if directory is None:
+            directory = _directories[retailer] = BrandDirectory(table.rows)
+    return directory
@@ -0,0 +1,338 @@
+"""
+Response caching helpers.
+
+API responses are cached as the final encoded JSON bytes (plus an optional
+gzip-compressed copy) so that a cache hit is a single cache read and a socket
+write: no serializer, no renderer, no content negotiation.
+
+All cache access in the API goes through `cache`, an InstrumentedCache around
+Django's default cache that counts hits, misses, sets, evictions, payload
+bytes and time saved per key family (see cache_stats in health.py).
+
+Per-product entries (PRODUCT_CACHE_PREFIXES) are routed to the 'products'
+cache alias when it is configured: there is one per product ID crawled, and
+in the default cache they would cull the few shared list, homepage and
+category entries.
+"""
+
+import gzip
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches, cache as django_cache
+from django.utils.connection import ConnectionProxy
+from django.http import HttpResponse
+
+from .renderers import dumps
+
+# Key prefix -> family name used in the statistics
+KEY_FAMILIES = [
+    ('products_list_', 'list'),
+    ('products_facets_', 'facets'),
+    ('products_histogram_', 'histogram'),
+    ('deals_', 'deals'),
+    ('price_drops_', 'drops'),
+    ('product_detail_', 'detail'),
+    ('product_missing_', 'missing'),
+    ('best_offer_', 'offers'),
+    ('categories_', 'categories'),
+    ('brands_', 'brands'),
+    ('blog_', 'blog'),
+]
+
+# Key prefixes stored in the 'products' cache alias (if configured)
+PRODUCT_CACHE_PREFIXES = ('product_detail_', 'product_missing_', 'best_offer_')
+
+_SENTINEL = object()
+
+
+def key_family(key):
+    """Return the statistics family of a cache key"""
+    for prefix, family in KEY_FAMILIES:
+        if key.startswith(prefix):
+            return family
+    return 'other'
+
+
+def _payload_size(value):
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, tuple) and all(isinstance(v, (bytes, type(None))) for v in value):
+        return sum(len(v) for v in value if v is not None)
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+class InstrumentedCache:
+    """Wrap a Django cache and keep per-family usage statistics.
+
+    Backends like LocMemCache silently cull entries when MAX_ENTRIES is
+    reached. To see those evictions we remember the expiry of every key we
+    set (bounded by CACHE_STATS_MAX_TRACKED_KEYS): a key that is gone before
+    its expiry was evicted.
+
+    `cost` passed to set() is the time (seconds) it took to compute the
+    value; every later hit on that key adds it to the family's time_saved.
+
+    `routes` are (key prefix, backend) pairs for keys stored elsewhere than
+    in `backend`.
+    """
+
+    def __init__(self, backend, max_tracked_keys=None, routes=None):
+        self._backend = backend
+        self._routes = list(routes or [])
+        self._max_tracked_keys = max_tracked_keys
+        self._lock = threading.Lock()
+        self._stats = {}
+        # key -> (expires_at, cost, size)
+        self._tracked = OrderedDict()
+        self._started_at = time.time()
+
+    def _max_tracked(self):
+        if self._max_tracked_keys is None:
+            self._max_tracked_keys = getattr(settings, 'CACHE_STATS_MAX_TRACKED_KEYS', 10000)
+        return self._max_tracked_keys
+
+    def _backend_for(self, key):
+        for prefix, backend in self._routes:
+            if key.startswith(prefix):
+                return backend
+        return self._backend
+
+    def _group_by_backend(self, keys):
+        groups = {}
+        for key in keys:
+            backend = self._backend_for(key)
+            groups.setdefault(id(backend), (backend, []))[1].append(key)
+        return groups.values()
+
+    def _family_stats(self, family):
+        stats = self._stats.get(family)
+        if stats is None:
+            stats = self._stats[family] = {
+                'hits': 0,
+                'misses': 0,
+                'sets': 0,
+                'evictions': 0,
+                'bytes_written': 0,
+                'bytes_served': 0,
+                'time_saved': 0.0,
+            }
+        return stats
+
+    def _record_hit(self, key):
+        with self._lock:
+            stats = self._family_stats(key_family(key))
+            stats['hits'] += 1
+            tracked = self._tracked.get(key)
+            if tracked is not None:
+                stats['bytes_served'] += tracked[2]
+                stats['time_saved'] += tracked[1]
+
+    def _record_miss(self, key):
+        with self._lock:
+            stats = self._family_stats(key_family(key))
+            stats['misses'] += 1
+            tracked = self._tracked.pop(key, None)
+            if tracked is not None and tracked[0] > time.time():
+                stats['evictions'] += 1
+
+    def _record_set(self, key, value, timeout, cost):
+        size = _payload_size(value)
+        if timeout is None:
+            timeout = getattr(self._backend_for(key), 'default_timeout', 300)
+        expires_at = time.time() + timeout if timeout else float('inf')
+        with self._lock:
+            stats = self._family_stats(key_family(key))
+            stats['sets'] += 1
+            stats['bytes_written'] += size
+            self._tracked.pop(key, None)
+            self._tracked[key] = (expires_at, cost or 0.0, size)
+            while len(self._tracked) > self._max_tracked():
+                self._tracked.popitem(last=False)
+
+    def get(self, key, default=None):
+        value = self._backend_for(key).get(key, _SENTINEL)
+        if value is _SENTINEL:
+            self._record_miss(key)
+            return default
+        self._record_hit(key)
+        return value
+
+    def get_many(self, keys):
+        found = {}
+        for backend, backend_keys in self._group_by_backend(keys):
+            found.update(backend.get_many(backend_keys))
+        for key in keys:
+            if key in found:
+                self._record_hit(key)
+            else:
+                self._record_miss(key)
+        return found
+
+    def set(self, key, value, timeout=None, cost=None):
+        self._backend_for(key).set(key, value, timeout)
+        self._record_set(key, value, timeout, cost)
+
+    def add(self, key, value, timeout=None, cost=None):
+        added = self._backend_for(key).add(key, value, timeout)
+        if added:
+            self._record_set(key, value, timeout, cost)
+        return added
+
+    def delete(self, key):
+        with self._lock:
+            self._tracked.pop(key, None)
+        return self._backend_for(key).delete(key)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._tracked.pop(key, None)
+        for backend, backend_keys in self._group_by_backend(keys):
+            backend.delete_many(backend_keys)
+
+    def clear(self):
+        with self._lock:
+            self._tracked.clear()
+        backends = {id(backend): backend for backend in [self._backend] + [b for _, b in self._routes]}
+        for backend in backends.values():
+            backend.clear()
+
+    def _sweep(self):
+        """Count tracked keys that vanished from the backend before expiring"""
+        now = time.time()
+        with self._lock:
+            keys = list(self._tracked.items())
+        for key, (expires_at, _, _) in keys:
+            if expires_at <= now:
+                with self._lock:
+                    self._tracked.pop(key, None)
+            elif not self._backend_for(key).has_key(key):
+                with self._lock:
+                    if self._tracked.pop(key, None) is not None:
+                        self._family_stats(key_family(key))['evictions'] += 1
+
+    def stats(self):
+        """Per-family counters plus totals"""
+        self._sweep()
+        with self._lock:
+            families = {family: dict(stats) for family, stats in self._stats.items()}
+            tracked_per_family = {}
+            for key, (_, _, size) in self._tracked.items():
+                entry = tracked_per_family.setdefault(key_family(key), {'keys': 0, 'bytes': 0})
+                entry['keys'] += 1
+                entry['bytes'] += size
+
+        for family, stats in families.items():
+            stats['live_keys'] = tracked_per_family.get(family, {}).get('keys', 0)
+            stats['live_bytes'] = tracked_per_family.get(family, {}).get('bytes', 0)
+
+        totals = {}
+        for stats in families.values():
+            for name, value in stats.items():
+                totals[name] = totals.get(name, 0) + value
+
+        for stats in list(families.values()) + [totals]:
+            lookups = stats.get('hits', 0) + stats.get('misses', 0)
+            stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+            stats['time_saved'] = round(stats.get('time_saved', 0.0), 3)
+
+        return {
+            'since': self._started_at,
+            'families': families,
+            'totals': totals,
+        }
+
+    def sample_keys(self, family=None, limit=20):
+        """Return up to `limit` live keys (newest first) with size, cost and TTL"""
+        now = time.time()
+        with self._lock:
+            items = list(reversed(self._tracked.items()))
+        samples = []
+        for key, (expires_at, cost, size) in items:
+            if family and key_family(key) != family:
+                continue
+            if expires_at <= now or not self._backend_for(key).has_key(key):
+                continue
+            samples.append({
+                'key': key,
+                'family': key_family(key),
+                'bytes': size,
+                'cost': round(cost, 4),
+                'ttl': None if expires_at == float('inf') else round(expires_at - now),
+            })
+            if len(samples) >= limit:
+                break
+        return samples
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+            self._started_at = time.time()
+
+
+def _alias_backend(alias):
+    """Cache `alias` if it is configured, else the default cache"""
+    if alias in settings.CACHES:
+        return ConnectionProxy(caches, alias)
+    return django_cache
+
+
+cache = InstrumentedCache(
+    django_cache,
+    routes=[(prefix, _alias_backend('products')) for prefix in PRODUCT_CACHE_PREFIXES],
+)
+
+
+def encode_payload(data):
+    """Encode data once and return the cache entry (body, gzipped body or None)
+
+    The gzip copy is only kept when the body is big enough for compression to
+    pay off (CACHE_GZIP_MIN_BYTES).
+    """
+    body = dumps(data)
+    gzipped = None
+    if len(body) >= getattr(settings, 'CACHE_GZIP_MIN_BYTES', 1024):
+        gzipped = gzip.compress(body, compresslevel=getattr(settings, 'CACHE_GZIP_LEVEL', 6))
+    return body, gzipped
+
+
+def _accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def payload_response(request, entry, status=200):
+    """Build an HttpResponse straight from a cache entry"""
+    body, gzipped = entry
+    if gzipped is not None and _accepts_gzip(request):
+        response = HttpResponse(gzipped, content_type='application/json', status=status)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body, content_type='application/json', status=status)
+    if gzipped is not None:
+        response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def get_cached_response(request, key):
+    """Return a ready HttpResponse for a cached payload, or None on a miss"""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    return payload_response(request, entry)
+
+
+def cache_response(request, key, data, timeout, cost=None):
+    """Encode data, store the bytes under key and return the matching response
+
+    `cost` is how long computing `data` took, for the time_saved statistics.
+    """
+    entry = encode_payload(data)
+    cache.set(key, entry, timeout, cost=cost)
+    return payload_response(request, entry)
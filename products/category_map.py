@@ -0,0 +1,201 @@
+"""
+Cross-retailer category normalization.
+
+Saturn, MediaMarkt, Otto and Kaufland spell the same category differently
+('TV & Audio', 'Audio und TV', ...). The category map groups those spellings
+under one canonical name with per-retailer aliases:
+
+    {
+        "generated_at": "2026-01-01T03:00:00",
+        "categories": {
+            "Kühlschränke": {
+                "saturn": ["Kühlschränke"],
+                "otto": ["Kuehlschraenke", "Kühlschrank"]
+            }
+        }
+    }
+
+It is built offline by `python manage.py build_category_map` (from the
+distinct categories of every retailer plus an optional overrides file) and
+written to CATEGORY_MAP_PATH. The web processes load it into memory and pick
+up a rebuilt file within CATEGORY_MAP_CHECK_INTERVAL seconds. Without a map
+file every category is its own canonical name, i.e. exact matching as before.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from .text import normalize_name
+
+logger = logging.getLogger(__name__)
+
+_KEY_STOPWORDS = {'und', 'and', 'sowie'}
+
+
+def category_key(name):
+    """Grouping key of a category spelling.
+
+    Normalized (case, umlauts, accents), punctuation and connecting words
+    ('&', 'und', '/') dropped and the words sorted, so 'TV & Audio',
+    'Audio und TV' and 'tv/audio' share a key.
+    """
+    words = re.split(r'[^a-z0-9]+', normalize_name(name))
+    return ' '.join(sorted(w for w in words if w and w not in _KEY_STOPWORDS))
+
+
+class CategoryMap:
+    """In-memory canonical category table with per-retailer aliases"""
+
+    def __init__(self, categories=None, generated_at=None):
+        self.categories = categories or {}
+        self.generated_at = generated_at
+        # Part of the cache keys of responses grouped or filtered by category
+        self.version = hashlib.md5(
+            json.dumps(self.categories, sort_keys=True).encode()
+        ).hexdigest()[:12]
+        self._canonical = {}
+        self._by_alias = {}
+        self._by_normalized = {}
+        for canonical, retailers in self.categories.items():
+            self._by_normalized[normalize_name(canonical)] = canonical
+            for retailer_name, aliases in retailers.items():
+                for alias in aliases:
+                    self._canonical[(retailer_name, alias)] = canonical
+                    self._by_alias.setdefault(alias, canonical)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('categories', {}), data.get('generated_at'))
+
+    def __len__(self):
+        return len(self.categories)
+
+    def resolve(self, category):
+        """Canonical name of a canonical name or alias, None if unmapped"""
+        if category in self.categories:
+            return category
+        if category in self._by_alias:
+            return self._by_alias[category]
+        return self._by_normalized.get(normalize_name(category))
+
+    def canonical_name(self, category, retailer_name=None):
+        """Canonical name of a category as stored by a retailer"""
+        canonical = self._canonical.get((retailer_name, category))
+        if canonical is None:
+            canonical = self.resolve(category)
+        return canonical or category
+
+    def aliases(self, category, retailer_name=None):
+        """Category values to match in a retailer ('$in' list, sorted).
+
+        The canonical name itself is always included, so a retailer that
+        starts using it before the next map build is still found.
+        """
+        canonical = self.resolve(category)
+        if canonical is None:
+            return [category]
+        retailers = self.categories[canonical]
+        if retailer_name is None:
+            aliases = {alias for names in retailers.values() for alias in names}
+        else:
+            aliases = set(retailers.get(retailer_name, ()))
+        aliases.add(canonical)
+        return sorted(aliases)
+
+
+def build_category_map(counts, overrides=None):
+    """Group the categories of all retailers into canonical categories.
+
+    `counts` is {retailer: {category: product_count}}; `overrides` maps a
+    category spelling (any retailer) to the canonical name it must belong to.
+    Spellings with the same category_key() are grouped; the canonical name is
+    the override target, or else the spelling with the most products.
+    """
+    overrides = overrides or {}
+    groups = {}
+    for retailer_name, categories in counts.items():
+        for name, count in categories.items():
+            name = (name or '').strip()
+            if not name:
+                continue
+            target = overrides.get(name)
+            key = category_key(target or name)
+            group = groups.setdefault(key, {'target': None, 'spellings': {}, 'retailers': {}})
+            if target:
+                group['target'] = target
+            group['spellings'][name] = group['spellings'].get(name, 0) + count
+            group['retailers'].setdefault(retailer_name, set()).add(name)
+
+    categories = {}
+    for group in groups.values():
+        canonical = group['target'] or max(
+            group['spellings'].items(), key=lambda item: (item[1], item[0])
+        )[0]
+        retailers = {name: sorted(aliases) for name, aliases in group['retailers'].items()}
+        if canonical in categories:
+            # Two keys overridden to the same canonical name
+            for retailer_name, aliases in retailers.items():
+                merged = set(categories[canonical].get(retailer_name, ())) | set(aliases)
+                categories[canonical][retailer_name] = sorted(merged)
+        else:
+            categories[canonical] = retailers
+    return dict(sorted(categories.items()))
+
+
+def write_category_map(categories, path):
+    """Write the map atomically (readers never see a partial file)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'categories': categories,
+    }
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+_map = CategoryMap()
+_map_mtime = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def get_category_map():
+    """The current CategoryMap, reloaded when the map file changes"""
+    global _map, _map_mtime, _checked_at
+
+    interval = getattr(settings, 'CATEGORY_MAP_CHECK_INTERVAL', 60)
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < interval:
+        return _map
+
+    with _lock:
+        if _checked_at is not None and now - _checked_at < interval:
+            return _map
+        path = str(getattr(settings, 'CATEGORY_MAP_PATH', ''))
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+            if _map_mtime is not None:
+                logger.warning(f"Category map {path} disappeared, keeping the loaded one")
+        if mtime is not None and mtime != _map_mtime:
+            try:
+                _map = CategoryMap.load(path)
+                _map_mtime = mtime
+                logger.info(f"Loaded category map: {len(_map)} canonical categories")
+            except Exception as e:
+                logger.error(f"Could not load category map {path}: {e}")
+        # Set last: other threads keep waiting on the lock until the map is loaded
+        _checked_at = now
+    return _map
@@ -0,0 +1,196 @@
+"""
+Precomputed category statistics.
+
+For every category: product count per retailer, min/median/max price, newest
+scraped_at and the share of products with an image. Built with one
+aggregation pass per retailer and kept in memory by a PeriodicRefresher.
+
+Refreshes are incremental: only categories containing products scraped since
+the last watermark are re-aggregated. Deletions inside an unchanged category
+are not visible that way, so every CATEGORY_STATS_FULL_REFRESH_EVERY-th
+refresh rebuilds everything.
+"""
+
+import heapq
+import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+
+from .category_map import get_category_map
+from .facets import FacetTable, normalize_name
+from .models import RETAILER_MODELS
+from .refresh import PeriodicRefresher
+
+logger = logging.getLogger(__name__)
+
+
+def _stats_pipeline(categories=None):
+    match = {'category': {'$nin': [None, '']}}
+    if categories is not None:
+        match = {'category': {'$in': list(categories)}}
+    return [
+        {'$match': match},
+        {'$project': {
+            'category': 1,
+            'price': 1,
+            'scraped_at': 1,
+            # null/missing sort before strings, so this is "non-empty image URL"
+            'has_image': {'$cond': [{'$gt': ['$image', '']}, 1, 0]},
+        }},
+        # Prices are pushed in order, so each category's list comes back sorted
+        {'$sort': {'category': 1, 'price': 1}},
+        {'$group': {
+            '_id': '$category',
+            'count': {'$sum': 1},
+            'prices': {'$push': '$price'},
+            'newest': {'$max': '$scraped_at'},
+            'with_image': {'$sum': '$has_image'},
+        }},
+    ]
+
+
+def _aggregate_categories(model, categories=None):
+    """{category: stats} for one retailer, optionally limited to some categories"""
+    rows = {}
+    for doc in model._get_collection().aggregate(_stats_pipeline(categories), allowDiskUse=True):
+        prices = array('d', (p for p in doc['prices'] if p is not None))
+        rows[doc['_id']] = {
+            'count': doc['count'],
+            'prices': prices,
+            'newest': doc.get('newest'),
+            'with_image': doc.get('with_image', 0),
+        }
+    return rows
+
+
+def _refresh_retailer(model, previous, full):
+    """Return the new {rows, watermark} state of one retailer"""
+    if previous is None or full:
+        rows = _aggregate_categories(model)
+    else:
+        watermark = previous['watermark']
+        changed_filter = {'scraped_at': {'$gt': watermark}} if watermark else {}
+        changed = [c for c in model._get_collection().distinct('category', changed_filter) if c]
+        rows = dict(previous['rows'])
+        if changed:
+            fresh = _aggregate_categories(model, changed)
+            for category in changed:
+                if category in fresh:
+                    rows[category] = fresh[category]
+                else:
+                    rows.pop(category, None)
+
+    newest = [row['newest'] for row in rows.values() if row['newest'] is not None]
+    return {'rows': rows, 'watermark': max(newest) if newest else None}
+
+
+def _median(sorted_lists, count):
+    """Median of the union of several sorted arrays, merging only up to the middle"""
+    if not count:
+        return None
+    merged = heapq.merge(*sorted_lists)
+    middle = list(islice(merged, count // 2 + 1))
+    if count % 2:
+        return middle[-1]
+    return (middle[-1] + middle[-2]) / 2
+
+
+def _merge_category(name, per_retailer):
+    count = sum(row['count'] for row in per_retailer.values())
+    price_lists = [row['prices'] for row in per_retailer.values() if row['prices']]
+    priced = sum(len(prices) for prices in price_lists)
+    newest = [row['newest'] for row in per_retailer.values() if row['newest'] is not None]
+    with_image = sum(row['with_image'] for row in per_retailer.values())
+    return {
+        'name': name,
+        'normalized': normalize_name(name),
+        'count': count,
+        'retailers': {retailer: row['count'] for retailer, row in per_retailer.items()},
+        'min_price': min(prices[0] for prices in price_lists) if price_lists else None,
+        'median_price': _median(price_lists, priced),
+        'max_price': max(prices[-1] for prices in price_lists) if price_lists else None,
+        'newest': max(newest) if newest else None,
+        'image_share': round(with_image / count, 4) if count else None,
+    }
+
+
+def build_category_stats(previous=None):
+    """Build (or incrementally refresh) the category statistics table"""
+    refreshes = previous['refreshes'] + 1 if previous else 0
+    full = refreshes % getattr(settings, 'CATEGORY_STATS_FULL_REFRESH_EVERY', 24) == 0
+
+    def refresh(item):
+        retailer_name, model = item
+        retailer_previous = previous['retailers'].get(retailer_name) if previous else None
+        try:
+            return retailer_name, _refresh_retailer(model, retailer_previous, full)
+        except Exception as e:
+            logger.warning(f"Could not refresh {retailer_name} category stats: {e}")
+            return retailer_name, retailer_previous or {'rows': {}, 'watermark': None}
+
+    with ThreadPoolExecutor(max_workers=len(RETAILER_MODELS)) as executor:
+        retailers = dict(executor.map(refresh, RETAILER_MODELS.items()))
+
+    stats = {'retailers': retailers, 'refreshes': refreshes}
+    stats.update(_canonical_table(retailers, get_category_map()))
+    return stats
+
+
+def _canonical_table(retailers, category_map):
+    """Stat rows per canonical category: each retailer's rows of all the
+    spellings of a category are combined, then merged across retailers"""
+    by_category = {}
+    for retailer_name, state in retailers.items():
+        for category, row in state['rows'].items():
+            canonical = category_map.canonical_name(category, retailer_name)
+            by_category.setdefault(canonical, {}).setdefault(retailer_name, []).append(row)
+
+    rows = [
+        _merge_category(name, {retailer_name: _combine_rows(retailer_rows)
+                               for retailer_name, retailer_rows in per_retailer.items()})
+        for name, per_retailer in by_category.items()
+    ]
+    return {
+        'table': FacetTable(rows),
+        'by_name': {row['name']: row for row in rows},
+        'map_version': category_map.version,
+    }
+
+
+category_stats_store = PeriodicRefresher(
+    'category-stats',
+    build_category_stats,
+    interval=getattr(settings, 'CATEGORY_STATS_REFRESH_INTERVAL', 600),
+)
+
+
+def get_category_stats():
+    """Return {'table': FacetTable of stat rows, 'by_name': {category: row}},
+    rows keyed by canonical category name"""
+    stats = category_stats_store.get()
+    category_map = get_category_map()
+    if stats.get('map_version') != category_map.version:
+        # The map was rebuilt since the last refresh: regroup the rows now
+        stats.update(_canonical_table(stats['retailers'], category_map))
+    return stats
+
+
+def _combine_rows(rows):
+    """One retailer row out of the rows of several spellings of a category"""
+    if len(rows) == 1:
+        return rows[0]
+    newest = [row['newest'] for row in rows if row['newest'] is not None]
+    return {
+        'count': sum(row['count'] for row in rows),
+        'prices': array('d', heapq.merge(*(row['prices'] for row in rows))),
+        'newest': max(newest) if newest else None,
+        'with_image': sum(row['with_image'] for row in rows),
+    }
+
+
+def get_category_stats_row(stats, category):
+    """Stat row of a category given by its canonical name or any spelling"""
+    return stats['by_name'].get(get_category_map().canonical_name(category))
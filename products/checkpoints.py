@@ -0,0 +1,54 @@
+"""
+Checkpoints of incremental batch jobs.
+
+Jobs that walk the retailer collections by scraped_at (best offers, price
+drops...) store how far they got per retailer in the JobCheckpoint
+collection of the derived database. A job saves its watermarks only after
+the work up to them is written, so a crashed run resumes from the last
+checkpoint and redoes at most one batch (the jobs are idempotent).
+"""
+
+from datetime import datetime
+
+from .models import JobCheckpoint
+
+
+def load_checkpoint(name):
+    """Return (watermarks, state) of a job: ({retailer: datetime}, {...})"""
+    checkpoint = JobCheckpoint.objects(name=name).first()
+    if checkpoint is None:
+        return {}, {}
+    return dict(checkpoint.watermarks or {}), dict(checkpoint.state or {})
+
+
+def save_checkpoint(name, watermarks, state=None):
+    """Store the watermarks (and optional job state) of a job"""
+    update = {
+        'set__watermarks': watermarks,
+        'set__updated_at': datetime.utcnow(),
+    }
+    if state is not None:
+        update['set__state'] = state
+    JobCheckpoint.objects(name=name).update_one(upsert=True, **update)
+
+
+def add_to_state(name, field, values):
+    """Add values to a list in the state of a job (atomic, no duplicates)"""
+    values = sorted(set(values))
+    if values:
+        JobCheckpoint._get_collection().update_one(
+            {'_id': name}, {'$addToSet': {f'state.{field}': {'$each': values}}}, upsert=True
+        )
+
+
+def pull_from_state(name, field, values):
+    """Remove values from a list in the state of a job (atomic)"""
+    values = list(values)
+    if values:
+        JobCheckpoint._get_collection().update_one(
+            {'_id': name}, {'$pull': {f'state.{field}': {'$in': values}}}
+        )
+
+
+def reset_checkpoint(name):
+    JobCheckpoint.objects(name=name).delete()
@@ -0,0 +1,102 @@
+"""
+Deals: products with the highest discount percentage.
+
+`discount` is free text written by the scrapers ('-20%', '20 %', '-50 €',
+'Sparen 15%'...), so it can't be sorted on. discount_pct is a numeric
+percentage derived from old_price/price, with the discount string as a
+fallback, stored on the product documents by the backfill_discounts command
+and indexed with the category, so the top deals of a category are an
+indexed, sorted, limited query per retailer. The per-retailer results are
+merged with a bounded heap and cached per category.
+"""
+
+import hashlib
+import heapq
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .cache import cache
+from .category_map import get_category_map
+from .models import RETAILER_MODELS
+from .queries import category_filter_kwargs
+from .serializers import BaseProductSerializer
+
+logger = logging.getLogger(__name__)
+
+# Discounts above this are scraping errors rather than deals
+MAX_DISCOUNT_PCT = 95
+
+_NUMBER_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+
+
+def discount_pct(price, old_price=None, discount=None):
+    """Discount percentage (one decimal) of a product, None if there is none.
+
+    old_price/price is used when both are set; otherwise the discount text:
+    a percentage ('-20%') is taken as is, an amount ('-50 €') is related to
+    the price before the discount.
+    """
+    pct = None
+    if price and old_price and old_price > price > 0:
+        pct = (old_price - price) / old_price * 100
+    elif discount:
+        match = _NUMBER_RE.search(discount)
+        if match:
+            value = float(match.group(1).replace(',', '.'))
+            if '%' in discount:
+                pct = value
+            elif price and price > 0:
+                pct = value / (price + value) * 100
+    if pct is None or pct <= 0 or pct > MAX_DISCOUNT_PCT:
+        return None
+    return round(pct, 1)
+
+
+def _top_deals(retailer_name, model, category, limit):
+    try:
+        query = model.objects(discount_pct__gt=0)
+        if category:
+            query = query.filter(**category_filter_kwargs(category, retailer_name))
+        results = []
+        for product in query.order_by('-discount_pct').limit(limit):
+            data = dict(BaseProductSerializer(product).data)
+            data['retailer'] = retailer_name
+            results.append(data)
+        return results
+    except Exception as e:
+        logger.warning(f"Could not load {retailer_name} deals: {e}")
+        return []
+
+
+def get_deals(category='', retailer='all', limit=24):
+    """Top `limit` deals across retailers, cached per category"""
+    cache_params = f"{category}:{retailer}:{limit}:{get_category_map().version}"
+    cache_key = f"deals_{hashlib.md5(cache_params.encode()).hexdigest()}"
+    deals = cache.get(cache_key)
+    if deals is not None:
+        return deals
+
+    started = time.monotonic()
+    selected = [
+        (retailer_name, model) for retailer_name, model in RETAILER_MODELS.items()
+        if retailer in ('all', retailer_name)
+    ]
+    with ThreadPoolExecutor(max_workers=max(len(selected), 1)) as executor:
+        per_retailer = list(executor.map(
+            lambda item: _top_deals(item[0], item[1], category, limit), selected
+        ))
+
+    deals = heapq.nlargest(
+        limit,
+        (data for results in per_retailer for data in results),
+        key=lambda data: data['discount_pct'] or 0,
+    )
+    cache.set(
+        cache_key, deals, getattr(settings, 'CACHE_DEALS_DURATION', 900),
+        cost=time.monotonic() - started,
+    )
+    return deals
@@ -0,0 +1,301 @@
+"""
+Precomputed category and brand facet tables.
+
+One aggregation per retailer groups the whole collection by category and by
+brand ($facet, single collection scan) and yields, per value: product count,
+min/max price and the newest scraped_at. The per-retailer tables are merged
+into a total table and kept in memory by a PeriodicRefresher, so the
+`categories` and `brands` endpoints never touch MongoDB.
+
+Categories are listed under their canonical name (see category_map.py): the
+aliases of a category are merged into one row per retailer.
+
+Search facets (brand, category, retailer and price-range counts for the
+active list filters, ?facets=1) are computed on demand with the same $facet
+approach per retailer and cached separately from the result pages.
+"""
+
+import hashlib
+import logging
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .cache import cache
+from .category_map import get_category_map
+from .models import RETAILER_MODELS
+from .queries import build_retailer_queries, raw_filter
+from .refresh import PeriodicRefresher
+from .text import normalize_name
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ('category', 'brand')
+
+# Price range buckets of the search facets; the last one is open-ended
+PRICE_RANGE_BOUNDARIES = [0, 50, 100, 250, 500, 1000, 2000]
+
+# Values kept per retailer before merging, and in the merged search facets
+SEARCH_FACET_RETAILER_LIMIT = 200
+SEARCH_FACET_LIMIT = 50
+
+class FacetTable:
+    """Sorted facet rows with a prebuilt substring index over normalized names.
+
+    All normalized names are joined into one newline-separated string, so a
+    substring search is a handful of C-level str.find() calls instead of a
+    Python loop over every row; bisect maps match offsets back to rows.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: r['name'])
+        self._offsets = []
+        parts = []
+        offset = 0
+        for row in self.rows:
+            self._offsets.append(offset)
+            parts.append(row['normalized'])
+            offset += len(row['normalized']) + 1
+        self._haystack = '\n'.join(parts)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, query):
+        """Return rows whose normalized name contains the normalized query"""
+        needle = normalize_name(query)
+        if not needle:
+            return self.rows
+
+        matches = []
+        pos = self._haystack.find(needle)
+        while pos != -1:
+            index = bisect_right(self._offsets, pos) - 1
+            matches.append(self.rows[index])
+            # Continue after this row, one hit per row is enough
+            if index + 1 >= len(self._offsets):
+                break
+            pos = self._haystack.find(needle, self._offsets[index + 1])
+        return matches
+
+
+def _facet_pipeline(field):
+    return [
+        {'$match': {field: {'$nin': [None, '']}}},
+        {'$group': {
+            '_id': f'${field}',
+            'count': {'$sum': 1},
+            'min_price': {'$min': '$price'},
+            'max_price': {'$max': '$price'},
+            'last_seen': {'$max': '$scraped_at'},
+        }},
+    ]
+
+
+def _aggregate_retailer(model):
+    """Run the facet aggregation for one retailer: {field: [rows]}"""
+    pipeline = [{'$facet': {field: _facet_pipeline(field) for field in FACET_FIELDS}}]
+    result = next(model._get_collection().aggregate(pipeline, allowDiskUse=True), {})
+
+    tables = {}
+    for field in FACET_FIELDS:
+        rows = {}
+        for doc in result.get(field, []):
+            name = str(doc['_id']).strip()
+            if not name:
+                continue
+            row = rows.get(name)
+            if row is None:
+                rows[name] = {
+                    'name': name,
+                    'normalized': normalize_name(name),
+                    'count': doc['count'],
+                    'min_price': doc.get('min_price'),
+                    'max_price': doc.get('max_price'),
+                    'last_seen': doc.get('last_seen'),
+                }
+            else:
+                # Same value with different surrounding whitespace
+                _merge_row(row, doc)
+        tables[field] = list(rows.values())
+    return tables
+
+
+def _merge_row(row, other):
+    row['count'] += other['count']
+    for key, pick in (('min_price', min), ('max_price', max), ('last_seen', max)):
+        values = [v for v in (row[key], other.get(key)) if v is not None]
+        row[key] = pick(values) if values else None
+
+
+def _canonical_categories(rows, retailer_name):
+    """Rename category rows to their canonical name, merging aliases"""
+    category_map = get_category_map()
+    merged = {}
+    for row in rows:
+        name = category_map.canonical_name(row['name'], retailer_name)
+        total = merged.get(name)
+        if total is None:
+            merged[name] = dict(row, name=name, normalized=normalize_name(name))
+        else:
+            _merge_row(total, row)
+    return list(merged.values())
+
+
+def _merge_tables(per_retailer, field):
+    totals = {}
+    for tables in per_retailer.values():
+        for row in tables[field].rows:
+            total = totals.get(row['name'])
+            if total is None:
+                totals[row['name']] = dict(row)
+            else:
+                _merge_row(total, row)
+    return FacetTable(totals.values())
+
+
+def build_facets(previous=None):
+    """Build {field: {'all'|retailer: FacetTable}} with one aggregation per retailer"""
+
+    def load(item):
+        retailer_name, model = item
+        try:
+            tables = _aggregate_retailer(model)
+            tables['category'] = _canonical_categories(tables['category'], retailer_name)
+            return retailer_name, {field: FacetTable(rows) for field, rows in tables.items()}
+        except Exception as e:
+            logger.warning(f"Could not build {retailer_name} facets: {e}")
+            # Keep the last good table for this retailer, if any
+            if previous is not None:
+                return retailer_name, {field: previous[field][retailer_name] for field in FACET_FIELDS}
+            return retailer_name, {field: FacetTable([]) for field in FACET_FIELDS}
+
+    with ThreadPoolExecutor(max_workers=len(RETAILER_MODELS)) as executor:
+        per_retailer = dict(executor.map(load, RETAILER_MODELS.items()))
+
+    facets = {}
+    for field in FACET_FIELDS:
+        facets[field] = {name: tables[field] for name, tables in per_retailer.items()}
+        facets[field]['all'] = _merge_tables(per_retailer, field)
+    return facets
+
+
+facet_store = PeriodicRefresher(
+    'facets',
+    build_facets,
+    interval=getattr(settings, 'FACET_REFRESH_INTERVAL', 900),
+)
+
+
+def get_facet_table(field, retailer='all'):
+    """Return the FacetTable for a field ('category' or 'brand') and retailer"""
+    facets = facet_store.get()[field]
+    return facets.get(retailer, facets['all'])
+
+
+def _search_facet_pipeline(match):
+    def top_values(field):
+        return [
+            {'$match': {field: {'$nin': [None, '']}}},
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1}},
+            {'$limit': SEARCH_FACET_RETAILER_LIMIT},
+        ]
+
+    return [
+        {'$match': match},
+        {'$facet': {
+            'brands': top_values('brand'),
+            'categories': top_values('category'),
+            'price_ranges': [
+                # Otherwise null/non-numeric prices land in the default ('more') bucket
+                {'$match': {'price': {'$type': 'number'}}},
+                {'$bucket': {
+                    'groupBy': '$price',
+                    'boundaries': PRICE_RANGE_BOUNDARIES,
+                    'default': 'more',
+                    'output': {'count': {'$sum': 1}},
+                }},
+            ],
+            'price': [{'$group': {
+                '_id': None,
+                'count': {'$sum': 1},
+                'min': {'$min': '$price'},
+                'max': {'$max': '$price'},
+            }}],
+        }},
+    ]
+
+
+def _merge_counts(per_retailer, key, rename=None):
+    counts = {}
+    for retailer_name, result in per_retailer.items():
+        for doc in result.get(key, []):
+            name = rename(doc['_id'], retailer_name) if rename else doc['_id']
+            counts[name] = counts.get(name, 0) + doc['count']
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [{'name': name, 'count': count} for name, count in ranked[:SEARCH_FACET_LIMIT]]
+
+
+def compute_search_facets(queries):
+    """Run the $facet aggregation for each retailer query in parallel and merge"""
+
+    def aggregate(item):
+        retailer_name, query = item
+        try:
+            pipeline = _search_facet_pipeline(raw_filter(query))
+            return retailer_name, next(query._collection.aggregate(pipeline, allowDiskUse=True), {})
+        except Exception as e:
+            logger.warning(f"Could not compute {retailer_name} search facets: {e}")
+            return retailer_name, {}
+
+    with ThreadPoolExecutor(max_workers=max(len(queries), 1)) as executor:
+        per_retailer = dict(executor.map(aggregate, queries.items()))
+
+    range_counts = {}
+    price_min, price_max = None, None
+    retailers = []
+    for retailer_name, result in per_retailer.items():
+        for doc in result.get('price_ranges', []):
+            range_counts[doc['_id']] = range_counts.get(doc['_id'], 0) + doc['count']
+        stats = (result.get('price') or [{}])[0]
+        retailers.append({'name': retailer_name, 'count': stats.get('count', 0)})
+        if stats.get('min') is not None:
+            price_min = stats['min'] if price_min is None else min(price_min, stats['min'])
+        if stats.get('max') is not None:
+            price_max = stats['max'] if price_max is None else max(price_max, stats['max'])
+
+    bounds = PRICE_RANGE_BOUNDARIES + [None]
+    price_ranges = [
+        {'min': bounds[i], 'max': bounds[i + 1], 'count': range_counts.get(bounds[i], 0)}
+        for i in range(len(PRICE_RANGE_BOUNDARIES) - 1)
+    ]
+    price_ranges.append({'min': bounds[-2], 'max': None, 'count': range_counts.get('more', 0)})
+
+    return {
+        'retailers': retailers,
+        'brands': _merge_counts(per_retailer, 'brands'),
+        'categories': _merge_counts(per_retailer, 'categories', get_category_map().canonical_name),
+        'price_ranges': price_ranges,
+        'price': {'min': price_min, 'max': price_max},
+    }
+
+
+def get_search_facets(retailer, category, brand, search, min_price=None, max_price=None):
+    """Facet counts for a list query, cached independently of page and sort"""
+    cache_params = f"{search}:{category}:{brand}:{retailer}:{min_price}:{max_price}:{get_category_map().version}"
+    cache_key = f"products_facets_{hashlib.md5(cache_params.encode()).hexdigest()}"
+    facets = cache.get(cache_key)
+    if facets is not None:
+        return facets
+
+    started = time.monotonic()
+    queries = build_retailer_queries(retailer, category, brand, search, min_price, max_price)
+    facets = compute_search_facets(queries)
+    cache.set(
+        cache_key, facets, getattr(settings, 'CACHE_FACETS_DURATION', 900),
+        cost=time.monotonic() - started,
+    )
+    return facets
@@ -0,0 +1,152 @@
+"""
+Google Merchant Center product feed (RSS 2.0 with the g: namespace).
+
+The feed is written while the products are read: one cursor per retailer
+with a projection of the feed fields, read in batches, each <item> escaped
+and rendered as a string, and the items joined into chunks of
+WRITE_BATCH_SIZE. Nothing but the current cursor batch and chunk is held in
+memory, whatever the number of products. `gzip_chunks` compresses the
+chunks on the fly for clients accepting gzip.
+
+The generate_merchant_feed command writes the feed to MERCHANT_FEED_PATH
+(gzipped, replaced atomically); google_merchant_feed serves that file while
+it is younger than MERCHANT_FEED_MAX_AGE and streams a live feed otherwise.
+"""
+
+import gzip
+import logging
+import os
+import re
+import zlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from .models import RETAILER_MODELS
+from .sitemap import write_if_changed
+
+logger = logging.getLogger(__name__)
+
+# Documents per cursor round trip
+CURSOR_BATCH_SIZE = 1000
+# Items rendered per chunk
+WRITE_BATCH_SIZE = 200
+
+FEED_PROJECTION = {
+    'title': 1, 'description': 1, 'image': 1, 'price': 1,
+    'brand': 1, 'gtin': 1, 'category': 1, 'url': 1,
+}
+
+RETAILER_LABELS = {
+    'saturn': 'Saturn',
+    'mediamarkt': 'MediaMarkt',
+    'otto': 'Otto',
+    'kaufland': 'Kaufland',
+}
+
+# Characters XML 1.0 does not allow (scraped text sometimes contains them)
+_INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _text(value, max_length=None):
+    text = _INVALID_XML_RE.sub('', str(value))
+    if max_length:
+        text = text[:max_length]
+    return escape(text)
+
+
+def render_item(doc, retailer_name, site_url):
+    """<item> of one product document"""
+    pk = str(doc['_id'])
+    title = doc.get('title')
+    description = doc.get('description') or title
+    parts = [
+        '<item>',
+        f'<g:id>{pk}</g:id>',
+        f'<title>{_text(title, 150) if title else "Produkt"}</title>',
+        f'<description>{_text(description, 5000) if description else "Keine Beschreibung"}</description>',
+        f'<link>{_text(f"{site_url}/product/{pk}")}</link>',
+    ]
+    if doc.get('image'):
+        parts.append(f'<g:image_link>{_text(doc["image"])}</g:image_link>')
+    if doc.get('price'):
+        parts.append(f'<g:price>{doc["price"]:.2f} EUR</g:price>')
+    parts.append('<g:availability>in stock</g:availability>')
+    parts.append('<g:condition>new</g:condition>')
+    if doc.get('brand'):
+        parts.append(f'<g:brand>{_text(doc["brand"], 70)}</g:brand>')
+    if doc.get('gtin'):
+        parts.append(f'<g:gtin>{_text(doc["gtin"])}</g:gtin>')
+    if doc.get('category'):
+        parts.append(f'<g:product_type>{_text(doc["category"])}</g:product_type>')
+    parts.append(f'<g:custom_label_0>{RETAILER_LABELS.get(retailer_name, retailer_name)}</g:custom_label_0>')
+    if doc.get('url'):
+        parts.append(f'<g:custom_label_1>{_text(doc["url"], 100)}</g:custom_label_1>')
+    parts.append('</item>\n')
+    return ''.join(parts)
+
+
+def feed_chunks(limit=None, strict=False):
+    """Text chunks of the whole feed; `limit` caps the products per retailer.
+
+    A failing retailer is left out of a streamed response (the headers are
+    already sent); with strict=True the error is raised instead.
+    """
+    site_url = getattr(settings, 'SITE_URL', 'https://preisradio.de')
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n'
+        '<channel>\n'
+        '<title>Preisradio - Vergleichen Sie Preise</title>\n'
+        f'<link>{escape(site_url)}</link>\n'
+        '<description>Finden Sie die besten Angebote von Saturn, MediaMarkt, Otto und Kaufland</description>\n'
+    )
+    for retailer_name, model in RETAILER_MODELS.items():
+        written = 0
+        try:
+            cursor = model._get_collection().find({}, FEED_PROJECTION).sort('scraped_at', -1)
+            if limit:
+                cursor = cursor.limit(limit)
+            batch = []
+            for doc in cursor.batch_size(CURSOR_BATCH_SIZE):
+                batch.append(render_item(doc, retailer_name, site_url))
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    yield ''.join(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                yield ''.join(batch)
+                written += len(batch)
+        except Exception as e:
+            if strict:
+                raise
+            logger.error(f"Merchant feed: {retailer_name} failed after {written} items: {e}")
+    yield '</channel>\n</rss>\n'
+
+
+def gzip_chunks(chunks, level=6):
+    """gzip-compress text chunks on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def gunzip_file_chunks(path, chunk_size=64 * 1024):
+    """Decompressed chunks of a gzipped file; the file is closed when the
+    generator is exhausted or closed (client disconnects included)"""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+def write_feed(path, limit=None):
+    """Write the feed to `path` (gzipped if it ends with .gz): (sha256, written)"""
+    path = str(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return write_if_changed(path, feed_chunks(limit, strict=True))
@@ -3,16 +3,110 @@ Google Merchant Center API integration.
 
 This module provides a service for uploading products to Google Merchant Center
 using the Content API for Shopping.
+
+get_merchant_service() returns one service per process, created on first
+use: the client is built from the static Content API discovery document
+shipped with google-api-python-client (no discovery request, parsed once)
+and the service-account file is read once. The service is shared by all
+threads; each thread gets its own authorized HTTP connection and the access
+token is refreshed under a lock before it gets close to expiring.
 """
 
 import os
 import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional
+import httplib2
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp, Request
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 from django.conf import settings
 
+# Entries per products.custombatch call accepted by the Content API
+MAX_BATCH_ENTRIES = 1000
+
+# HTTP statuses and entry error reasons worth retrying
+RETRIABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRIABLE_REASONS = {'backendError', 'internalError', 'rateLimitExceeded', 'quotaExceeded', 'deadlineExceeded'}
+
+API_NAME = 'content'
+API_VERSION = 'v2.1'
+
+
+@lru_cache(maxsize=None)
+def discovery_document() -> Dict:
+    """Content API discovery document shipped with google-api-python-client"""
+    document = get_static_doc(API_NAME, API_VERSION)
+    if document is None:
+        raise RuntimeError(f'No static discovery document for {API_NAME} {API_VERSION}')
+    return json.loads(document)
+
+
+def format_product_for_google(product_data: Dict) -> Dict:
+    """
+    Format product data according to Google Merchant Center API schema.
+
+    Args:
+        product_data: Product data from your database
+
+    Returns:
+        Formatted product data for Google API
+    """
+    # Extract product info (fields may be present but None)
+    product_id = str(product_data.get('id', ''))
+    title = (product_data.get('title') or '')[:150]
+    description = (product_data.get('description') or title)[:5000]
+    price = product_data.get('price')
+    image_url = product_data.get('image')
+    brand = (product_data.get('brand') or '')[:70]
+    gtin = product_data.get('gtin') or ''
+    category = product_data.get('category') or ''
+
+    # Build Google Merchant product
+    google_product = {
+        'offerId': product_id,
+        'title': title,
+        'description': description,
+        'link': f'https://preisradio.de/product/{product_id}',
+        'contentLanguage': 'de',
+        'targetCountry': 'DE',
+        'channel': 'online',
+        'availability': 'in stock',
+        'condition': 'new',
+    }
+
+    # Add price if available
+    if price:
+        google_product['price'] = {
+            'value': str(price),
+            'currency': 'EUR'
+        }
+
+    # Add image if available
+    if image_url:
+        google_product['imageLink'] = image_url
+
+    # Add brand if available
+    if brand:
+        google_product['brand'] = brand
+
+    # Add GTIN if available
+    if gtin:
+        google_product['gtin'] = str(gtin)
+
+    # Add product type (category) if available
+    if category:
+        google_product['productTypes'] = [category]
+
+    return google_product
+
 
 class GoogleMerchantService:
     """
@@ -24,89 +118,71 @@ class GoogleMerchantService:
     # API scopes required for Content API for Shopping
     SCOPES = ['https://www.googleapis.com/auth/content']
 
-    def __init__(self, merchant_id: str, credentials_path: str):
+    # Seconds before the first retry of a failed batch (doubled per attempt)
+    RETRY_BACKOFF = 1.0
+
+    def __init__(self, merchant_id: str, credentials_path: Optional[str] = None, http=None):
         """
         Initialize the Google Merchant Center service.
 
         Args:
             merchant_id: Your Google Merchant Center account ID
             credentials_path: Path to the service account JSON key file
+            http: HTTP object used for every request instead of authorized
+                per-thread connections (e.g. googleapiclient.http.HttpMock)
         """
         self.merchant_id = merchant_id
         self.credentials_path = credentials_path
+        self.credentials = None
         self.service = None
+        self._http = http
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        started = time.monotonic()
         self._authenticate()
+        # Seconds spent reading the key file and building the client
+        self.setup_seconds = time.monotonic() - started
 
     def _authenticate(self):
         """Authenticate using service account credentials."""
+        if self._http is not None:
+            self.service = build_from_document(discovery_document(), http=self._http)
+            return
         try:
-            credentials = service_account.Credentials.from_service_account_file(
+            self.credentials = service_account.Credentials.from_service_account_file(
                 self.credentials_path,
                 scopes=self.SCOPES
             )
-            self.service = build('content', 'v2.1', credentials=credentials)
+            self.service = build_from_document(discovery_document(), credentials=self.credentials)
             print(f"✓ Authenticated with Google Merchant Center (Merchant ID: {self.merchant_id})")
         except Exception as e:
             print(f"✗ Failed to authenticate with Google Merchant Center: {e}")
             raise
 
-    def _format_product_for_google(self, product_data: Dict) -> Dict:
+    def ensure_fresh_credentials(self, margin: Optional[int] = None) -> bool:
         """
-        Format product data according to Google Merchant Center API schema.
+        Refresh the access token if it expires within `margin` seconds.
 
-        Args:
-            product_data: Product data from your database
+        Done once under a lock, so concurrent uploads don't each hit the
+        token endpoint (or a 401) when the token runs out mid-sync.
 
         Returns:
-            Formatted product data for Google API
+            True if the token was refreshed
         """
-        # Extract product info
-        product_id = str(product_data.get('id', ''))
-        title = product_data.get('title', '')[:150]
-        description = product_data.get('description', title)[:5000]
-        price = product_data.get('price')
-        image_url = product_data.get('image')
-        brand = product_data.get('brand', '')[:70]
-        gtin = product_data.get('gtin', '')
-        category = product_data.get('category', '')
-
-        # Build Google Merchant product
-        google_product = {
-            'offerId': product_id,
-            'title': title,
-            'description': description,
-            'link': f'https://preisradio.de/product/{product_id}',
-            'contentLanguage': 'de',
-            'targetCountry': 'DE',
-            'channel': 'online',
-            'availability': 'in stock',
-            'condition': 'new',
-        }
-
-        # Add price if available
-        if price:
-            google_product['price'] = {
-                'value': str(price),
-                'currency': 'EUR'
-            }
-
-        # Add image if available
-        if image_url:
-            google_product['imageLink'] = image_url
-
-        # Add brand if available
-        if brand:
-            google_product['brand'] = brand
-
-        # Add GTIN if available
-        if gtin:
-            google_product['gtin'] = str(gtin)
-
-        # Add product type (category) if available
-        if category:
-            google_product['productTypes'] = [category]
+        if self.credentials is None:
+            return False
+        if margin is None:
+            margin = getattr(settings, 'MERCHANT_TOKEN_REFRESH_MARGIN', 300)
+        with self._refresh_lock:
+            expiry = self.credentials.expiry
+            if self.credentials.token and expiry and expiry - datetime.utcnow() > timedelta(seconds=margin):
+                return False
+            self.credentials.refresh(Request(httplib2.Http()))
+            return True
 
-        return google_product
+    def _format_product_for_google(self, product_data: Dict) -> Dict:
+        """Format product data according to the Content API schema."""
+        return format_product_for_google(product_data)
 
     def insert_product(self, product_data: Dict) -> Optional[Dict]:
         """
@@ -126,7 +202,7 @@ class GoogleMerchantService:
                 body=google_product
             )
 
-            response = request.execute()
+            response = request.execute(http=self._thread_http())
             print(f"✓ Inserted product: {product_data.get('title', 'Unknown')[:50]}")
             return response
 
@@ -161,7 +237,7 @@ class GoogleMerchantService:
             product_id: Product ID to delete
 
         Returns:
-            True if successful, False otherwise
+            True if deleted or not in Merchant Center (404), False otherwise
         """
         try:
             request = self.service.products().delete(
@@ -169,11 +245,15 @@ class GoogleMerchantService:
                 productId=f'online:de:DE:{product_id}'
             )
 
-            request.execute()
+            request.execute(http=self._thread_http())
             print(f"✓ Deleted product: {product_id}")
             return True
 
         except HttpError as e:
+            if e.resp.status == 404:
+                # Already deleted, or its upload never succeeded
+                print(f"Product {product_id} not in Google Merchant Center, nothing to delete")
+                return True
             error_details = json.loads(e.content.decode('utf-8'))
             print(f"✗ Failed to delete product {product_id}: {error_details}")
             return False
@@ -181,48 +261,163 @@ class GoogleMerchantService:
             print(f"✗ Unexpected error deleting product: {e}")
             return False
 
-    def batch_insert_products(self, products_data: List[Dict], batch_size: int = 100) -> Dict:
+    def _thread_http(self):
+        """HTTP object of the current thread (httplib2 connections are not thread-safe)"""
+        if self._http is not None:
+            return self._http
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            timeout = getattr(settings, 'MERCHANT_UPLOAD_TIMEOUT', 60)
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=timeout))
+            self._local.http = http
+        return http
+
+    def _custombatch(self, entries: List[Dict]) -> List[Dict]:
+        """One products.custombatch call; returns the response entries"""
+        request = self.service.products().custombatch(body={'entries': entries})
+        response = request.execute(http=self._thread_http())
+        return response.get('entries', [])
+
+    def _upload_batch(self, products: List[Dict], retries: int) -> Dict:
         """
-        Insert multiple products in batches.
+        Insert one batch with custombatch, retrying what failed transiently.
 
-        Args:
-            products_data: List of product data from your database
-            batch_size: Number of products to insert per batch (max 1000)
+        The whole call is retried on retriable HTTP statuses and network
+        errors; after a successful call only the entries that failed with a
+        retriable reason are sent again. Waits RETRY_BACKOFF * 2**attempt
+        seconds (with jitter) between attempts.
 
         Returns:
-            Statistics about the batch operation
+            {'success', 'failed_products', 'errors' (reason -> count), 'retries'}
         """
-        total = len(products_data)
-        success_count = 0
-        failed_count = 0
-        failed_products = []
+        pending = {
+            batch_id: product for batch_id, product in enumerate(products)
+        }
+        result = {'success': 0, 'failed_products': [], 'errors': {}, 'retries': 0}
+        last_errors = {}
+
+        for attempt in range(retries + 1):
+            if attempt:
+                result['retries'] += 1
+                time.sleep(self.RETRY_BACKOFF * 2 ** (attempt - 1) * (1 + random.random() / 2))
+
+            entries = [
+                {
+                    'batchId': batch_id,
+                    'merchantId': self.merchant_id,
+                    'method': 'insert',
+                    'product': format_product_for_google(product),
+                }
+                for batch_id, product in pending.items()
+            ]
+            try:
+                response_entries = self._custombatch(entries)
+            except HttpError as e:
+                reason = f'http_{e.resp.status}'
+                last_errors = {batch_id: reason for batch_id in pending}
+                if e.resp.status in RETRIABLE_STATUSES:
+                    continue
+                break
+            except (OSError, httplib2.HttpLib2Error) as e:
+                last_errors = {batch_id: type(e).__name__ for batch_id in pending}
+                continue
+
+            retriable = {}
+            last_errors = {}
+            answered = set()
+            for entry in response_entries:
+                batch_id = entry.get('batchId')
+                if batch_id not in pending:
+                    continue
+                answered.add(batch_id)
+                errors = (entry.get('errors') or {}).get('errors') or []
+                if not errors:
+                    result['success'] += 1
+                    continue
+                reason = errors[0].get('reason') or 'unknown'
+                last_errors[batch_id] = reason
+                if reason in RETRIABLE_REASONS:
+                    retriable[batch_id] = pending[batch_id]
+            # Entries missing from the response are retried as well
+            for batch_id in pending.keys() - answered:
+                last_errors[batch_id] = 'missing'
+                retriable[batch_id] = pending[batch_id]
+
+            for batch_id in last_errors.keys() - retriable.keys():
+                reason = last_errors.pop(batch_id)
+                result['errors'][reason] = result['errors'].get(reason, 0) + 1
+                result['failed_products'].append(pending[batch_id].get('id'))
+            pending = retriable
+            if not pending:
+                break
+
+        # Still failing after the last attempt
+        for batch_id, product in pending.items():
+            reason = last_errors.get(batch_id, 'unknown')
+            result['errors'][reason] = result['errors'].get(reason, 0) + 1
+            result['failed_products'].append(product.get('id'))
+        return result
+
+    def batch_insert_products(self, products_data: List[Dict], batch_size: Optional[int] = None,
+                              workers: Optional[int] = None, retries: Optional[int] = None) -> Dict:
+        """
+        Insert multiple products with products.custombatch.
 
-        print(f"Starting batch upload of {total} products...")
+        The products are split into batches of at most MAX_BATCH_ENTRIES,
+        uploaded by a small pool of threads (each with its own connection).
 
-        for i in range(0, total, batch_size):
-            batch = products_data[i:i + batch_size]
-            print(f"Processing batch {i // batch_size + 1}/{(total + batch_size - 1) // batch_size}...")
+        Args:
+            products_data: List of product data from your database
+            batch_size: Products per custombatch call (default: MERCHANT_UPLOAD_BATCH_SIZE, max 1000)
+            workers: Concurrent calls (default: MERCHANT_UPLOAD_WORKERS)
+            retries: Retries of transient failures (default: MERCHANT_UPLOAD_RETRIES)
 
-            for product_data in batch:
-                result = self.insert_product(product_data)
-                if result:
-                    success_count += 1
-                else:
-                    failed_count += 1
-                    failed_products.append(product_data.get('id'))
+        Returns:
+            Statistics about the batch operation
+        """
+        batch_size = batch_size or getattr(settings, 'MERCHANT_UPLOAD_BATCH_SIZE', MAX_BATCH_ENTRIES)
+        batch_size = min(max(batch_size, 1), MAX_BATCH_ENTRIES)
+        workers = workers or getattr(settings, 'MERCHANT_UPLOAD_WORKERS', 4)
+        if retries is None:
+            retries = getattr(settings, 'MERCHANT_UPLOAD_RETRIES', 3)
 
+        total = len(products_data)
+        batches = [products_data[i:i + batch_size] for i in range(0, total, batch_size)]
         stats = {
             'total': total,
-            'success': success_count,
-            'failed': failed_count,
-            'failed_products': failed_products
+            'success': 0,
+            'failed': 0,
+            'failed_products': [],
+            'errors': {},
+            'batches': len(batches),
+            'retries': 0,
         }
-
-        print(f"\n=== Batch Upload Complete ===")
-        print(f"Total: {total}")
-        print(f"Success: {success_count}")
-        print(f"Failed: {failed_count}")
-
+        if not batches:
+            return stats
+
+        self.ensure_fresh_credentials()
+        started = time.monotonic()
+        if len(batches) == 1 or workers <= 1 or self._http is not None:
+            # Injected HTTP objects (mocks) are shared, so no threads
+            results = [self._upload_batch(batch, retries) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+                results = list(pool.map(lambda batch: self._upload_batch(batch, retries), batches))
+
+        for result in results:
+            stats['success'] += result['success']
+            stats['failed_products'].extend(result['failed_products'])
+            stats['retries'] += result['retries']
+            for reason, count in result['errors'].items():
+                stats['errors'][reason] = stats['errors'].get(reason, 0) + count
+        stats['failed'] = len(stats['failed_products'])
+        stats['upload_seconds'] = time.monotonic() - started
+
+        print(
+            f"{'✓' if not stats['failed'] else '✗'} Uploaded {stats['success']}/{total} products "
+            f"in {len(batches)} batches ({stats['retries']} retries) in {stats['upload_seconds']:.1f}s"
+            + (f", errors: {stats['errors']}" if stats['errors'] else '')
+        )
         return stats
 
     def get_product(self, product_id: str) -> Optional[Dict]:
@@ -241,7 +436,7 @@ class GoogleMerchantService:
                 productId=f'online:de:DE:{product_id}'
             )
 
-            response = request.execute()
+            response = request.execute(http=self._thread_http())
             return response
 
         except HttpError as e:
@@ -271,7 +466,7 @@ class GoogleMerchantService:
                 maxResults=max_results
             )
 
-            response = request.execute()
+            response = request.execute(http=self._thread_http())
             return response.get('resources', [])
 
         except HttpError as e:
@@ -283,14 +478,15 @@ class GoogleMerchantService:
             return []
 
 
-def get_merchant_service() -> GoogleMerchantService:
+_merchant_service = None
+_merchant_service_lock = threading.Lock()
+
+
+def _create_merchant_service() -> GoogleMerchantService:
     """
-    Factory function to create a GoogleMerchantService instance.
+    Create a GoogleMerchantService instance.
 
     Reads configuration from Django settings or environment variables.
-
-    Returns:
-        Configured GoogleMerchantService instance
     """
     # Get Merchant ID from settings or environment
     merchant_id = getattr(settings, 'GOOGLE_MERCHANT_ID', os.getenv('GOOGLE_MERCHANT_ID'))
@@ -315,3 +511,31 @@ def get_merchant_service() -> GoogleMerchantService:
         )
 
     return GoogleMerchantService(merchant_id, credentials_path)
+
+
+def get_merchant_service() -> GoogleMerchantService:
+    """
+    Return the process-wide GoogleMerchantService, creating it on first use.
+
+    The instance is shared across threads and requests; its access token is
+    refreshed here when it is about to expire.
+
+    Returns:
+        Configured GoogleMerchantService instance
+    """
+    global _merchant_service
+    service = _merchant_service
+    if service is None:
+        with _merchant_service_lock:
+            if _merchant_service is None:
+                _merchant_service = _create_merchant_service()
+            service = _merchant_service
+    service.ensure_fresh_credentials()
+    return service
+
+
+def reset_merchant_service():
+    """Drop the shared service (e.g. after rotating the service-account key)"""
+    global _merchant_service
+    with _merchant_service_lock:
+        _merchant_service = None
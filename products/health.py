@@ -1,8 +1,8 @@
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.http import JsonResponse
-import json
 
 # Health Check et Status endpoints
 @api_view(['GET'])
@@ -67,6 +67,35 @@ def api_status(request):
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    Staff-only cache statistics: hits, misses, sets, evictions, payload bytes
+    and time saved per key family (list, categories, brands, blog, detail).
+
+    Query parameters:
+    - sample: Number of live keys to include for debugging (default: 0, max: 200)
+    - family: Only sample keys of this family
+    - reset: Set to 1 to reset the counters after reading them
+    """
+    from products.cache import cache
+
+    data = cache.stats()
+
+    sample = min(int(request.query_params.get('sample', 0)), 200)
+    if sample:
+        data['sample'] = cache.sample_keys(
+            family=request.query_params.get('family') or None,
+            limit=sample,
+        )
+
+    if request.query_params.get('reset') == '1':
+        cache.reset_stats()
+
+    return Response(data, status=status.HTTP_200_OK)
+
+
 def health_check_simple(request):
     """
     Simple health check endpoint (without DRF) for load balancers
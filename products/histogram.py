@@ -0,0 +1,203 @@
+"""
+Price histograms for the range sliders.
+
+Two rounds of per-retailer queries, each run in parallel:
+
+1. boundaries
+   - fixed mode: min and max price, read with sort + limit(1) on the price
+     (or category + price) index,
+   - quantile mode: $bucketAuto per retailer, whose bucket edges are merged
+     into global quantile boundaries (uniform spread inside each bucket),
+2. counts: $bucket with the global boundaries per retailer, summed.
+
+Results are cached per filter set.
+"""
+
+import hashlib
+import logging
+import math
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .cache import cache
+from .category_map import get_category_map
+from .queries import build_retailer_queries, raw_filter
+
+logger = logging.getLogger(__name__)
+
+MAX_BUCKETS = 100
+AUTO_BUCKET_FACTOR = 4
+
+
+def _parallel(func, queries):
+    """Run func(query) for every retailer query in parallel: {retailer: result}"""
+
+    def run(item):
+        retailer_name, query = item
+        try:
+            return retailer_name, func(query)
+        except Exception as e:
+            logger.warning(f"Could not compute {retailer_name} price histogram: {e}")
+            return retailer_name, None
+
+    with ThreadPoolExecutor(max_workers=max(len(queries), 1)) as executor:
+        return dict(executor.map(run, queries.items()))
+
+
+def _price_bounds(query):
+    """(min, max) price of a query, each read from the price index"""
+    collection = query._collection
+    match = dict(raw_filter(query))
+    match.setdefault('price', {'$ne': None})
+    cheapest = next(collection.find(match, {'price': 1}).sort('price', 1).limit(1), None)
+    if cheapest is None:
+        return None
+    dearest = next(collection.find(match, {'price': 1}).sort('price', -1).limit(1), None)
+    return cheapest['price'], dearest['price']
+
+
+def _auto_buckets(query, buckets):
+    pipeline = [
+        {'$match': raw_filter(query)},
+        {'$match': {'price': {'$ne': None}}},
+        {'$bucketAuto': {'groupBy': '$price', 'buckets': buckets}},
+    ]
+    return [
+        (doc['_id']['min'], doc['_id']['max'], doc['count'])
+        for doc in query._collection.aggregate(pipeline, allowDiskUse=True)
+    ]
+
+
+def _count_buckets(query, boundaries):
+    pipeline = [
+        {'$match': raw_filter(query)},
+        {'$bucket': {
+            'groupBy': '$price',
+            'boundaries': boundaries,
+            'default': 'outside',
+            'output': {'count': {'$sum': 1}},
+        }},
+    ]
+    return {
+        doc['_id']: doc['count']
+        for doc in query._collection.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+def _upper_edge(value):
+    """The next cent above value ($bucket upper bounds are exclusive).
+
+    value * 100 is rounded before flooring: 19.99 * 100 is 1998.9999999999998.
+    """
+    return round(math.floor(round(value * 100, 6)) / 100 + 0.01, 2)
+
+
+def _fixed_boundaries(bounds, buckets):
+    low = min(b[0] for b in bounds)
+    high = max(b[1] for b in bounds)
+    low = math.floor(low * 100) / 100
+    high = _upper_edge(high)
+    step = (high - low) / buckets
+    edges = [round(low + i * step, 2) for i in range(buckets)] + [high]
+    return sorted(set(edges))
+
+
+def _quantile_boundaries(auto_buckets, buckets):
+    """Merge per-retailer $bucketAuto edges into global quantile boundaries"""
+    pieces = sorted(
+        (low, high, count)
+        for retailer_buckets in auto_buckets
+        for low, high, count in retailer_buckets
+    )
+    total = sum(count for _, _, count in pieces)
+    if not total:
+        return []
+
+    # Cumulative distribution sampled at every bucket edge, assuming prices
+    # are spread uniformly inside each bucket
+    edges = sorted({edge for low, high, _ in pieces for edge in (low, high)})
+
+    def cdf(x):
+        covered = 0.0
+        for low, high, count in pieces:
+            if x >= high:
+                covered += count
+            elif x > low:
+                covered += count * (x - low) / (high - low)
+        return covered
+
+    cumulative = [cdf(edge) for edge in edges]
+
+    boundaries = [math.floor(edges[0] * 100) / 100]
+    for k in range(1, buckets):
+        target = total * k / buckets
+        i = bisect_right(cumulative, target)
+        if i <= 0 or i >= len(edges):
+            continue
+        x0, x1 = edges[i - 1], edges[i]
+        c0, c1 = cumulative[i - 1], cumulative[i]
+        x = x0 if c1 == c0 else x0 + (x1 - x0) * (target - c0) / (c1 - c0)
+        boundaries.append(round(x, 2))
+    boundaries.append(_upper_edge(edges[-1]))
+    return sorted(set(boundaries))
+
+
+def compute_price_histogram(queries, buckets=20, mode='fixed'):
+    """Bucketed price counts for a set of retailer queries"""
+    if mode == 'quantile':
+        # Finer auto buckets than requested give a smoother merged distribution
+        auto = _parallel(lambda q: _auto_buckets(q, buckets * AUTO_BUCKET_FACTOR), queries)
+        boundaries = _quantile_boundaries([b for b in auto.values() if b], buckets)
+    else:
+        bounds = [b for b in _parallel(_price_bounds, queries).values() if b]
+        boundaries = _fixed_boundaries(bounds, buckets) if bounds else []
+
+    if len(boundaries) < 2:
+        return {'mode': mode, 'count': 0, 'buckets': []}
+
+    counts = _parallel(lambda q: _count_buckets(q, boundaries), queries)
+    merged = {}
+    for retailer_counts in counts.values():
+        for key, count in (retailer_counts or {}).items():
+            merged[key] = merged.get(key, 0) + count
+
+    result = [
+        {'min': boundaries[i], 'max': boundaries[i + 1], 'count': merged.get(boundaries[i], 0)}
+        for i in range(len(boundaries) - 1)
+    ]
+    return {
+        'mode': mode,
+        'count': sum(bucket['count'] for bucket in result),
+        'min': boundaries[0],
+        'max': boundaries[-1],
+        'buckets': result,
+    }
+
+
+def get_price_histogram(retailer, category, brand, search, min_price=None, max_price=None,
+                        buckets=20, mode='fixed'):
+    """Cached price histogram for a filter set"""
+    buckets = max(1, min(int(buckets), MAX_BUCKETS))
+    if mode not in ('fixed', 'quantile'):
+        mode = 'fixed'
+
+    cache_params = (
+        f"{search}:{category}:{brand}:{retailer}:{min_price}:{max_price}:{buckets}:{mode}:"
+        f"{get_category_map().version}"
+    )
+    cache_key = f"products_histogram_{hashlib.md5(cache_params.encode()).hexdigest()}"
+    histogram = cache.get(cache_key)
+    if histogram is not None:
+        return histogram
+
+    started = time.monotonic()
+    queries = build_retailer_queries(retailer, category, brand, search, min_price, max_price)
+    histogram = compute_price_histogram(queries, buckets, mode)
+    cache.set(
+        cache_key, histogram, getattr(settings, 'CACHE_HISTOGRAM_DURATION', 900),
+        cost=time.monotonic() - started,
+    )
+    return histogram
@@ -0,0 +1,225 @@
+"""
+Push-based invalidation of the Next.js frontend.
+
+The frontend exposes POST /api/revalidate?token=... which calls revalidatePath()
+for the given paths. Instead of waiting for ISR timers, Django collects what
+changed (product IDs, categories, brands, blog slugs), coalesces it into a set
+of frontend paths and POSTs them in batches from a background thread, with a
+simple rate limit and retries with exponential backoff.
+
+Usage:
+    from products.invalidation import publisher
+    publisher.product_changed(product_id)
+    publisher.category_changed('Kühlschränke')
+    publisher.flush()  # send now (management commands, before exiting)
+
+The target is FRONTEND_REVALIDATE_URL; FRONTEND_REVALIDATE_TRANSPORT can
+point to a callable `(url, payload, timeout) -> status_code` (e.g. a local
+stub in tests). Nothing is sent while FRONTEND_REVALIDATE_TOKEN is empty.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def _slug(name):
+    """`name.toLowerCase().replace(/[^a-z0-9]+/g, '-')` of the Next.js pages"""
+    return re.sub(r'[^a-z0-9]+', '-', (name or '').lower())
+
+
+def _slug_variants(name):
+    """Both slugs the frontend links a name under: as is ('-pfel' for
+    'Äpfel') and with leading/trailing dashes trimmed ('pfel')"""
+    slug = _slug(name)
+    return {slug, slug.strip('-')} - {''}
+
+
+def category_paths(name):
+    """/kategorien/[slug] paths of a category.
+
+    kategorien/page.tsx, ProductDetailClient.tsx and HomeContent.tsx link
+    the untrimmed slug; sitemap.ts (cleanSlug) and HomeCategoryBar.tsx link
+    the trimmed one. ISR caches each path separately.
+    """
+    return {f'/kategorien/{slug}' for slug in _slug_variants(name)}
+
+
+def brand_paths(name):
+    """/marken/[slug] paths of a brand.
+
+    ProductDetailClient.tsx and the top brands of kategorien/page.tsx link
+    the untrimmed slug; marken/page.tsx and sitemap.ts the trimmed one.
+    """
+    return {f'/marken/{slug}' for slug in _slug_variants(name)}
+
+
+def http_post(url, payload, timeout):
+    """Default transport: POST JSON with urllib, return the HTTP status code"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+class InvalidationPublisher:
+    """Collect changed frontend paths and POST them in coalesced batches"""
+
+    def __init__(self, url, token, transport=None, flush_interval=30,
+                 batch_size=50, min_request_interval=1.0, max_retries=3,
+                 retry_backoff=2.0, timeout=10):
+        self.url = url
+        self.token = token
+        self.transport = transport or http_post
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.min_request_interval = min_request_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._last_request_at = 0.0
+        self._thread = None
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'requests': 0, 'retries': 0}
+
+    @classmethod
+    def from_settings(cls):
+        transport = getattr(settings, 'FRONTEND_REVALIDATE_TRANSPORT', None)
+        if isinstance(transport, str):
+            transport = import_string(transport)
+        return cls(
+            url=getattr(settings, 'FRONTEND_REVALIDATE_URL', ''),
+            token=getattr(settings, 'FRONTEND_REVALIDATE_TOKEN', ''),
+            transport=transport,
+            flush_interval=getattr(settings, 'FRONTEND_REVALIDATE_FLUSH_INTERVAL', 30),
+            batch_size=getattr(settings, 'FRONTEND_REVALIDATE_BATCH_SIZE', 50),
+            min_request_interval=getattr(settings, 'FRONTEND_REVALIDATE_MIN_INTERVAL', 1.0),
+            max_retries=getattr(settings, 'FRONTEND_REVALIDATE_MAX_RETRIES', 3),
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.url and self.token)
+
+    # --- Collecting changes -------------------------------------------------
+
+    def add_paths(self, paths):
+        """Queue frontend paths for revalidation (duplicates are coalesced)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            before = len(self._pending)
+            self._pending.update(paths)
+            self.stats['queued'] += len(self._pending) - before
+        self._start()
+
+    def product_changed(self, product_id, category=None, brand=None):
+        paths = {f'/product/{product_id}'}
+        if category:
+            paths |= category_paths(category)
+        if brand:
+            paths |= brand_paths(brand)
+        self.add_paths(paths)
+
+    def category_changed(self, name):
+        self.add_paths({'/kategorien'} | category_paths(name))
+
+    def brand_changed(self, name):
+        self.add_paths({'/marken'} | brand_paths(name))
+
+    def blog_changed(self, slug):
+        self.add_paths({'/blog', f'/blog/{slug}'})
+
+    # --- Sending ------------------------------------------------------------
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='frontend-revalidate', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Frontend revalidation flush failed: {e}")
+
+    def flush(self):
+        """Send all pending paths now; returns the number of paths revalidated"""
+        with self._lock:
+            paths = sorted(self._pending)
+            self._pending.clear()
+        if not paths:
+            return 0
+
+        sent = 0
+        with self._send_lock:
+            for i in range(0, len(paths), self.batch_size):
+                batch = paths[i:i + self.batch_size]
+                if self._send(batch):
+                    sent += len(batch)
+                    self.stats['sent'] += len(batch)
+                else:
+                    self.stats['failed'] += len(batch)
+        return sent
+
+    def _throttle(self):
+        wait = self._last_request_at + self.min_request_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request_at = time.monotonic()
+
+    def _send(self, paths):
+        url = f"{self.url}?{urllib.parse.urlencode({'token': self.token})}"
+        payload = {'paths': paths}
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+                time.sleep(self.retry_backoff ** (attempt - 1))
+            self._throttle()
+            self.stats['requests'] += 1
+            try:
+                status_code = self.transport(url, payload, self.timeout)
+            except Exception as e:
+                logger.warning(f"Frontend revalidation request failed: {e}")
+                continue
+
+            if 200 <= status_code < 300:
+                return True
+            if status_code != 429 and status_code < 500:
+                # Bad token or bad request: retrying won't help
+                logger.error(f"Frontend revalidation rejected ({status_code}) for {len(paths)} paths")
+                return False
+            logger.warning(f"Frontend revalidation returned {status_code}, retrying")
+
+        logger.error(f"Giving up revalidating {len(paths)} paths after {self.max_retries} retries")
+        return False
+
+
+publisher = InvalidationPublisher.from_settings()
@@ -0,0 +1,169 @@
+"""
+Cached product lookups by ID.
+
+A product ID can belong to any of the four retailer databases, so an uncached
+lookup means up to four round trips. This module puts three layers in front
+of that, shared by `retrieve` and `similar`:
+
+- malformed IDs are rejected without touching MongoDB,
+- serialized products are cached (positive cache) and unknown IDs are
+  remembered for a short time (negative cache), so crawlers replaying
+  deleted URLs cost a single cache read,
+- concurrent lookups of the same ID are coalesced into one database query.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+from django.conf import settings
+
+from .cache import cache
+from .models import RETAILER_MODELS
+from .serializers import BaseProductSerializer
+
+logger = logging.getLogger(__name__)
+
+# Marker stored in the cache for IDs that don't exist in any retailer
+_MISSING = '__missing__'
+
+
+class _Flight:
+    """One in-progress lookup that concurrent callers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _coalesce(key, func):
+    """Run func() once for concurrent callers with the same key"""
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+
+    if not leader:
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = func()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.event.set()
+
+
+def _find_in_retailers(pk):
+    """Query all retailers in parallel; return (retailer, document, had_errors)"""
+
+    def get(item):
+        retailer_name, model = item
+        try:
+            return retailer_name, model.objects(id=pk).first(), False
+        except Exception as e:
+            logger.error(f"{retailer_name} product retrieve error for ID {pk}: {type(e).__name__}: {e}")
+            return retailer_name, None, True
+
+    with ThreadPoolExecutor(max_workers=len(RETAILER_MODELS)) as executor:
+        results = list(executor.map(get, RETAILER_MODELS.items()))
+
+    had_errors = any(error for _, _, error in results)
+    for retailer_name, product, _ in results:
+        if product is not None:
+            return retailer_name, product, had_errors
+    return None, None, had_errors
+
+
+def _load_product(pk):
+    started = time.monotonic()
+    retailer_name, product, had_errors = _find_in_retailers(pk)
+    if product is None:
+        # A failing retailer may hide the product, so remember it for less time
+        ttl = getattr(settings, 'PRODUCT_NOT_FOUND_TTL', 60)
+        if had_errors:
+            ttl = min(ttl, getattr(settings, 'PRODUCT_LOOKUP_ERROR_TTL', 10))
+        cache.set(f'product_missing_{pk}', _MISSING, ttl, cost=time.monotonic() - started)
+        return None
+
+    data = dict(BaseProductSerializer(product).data)
+    data['retailer'] = retailer_name
+    cache.set(
+        f'product_detail_{pk}', data, getattr(settings, 'PRODUCT_DETAIL_TTL', 600),
+        cost=time.monotonic() - started,
+    )
+    return data
+
+
+def get_product_data(pk):
+    """Return the serialized product (with 'retailer') for an ID, or None"""
+    if not pk or not ObjectId.is_valid(str(pk)):
+        return None
+
+    pk = str(pk)
+    cached = cache.get_many([f'product_detail_{pk}', f'product_missing_{pk}'])
+    if f'product_detail_{pk}' in cached:
+        return cached[f'product_detail_{pk}']
+    if f'product_missing_{pk}' in cached:
+        return None
+
+    return _coalesce(pk, lambda: _load_product(pk))
+
+
+def get_products_data(refs):
+    """Serialized products for a list of (retailer, id) pairs, in that order.
+
+    Cached products come from one get_many; the others are fetched with one
+    `id__in` query per retailer, in parallel. Unknown IDs are skipped.
+    """
+    refs = [(retailer_name, str(pk)) for retailer_name, pk in refs if ObjectId.is_valid(str(pk))]
+    cached = cache.get_many([f'product_detail_{pk}' for _, pk in refs])
+    found = {pk: cached[f'product_detail_{pk}'] for _, pk in refs if f'product_detail_{pk}' in cached}
+
+    missing = {}
+    for retailer_name, pk in refs:
+        if pk not in found and retailer_name in RETAILER_MODELS:
+            missing.setdefault(retailer_name, []).append(pk)
+
+    def fetch(item):
+        retailer_name, ids = item
+        started = time.monotonic()
+        try:
+            products = list(RETAILER_MODELS[retailer_name].objects(id__in=ids))
+        except Exception as e:
+            logger.error(f"{retailer_name} bulk product retrieve error: {type(e).__name__}: {e}")
+            return {}
+        cost = (time.monotonic() - started) / max(len(products), 1)
+
+        loaded = {}
+        for product in products:
+            data = dict(BaseProductSerializer(product).data)
+            data['retailer'] = retailer_name
+            loaded[str(product.id)] = data
+            cache.set(
+                f'product_detail_{product.id}', data, getattr(settings, 'PRODUCT_DETAIL_TTL', 600),
+                cost=cost,
+            )
+        return loaded
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            for loaded in executor.map(fetch, missing.items()):
+                found.update(loaded)
+
+    return [found[pk] for _, pk in refs if pk in found]
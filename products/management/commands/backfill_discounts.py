@@ -0,0 +1,84 @@
+"""
+Django management command to store the numeric discount percentage.
+
+Computes discount_pct (from old_price/price, or the discount text) for the
+products scraped since the last run (per-retailer scraped_at watermark in the
+job checkpoint) and writes it where it changed. Run it from cron after each
+scrape; --full recomputes every product (first run, formula changes).
+
+Usage:
+    python manage.py backfill_discounts
+    python manage.py backfill_discounts --full
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from products.checkpoints import load_checkpoint, save_checkpoint
+from products.deals import discount_pct
+from products.models import RETAILER_MODELS
+
+CHECKPOINT = 'discounts'
+
+
+class Command(BaseCommand):
+    help = 'Compute the numeric discount percentage of recently scraped products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute all products, not only the recently scraped ones')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Updates per bulk write')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        run_started = datetime.utcnow()
+        watermarks, _ = ({}, {}) if options['full'] else load_checkpoint(CHECKPOINT)
+
+        for retailer_name, model in RETAILER_MODELS.items():
+            collection = model._get_collection()
+            query = {}
+            if not options['full']:
+                query = {'scraped_at': {'$lte': run_started}}
+                if watermarks.get(retailer_name):
+                    query['scraped_at']['$gt'] = watermarks[retailer_name]
+
+            scanned = changed = 0
+            newest = watermarks.get(retailer_name)
+            operations = []
+            try:
+                cursor = collection.find(
+                    query, {'price': 1, 'old_price': 1, 'discount': 1, 'discount_pct': 1, 'scraped_at': 1}
+                )
+                for doc in cursor.batch_size(5000):
+                    scanned += 1
+                    scraped_at = doc.get('scraped_at')
+                    if scraped_at is not None and scraped_at <= run_started and (newest is None or scraped_at > newest):
+                        newest = scraped_at
+
+                    pct = discount_pct(doc.get('price'), doc.get('old_price'), doc.get('discount'))
+                    if pct == doc.get('discount_pct'):
+                        continue
+                    if pct is None:
+                        operations.append(UpdateOne({'_id': doc['_id']}, {'$unset': {'discount_pct': ''}}))
+                    else:
+                        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'discount_pct': pct}}))
+                    changed += 1
+                    if len(operations) >= batch_size:
+                        collection.bulk_write(operations, ordered=False)
+                        operations = []
+                if operations:
+                    collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                # Watermark not advanced: this retailer is retried next run
+                self.stdout.write(self.style.ERROR(f'✗ {retailer_name} error: {e}'))
+                continue
+
+            if newest is not None:
+                watermarks[retailer_name] = newest
+            save_checkpoint(CHECKPOINT, watermarks)
+            self.stdout.write(f'{retailer_name}: {scanned} products scanned, {changed} discounts updated')
+
+        self.stdout.write(self.style.SUCCESS('✓ Discounts updated'))
@@ -0,0 +1,79 @@
+"""
+Django management command to build the cross-retailer category map.
+
+Collects the distinct categories (with product counts) of every retailer,
+groups the spellings of the same category and writes the canonical table with
+per-retailer aliases to CATEGORY_MAP_PATH. Run it from cron after the scrapes;
+the web processes reload the file on their own.
+
+Overrides (CATEGORY_MAP_OVERRIDES_PATH or --overrides) are a JSON object
+mapping a category spelling to its canonical name, for groupings the
+automatic key can't find:
+
+    {"Kühlschrank": "Kühlschränke", "Fernseher & TV": "Fernseher"}
+
+Usage:
+    python manage.py build_category_map
+    python manage.py build_category_map --dry-run
+"""
+
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products.category_map import build_category_map, write_category_map
+from products.models import RETAILER_MODELS
+
+CATEGORY_COUNTS_PIPELINE = [
+    {'$match': {'category': {'$nin': [None, '']}}},
+    {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
+]
+
+
+class Command(BaseCommand):
+    help = 'Build the canonical category map with per-retailer aliases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(getattr(settings, 'CATEGORY_MAP_PATH', '')),
+                            help='Map file to write (default: CATEGORY_MAP_PATH)')
+        parser.add_argument('--overrides', default=str(getattr(settings, 'CATEGORY_MAP_OVERRIDES_PATH', '')),
+                            help='JSON file of {spelling: canonical name} overrides')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the merged categories without writing the map')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['overrides'] and os.path.exists(options['overrides']):
+            with open(options['overrides'], encoding='utf-8') as f:
+                overrides = json.load(f)
+            self.stdout.write(f'Loaded {len(overrides)} overrides')
+
+        counts = {}
+        for retailer_name, model in RETAILER_MODELS.items():
+            try:
+                docs = model._get_collection().aggregate(CATEGORY_COUNTS_PIPELINE, allowDiskUse=True)
+                counts[retailer_name] = {doc['_id']: doc['count'] for doc in docs}
+                self.stdout.write(f'{retailer_name}: {len(counts[retailer_name])} categories')
+            except Exception as e:
+                # A partial map would drop that retailer's aliases: keep the old one
+                raise CommandError(f'{retailer_name} error: {e}')
+
+        categories = build_category_map(counts, overrides)
+        spellings = sum(len(retailer_counts) for retailer_counts in counts.values())
+        merged = {name: retailers for name, retailers in categories.items()
+                  if len({alias for aliases in retailers.values() for alias in aliases}) > 1}
+        self.stdout.write(
+            f'{spellings} spellings → {len(categories)} canonical categories '
+            f'({len(merged)} with several spellings)'
+        )
+
+        if options['dry_run']:
+            for name, retailers in merged.items():
+                aliases = ', '.join(f'{r}: {a}' for r, names in retailers.items() for a in names)
+                self.stdout.write(f'  {name} ← {aliases}')
+            return
+
+        write_category_map(categories, options['output'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Category map written to {options["output"]}'))
@@ -57,6 +57,9 @@ class Command(BaseCommand):
             saturn_collection.create_index([('brand', 1)])
             saturn_collection.create_index([('scraped_at', -1)])
             saturn_collection.create_index([('price', 1)])
+            saturn_collection.create_index([('category', 1), ('price', 1)])
+            saturn_collection.create_index([('category', 1), ('discount_pct', -1)])
+            saturn_collection.create_index([('discount_pct', -1)])
             self.stdout.write(self.style.SUCCESS('✓ SaturnProduct additional indexes created'))
 
         except Exception as e:
@@ -86,6 +89,9 @@ class Command(BaseCommand):
             mediamarkt_collection.create_index([('brand', 1)])
             mediamarkt_collection.create_index([('scraped_at', -1)])
             mediamarkt_collection.create_index([('price', 1)])
+            mediamarkt_collection.create_index([('category', 1), ('price', 1)])
+            mediamarkt_collection.create_index([('category', 1), ('discount_pct', -1)])
+            mediamarkt_collection.create_index([('discount_pct', -1)])
             self.stdout.write(self.style.SUCCESS('✓ MediaMarktProduct additional indexes created'))
 
         except Exception as e:
@@ -115,6 +121,9 @@ class Command(BaseCommand):
             otto_collection.create_index([('brand', 1)])
             otto_collection.create_index([('scraped_at', -1)])
             otto_collection.create_index([('price', 1)])
+            otto_collection.create_index([('category', 1), ('price', 1)])
+            otto_collection.create_index([('category', 1), ('discount_pct', -1)])
+            otto_collection.create_index([('discount_pct', -1)])
             self.stdout.write(self.style.SUCCESS('✓ OttoProduct additional indexes created'))
 
         except Exception as e:
@@ -144,6 +153,9 @@ class Command(BaseCommand):
             kaufland_collection.create_index([('brand', 1)])
             kaufland_collection.create_index([('scraped_at', -1)])
             kaufland_collection.create_index([('price', 1)])
+            kaufland_collection.create_index([('category', 1), ('price', 1)])
+            kaufland_collection.create_index([('category', 1), ('discount_pct', -1)])
+            kaufland_collection.create_index([('discount_pct', -1)])
             self.stdout.write(self.style.SUCCESS('✓ KauflandProduct additional indexes created'))
 
         except Exception as e:
@@ -156,4 +168,7 @@ class Command(BaseCommand):
         self.stdout.write('  - Brand index (for filtering)')
         self.stdout.write('  - Scraped date index (for freshness sorting)')
         self.stdout.write('  - Price index (for price sorting)')
+        self.stdout.write('  - Category + price index (for price histograms per category)')
+        self.stdout.write('  - Product group index, sparse (for cross-retailer comparison, match_products; from the model meta)')
+        self.stdout.write('  - Discount indexes, alone and per category (for deals)')
         self.stdout.write('\nThese indexes will significantly improve search performance!')
@@ -0,0 +1,49 @@
+"""
+Django management command to pre-generate the Google Merchant feed.
+
+Streams the feed (see products/feeds.py) into MERCHANT_FEED_PATH, gzipped,
+and moves it into place atomically, so google_merchant_feed serves repeated
+downloads from the file instead of reading every product again. Run it from
+cron more often than MERCHANT_FEED_MAX_AGE, e.g. daily.
+
+Usage:
+    python manage.py generate_merchant_feed
+    python manage.py generate_merchant_feed --output /tmp/feed.xml.gz --limit 1000
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products.feeds import write_feed
+
+
+class Command(BaseCommand):
+    help = 'Write the Google Merchant feed to a gzipped file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default=None,
+                            help='Output file (default: MERCHANT_FEED_PATH; .gz is gzipped)')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximum products per retailer (default: all; requires --output)')
+
+    def handle(self, *args, **options):
+        if options['limit'] is not None and not options['output']:
+            # A truncated feed must never replace the one the API serves
+            raise CommandError('--limit requires --output')
+        path = str(options['output'] or getattr(settings, 'MERCHANT_FEED_PATH', 'google_merchant.xml.gz'))
+
+        started = time.monotonic()
+        try:
+            write_feed(path, options['limit'])
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ Feed generation failed, previous file kept: {e}'))
+            raise
+
+        size = os.path.getsize(path) / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Feed written: {path} ({size:.1f} MB) '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,50 @@
+"""
+Django management command to pre-render the product sitemaps.
+
+Writes sitemap-products-N.xml.gz shards (SITEMAP_SHARD_SIZE URLs each) and
+sitemap-products-index.xml to SITEMAP_DIR, where sitemap_file serves them
+(see products/sitemap.py). Files are replaced atomically and only when
+their content changed. Run it from cron, e.g. daily after the scrapes.
+
+Usage:
+    python manage.py generate_sitemaps
+    python manage.py generate_sitemaps --dir /var/www/sitemaps --shard-size 40000
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.sitemap import MAX_SITEMAP_ENTRIES, write_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Write the gzipped product sitemap shards and their index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, default=None,
+                            help='Output directory (default: SITEMAP_DIR)')
+        parser.add_argument('--shard-size', type=int, default=None,
+                            help='URLs per shard (default: SITEMAP_SHARD_SIZE, max 50000)')
+
+    def handle(self, *args, **options):
+        directory = str(options['dir'] or getattr(settings, 'SITEMAP_DIR', 'sitemaps'))
+        shard_size = options['shard_size'] or getattr(settings, 'SITEMAP_SHARD_SIZE', MAX_SITEMAP_ENTRIES)
+        shard_size = min(max(shard_size, 1), MAX_SITEMAP_ENTRIES)
+
+        started = time.monotonic()
+        try:
+            stats = write_sitemaps(directory, shard_size)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ Sitemap generation failed: {e}'))
+            raise
+
+        self.stdout.write(
+            f"{stats['products']} products in {stats['shards']} shards: "
+            f"{stats['written']} written, {stats['unchanged']} unchanged, {stats['removed']} removed; "
+            f"index {'written' if stats['index_written'] else 'unchanged'}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Sitemaps written to {directory} in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,134 @@
+"""
+Django management command to match equivalent products across retailers.
+
+Clusters products of different retailers (brand + model number blocking,
+title similarity, GTIN when present, see products/matching.py) and writes a
+product_group ID to every product of a cluster. Only changed documents are
+written; products that left a cluster get their product_group removed. The
+old and new groups are queued for update_best_offers.
+
+Evaluation runs the matcher with GTINs hidden and reports pairwise precision
+and recall against a labeled sample: either a CSV file (columns retailer,
+product_id, label — products sharing a label are the same product) or, by
+default, the products that have a GTIN.
+
+Usage:
+    python manage.py match_products
+    python manage.py match_products --dry-run
+    python manage.py match_products --evaluate
+    python manage.py match_products --evaluate --labels labeled_pairs.csv
+"""
+
+import csv
+import time
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import UpdateOne
+
+from products.best_offers import mark_keys_changed
+from products.matching import (
+    assignments, evaluate, gtin_label_groups, load_products, match_products,
+)
+from products.models import RETAILER_MODELS
+
+
+class Command(BaseCommand):
+    help = 'Match equivalent products across retailers and store their product group'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Match and report without writing product groups')
+        parser.add_argument('--evaluate', action='store_true',
+                            help='Report precision/recall on a labeled sample (GTINs hidden), no writes')
+        parser.add_argument('--labels',
+                            help='CSV labeled sample (retailer,product_id,label) instead of GTIN labels')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Updates per bulk write')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        products = load_products()
+        self.stdout.write(f'Loaded {len(products)} products in {time.monotonic() - started:.1f}s')
+
+        if options['evaluate']:
+            self._evaluate(products, options['labels'])
+            return
+
+        groups, stats = match_products(products)
+        self._report(stats)
+
+        if options['dry_run']:
+            return
+
+        new_groups = assignments(groups)
+        updated = self._write(products, new_groups, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {updated} products updated in {time.monotonic() - started:.1f}s total'
+        ))
+
+    def _report(self, stats):
+        share = stats['comparisons'] / stats['all_pairs'] if stats['all_pairs'] else 0
+        self.stdout.write(
+            f"{stats['blocks']} blocks ({stats['skipped_blocks']} too large, skipped), "
+            f"{stats['comparisons']} comparisons ({share:.4%} of all pairs)"
+        )
+        self.stdout.write(
+            f"{stats['groups']} groups covering {stats['grouped_products']} products "
+            f"(blocking {stats['blocking_seconds']}s, matching {stats['matching_seconds']}s)"
+        )
+
+    def _evaluate(self, products, labels_path):
+        if labels_path:
+            labeled = {}
+            try:
+                with open(labels_path, newline='', encoding='utf-8') as f:
+                    for row in csv.DictReader(f):
+                        labeled.setdefault(row['label'], []).append((row['retailer'], row['product_id']))
+            except (OSError, KeyError) as e:
+                raise CommandError(f'Could not read labels from {labels_path}: {e}')
+            label_groups = list(labeled.values())
+            source = labels_path
+        else:
+            label_groups = gtin_label_groups(products)
+            source = 'GTIN labels'
+
+        groups, stats = match_products(products, use_gtin=False)
+        self._report(stats)
+
+        result = evaluate(groups, label_groups)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Evaluation on {source}:'))
+        for key, value in result.items():
+            self.stdout.write(f'  {key}: {value}')
+
+    def _write(self, products, new_groups, batch_size):
+        updated = 0
+        for retailer_name, model in RETAILER_MODELS.items():
+            operations = []
+            changed = set()
+            for (product_retailer, pk), product in products.items():
+                if product_retailer != retailer_name:
+                    continue
+                group = new_groups.get((product_retailer, pk))
+                if group == product['product_group']:
+                    continue
+                # The product leaves its old group's best offer and joins the new one
+                changed.update(f'group:{key}' for key in (group, product['product_group']) if key)
+                if group:
+                    operations.append(UpdateOne({'_id': ObjectId(pk)}, {'$set': {'product_group': group}}))
+                else:
+                    operations.append(UpdateOne({'_id': ObjectId(pk)}, {'$unset': {'product_group': ''}}))
+
+            collection = model._get_collection()
+            try:
+                # changed_keys only sees scraped_at: queue the groups for update_best_offers
+                # (before writing, so a partly failed write is still recomputed)
+                mark_keys_changed(changed)
+                for i in range(0, len(operations), batch_size):
+                    collection.bulk_write(operations[i:i + batch_size], ordered=False)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'✗ {retailer_name} error: {e}'))
+                continue
+            updated += len(operations)
+            self.stdout.write(f'{retailer_name}: {len(operations)} product groups changed')
+        return updated
@@ -0,0 +1,76 @@
+"""
+Django management command to precompute similar products.
+
+Builds the MinHash/LSH similarity index of all retailers from scratch, looks
+up the top K matches of every product and stores them in the SimilarProducts
+collection (derived database), so the `similar` endpoint is one keyed read
+plus one bulk fetch. Entries of products that no longer exist are removed at
+the end of the run. Run it nightly from cron:
+
+Usage:
+    python manage.py precompute_similar
+    python manage.py precompute_similar --top-k 12 --batch-size 1000
+"""
+
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pymongo import ReplaceOne
+
+from products.models import SimilarProducts
+from products.similarity import build_similarity_index
+
+
+class Command(BaseCommand):
+    help = 'Precompute the similar products of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=getattr(settings, 'SIMILAR_PRECOMPUTE_TOP_K', 12),
+                            help='Similar products stored per product')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Documents per bulk write')
+
+    def handle(self, *args, **options):
+        top_k = options['top_k']
+        batch_size = options['batch_size']
+        run_started = datetime.utcnow()
+
+        started = time.monotonic()
+        index = build_similarity_index(None)['index']
+        self.stdout.write(f'Indexed {len(index)} products in {time.monotonic() - started:.1f}s')
+
+        collection = SimilarProducts._get_collection()
+        started = time.monotonic()
+        batch = []
+        written = without_matches = 0
+        for product_id, retailer_name, price in index:
+            matches = index.similar(product_id, None, price, top_k)
+            if not matches:
+                without_matches += 1
+            batch.append(ReplaceOne(
+                {'_id': product_id},
+                {
+                    'retailer': retailer_name,
+                    'similar': [f'{match_retailer}:{match_id}' for match_id, match_retailer, _ in matches],
+                    'scores': [score for _, _, score in matches],
+                    'computed_at': run_started,
+                },
+                upsert=True,
+            ))
+            if len(batch) >= batch_size:
+                collection.bulk_write(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        if batch:
+            collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+
+        # Products deleted since the previous run
+        removed = collection.delete_many({'computed_at': {'$lt': run_started}}).deleted_count
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Stored similar products of {written} products in {time.monotonic() - started:.1f}s '
+            f'({without_matches} without matches, {removed} stale entries removed)'
+        ))
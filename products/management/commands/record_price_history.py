@@ -0,0 +1,89 @@
+"""
+Django management command to record price changes into the price history.
+
+Walks each retailer collection by scraped_at from the job checkpoint, in
+batches, and appends the new price of every product whose price changed
+(see products/price_history.py), updating the daily/weekly rollups and
+recording price drops (products/price_drops.py) along the way. The
+watermark is saved after each batch, so an interrupted run resumes where it
+stopped. Run it from cron after each scrape.
+
+Usage:
+    python manage.py record_price_history
+    python manage.py record_price_history --batch-size 2000
+    python manage.py record_price_history --rebuild-rollups  # from the raw history
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.checkpoints import load_checkpoint, save_checkpoint
+from products.models import RETAILER_MODELS
+from products.price_history import append_observations, rebuild_rollups
+
+CHECKPOINT = 'price_history'
+
+
+class Command(BaseCommand):
+    help = 'Append changed product prices to the price history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Products per batch (and per checkpoint)')
+        parser.add_argument('--rebuild-rollups', action='store_true',
+                            help='Recompute the daily/weekly rollups from the raw history and exit')
+
+    def handle(self, *args, **options):
+        if options['rebuild_rollups']:
+            started = time.monotonic()
+            products = rebuild_rollups()
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Rollups of {products} products rebuilt in {time.monotonic() - started:.1f}s'
+            ))
+            return
+
+        batch_size = options['batch_size']
+        watermarks, _ = load_checkpoint(CHECKPOINT)
+
+        for retailer_name, model in RETAILER_MODELS.items():
+            started = time.monotonic()
+            # $gte: products sharing the watermark's scraped_at may not all have
+            # been recorded; replaying them is harmless
+            query = {'scraped_at': {'$ne': None}}
+            if watermarks.get(retailer_name):
+                query = {'scraped_at': {'$gte': watermarks[retailer_name]}}
+
+            scanned = stored = drops = 0
+            batch = []
+            try:
+                cursor = model._get_collection().find(
+                    query, {'price': 1, 'scraped_at': 1}
+                ).sort('scraped_at', 1)
+                for doc in cursor.batch_size(batch_size):
+                    batch.append((str(doc['_id']), retailer_name, doc['scraped_at'], doc.get('price')))
+                    if len(batch) >= batch_size:
+                        batch_stored, batch_drops = append_observations(batch)
+                        stored += batch_stored
+                        drops += batch_drops
+                        scanned += len(batch)
+                        watermarks[retailer_name] = batch[-1][2]
+                        save_checkpoint(CHECKPOINT, watermarks)
+                        batch = []
+                if batch:
+                    batch_stored, batch_drops = append_observations(batch)
+                    stored += batch_stored
+                    drops += batch_drops
+                    scanned += len(batch)
+                    watermarks[retailer_name] = batch[-1][2]
+                    save_checkpoint(CHECKPOINT, watermarks)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'✗ {retailer_name} error: {e}'))
+                continue
+
+            self.stdout.write(
+                f'{retailer_name}: {scanned} products scanned, {stored} price changes recorded '
+                f'({drops} drops) in {time.monotonic() - started:.1f}s'
+            )
+
+        self.stdout.write(self.style.SUCCESS('✓ Price history updated'))
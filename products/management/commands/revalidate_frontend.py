@@ -0,0 +1,66 @@
+"""
+Django management command to push recent product changes to the frontend.
+
+Products are written to MongoDB by the scrapers, outside of Django, so this
+command (run from cron after each scrape) finds the products scraped in the
+last N minutes and asks the frontend to revalidate their pages, categories
+and brands through the batched invalidation publisher.
+
+Usage:
+    python manage.py revalidate_frontend --since-minutes 60
+    python manage.py revalidate_frontend --path / --path /kategorien
+"""
+
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from products.invalidation import publisher
+from products.models import RETAILER_MODELS
+
+
+class Command(BaseCommand):
+    help = 'Revalidate frontend pages for recently scraped products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since-minutes', type=int, default=0,
+                            help='Revalidate products scraped in the last N minutes')
+        parser.add_argument('--path', action='append', default=[],
+                            help='Extra frontend path to revalidate (repeatable)')
+
+    def handle(self, *args, **options):
+        if not publisher.enabled:
+            self.stdout.write(self.style.WARNING(
+                'FRONTEND_REVALIDATE_URL/FRONTEND_REVALIDATE_TOKEN not set, nothing to do'
+            ))
+            return
+
+        if options['path']:
+            publisher.add_paths(options['path'])
+
+        if options['since_minutes']:
+            since = datetime.utcnow() - timedelta(minutes=options['since_minutes'])
+            categories, brands = set(), set()
+            for retailer_name, model in RETAILER_MODELS.items():
+                try:
+                    changed = model.objects(scraped_at__gte=since).only('id', 'category', 'brand')
+                    count = 0
+                    for product in changed:
+                        publisher.product_changed(product.id)
+                        categories.add(product.category)
+                        brands.add(product.brand)
+                        count += 1
+                    self.stdout.write(f'{retailer_name}: {count} changed products')
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'✗ {retailer_name} error: {e}'))
+
+            for category in filter(None, categories):
+                publisher.category_changed(category)
+            for brand in filter(None, brands):
+                publisher.brand_changed(brand)
+            if categories:
+                publisher.add_paths({'/'})
+
+        sent = publisher.flush()
+        self.stdout.write(self.style.SUCCESS(f'✓ Revalidated {sent} paths'))
+        self.stdout.write(f'Stats: {publisher.stats}')
@@ -0,0 +1,125 @@
+"""
+Django management command to send price alert emails.
+
+Loads the active alerts into an in-memory threshold index, walks each
+retailer collection by scraped_at from the job checkpoint in batches, and
+emails the alerts whose product (or GTIN) is now at or below their
+threshold (see products/alerts.py). The watermark is saved after each
+batch's emails are sent. Run it from cron after each scrape.
+
+The first run starts from the newest scraped product, so existing prices
+don't fire a flood of alerts.
+
+Usage:
+    python manage.py send_price_alerts
+    python manage.py send_price_alerts --dry-run  # match only, send nothing
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.alerts import AlertIndex, AlertMailer, deliver
+from products.checkpoints import load_checkpoint, save_checkpoint
+from products.models import RETAILER_MODELS
+
+CHECKPOINT = 'price_alerts'
+
+
+class Command(BaseCommand):
+    help = 'Email the price alerts triggered by newly scraped prices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Products per batch (and per checkpoint)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the triggered alerts without sending or checkpointing')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        watermarks, _ = load_checkpoint(CHECKPOINT)
+
+        started = time.monotonic()
+        index = AlertIndex.load()
+        self.stdout.write(f'{len(index)} active alerts indexed in {time.monotonic() - started:.2f}s')
+
+        triggered = delivered = 0
+        with AlertMailer.from_settings() as mailer:
+            for retailer_name, model in RETAILER_MODELS.items():
+                collection = model._get_collection()
+                if retailer_name not in watermarks:
+                    newest = collection.find_one(
+                        {'scraped_at': {'$ne': None}}, {'scraped_at': 1}, sort=[('scraped_at', -1)]
+                    )
+                    if newest is not None and not dry_run:
+                        watermarks[retailer_name] = newest['scraped_at']
+                        save_checkpoint(CHECKPOINT, watermarks)
+                    self.stdout.write(f'{retailer_name}: first run, starting from the newest product')
+                    continue
+
+                started = time.monotonic()
+                scanned = 0
+                batch = []
+                try:
+                    # $gte: see record_price_history; fired alerts are inactive,
+                    # so replaying the watermark's products sends nothing twice
+                    cursor = collection.find(
+                        {'scraped_at': {'$gte': watermarks[retailer_name]}},
+                        {'title': 1, 'gtin': 1, 'price': 1, 'scraped_at': 1},
+                    ).sort('scraped_at', 1)
+                    for doc in cursor.batch_size(batch_size):
+                        batch.append({
+                            'id': str(doc['_id']),
+                            'retailer': retailer_name,
+                            'title': doc.get('title'),
+                            'gtin': doc.get('gtin'),
+                            'price': doc.get('price'),
+                            'scraped_at': doc['scraped_at'],
+                        })
+                        if len(batch) >= batch_size:
+                            batch_triggered, batch_delivered = self._process(
+                                index, batch, mailer, watermarks, retailer_name, dry_run
+                            )
+                            triggered += batch_triggered
+                            delivered += batch_delivered
+                            scanned += len(batch)
+                            batch = []
+                    if batch:
+                        batch_triggered, batch_delivered = self._process(
+                            index, batch, mailer, watermarks, retailer_name, dry_run
+                        )
+                        triggered += batch_triggered
+                        delivered += batch_delivered
+                        scanned += len(batch)
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'✗ {retailer_name} error: {e}'))
+                    continue
+
+                self.stdout.write(
+                    f'{retailer_name}: {scanned} products scanned in {time.monotonic() - started:.1f}s'
+                )
+
+        self.stdout.write(
+            f'{triggered} alerts triggered, {delivered} delivered '
+            f'({mailer.stats["sent"]} emails, {mailer.stats["failed"]} failed, '
+            f'{mailer.stats["retries"]} retries)'
+        )
+        self.stdout.write(self.style.SUCCESS('✓ Price alerts processed'))
+
+    def _process(self, index, batch, mailer, watermarks, retailer_name, dry_run):
+        matches = index.match(batch)
+        if dry_run:
+            for alert_id, product in matches.items():
+                alert = index.alerts[alert_id]
+                self.stdout.write(
+                    f"  {alert['email']}: {product['title']} {product['price']} € "
+                    f"<= {alert['threshold']} €"
+                )
+            index.discard(matches)
+            return len(matches), 0
+
+        delivered = deliver(index, matches, mailer) if matches else 0
+        watermarks[retailer_name] = batch[-1]['scraped_at']
+        save_checkpoint(CHECKPOINT, watermarks)
+        return len(matches), delivered
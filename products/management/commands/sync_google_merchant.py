@@ -0,0 +1,72 @@
+"""
+Django management command to sync products to Google Merchant Center.
+
+Uploads only the products whose Merchant Center content changed since
+they were last synced (content hash per product), walking each retailer
+by scraped_at from the job checkpoint, and deletes products that no longer
+exist when a sweep is due (see products/merchant_sync.py). An interrupted
+run resumes from the last checkpointed batch. Run it from cron after each
+scrape.
+
+Usage:
+    python manage.py sync_google_merchant
+    python manage.py sync_google_merchant --retailer otto --dry-run
+    python manage.py sync_google_merchant --sweep   # force the deleted-products sweep
+    python manage.py sync_google_merchant --full    # rehash everything (uploads only changes)
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.google_merchant import get_merchant_service
+from products.merchant_sync import MerchantSync
+from products.models import RETAILER_MODELS
+
+
+class Command(BaseCommand):
+    help = 'Upload changed products to Google Merchant Center and delete vanished ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retailer', type=str, default='all',
+                            choices=['all'] + list(RETAILER_MODELS),
+                            help='Only sync one retailer')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Products per batch (default: MERCHANT_SYNC_BATCH_SIZE)')
+        parser.add_argument('--sweep', action='store_true',
+                            help='Sweep for deleted products even if not due')
+        parser.add_argument('--no-sweep', action='store_true',
+                            help='Skip the deleted-products sweep')
+        parser.add_argument('--full', action='store_true',
+                            help='Walk all products instead of resuming from the checkpoint')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be uploaded/deleted without calling the API')
+
+    def handle(self, *args, **options):
+        retailers = None if options['retailer'] == 'all' else [options['retailer']]
+
+        started = time.monotonic()
+        try:
+            service = None if options['dry_run'] else get_merchant_service()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ Could not initialize Google Merchant service: {e}'))
+            return
+        setup_seconds = time.monotonic() - started
+
+        sync = MerchantSync(service, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        sync.sync_changes(retailers, full=options['full'])
+        stats = sync.stats
+        self.stdout.write(
+            f"{stats['scanned']} products scanned: {stats['uploaded']} uploaded, "
+            f"{stats['unchanged']} unchanged, {stats['failed']} failed "
+            f"({stats['retried']} pending retried) in {time.monotonic() - started:.1f}s "
+            f"(setup {setup_seconds:.1f}s, upload {stats['upload_seconds']:.1f}s)"
+        )
+
+        if not options['no_sweep'] and (options['sweep'] or sync.sweep_due(retailers)):
+            started = time.monotonic()
+            sync.sweep_deleted(retailers)
+            self.stdout.write(f"Sweep: {stats['deleted']} deleted products removed in {time.monotonic() - started:.1f}s")
+
+        prefix = '(dry run) ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'✓ {prefix}Google Merchant Center sync finished'))
@@ -0,0 +1,95 @@
+"""
+Django management command to update the best-offer index.
+
+Finds the GTINs and product groups of products scraped since the last run
+(per-retailer scraped_at watermark, stored in the job checkpoint) and
+recomputes only their best offers, plus the keys queued by match_products
+when it rewrites product groups. Run it from cron after each scrape, and
+with --full now and then to drop offers of deleted products.
+
+Usage:
+    python manage.py update_best_offers
+    python manage.py update_best_offers --full
+"""
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from products.best_offers import CHECKPOINT, PENDING_KEYS, changed_keys, recompute_best_offers
+from products.checkpoints import load_checkpoint, pull_from_state, save_checkpoint
+from products.models import RETAILER_MODELS, BestOffer
+
+
+class Command(BaseCommand):
+    help = 'Update the cheapest offer per GTIN and product group'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every key and remove keys without offers')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        run_started = datetime.utcnow()
+        watermarks, state = load_checkpoint(CHECKPOINT)
+        pending = set(state.get(PENDING_KEYS) or [])
+        if full:
+            watermarks = {}
+
+        done = set()
+        total_keys = total_written = total_deleted = 0
+        for retailer_name, model in RETAILER_MODELS.items():
+            started = time.monotonic()
+            try:
+                keys, newest = changed_keys(model, watermarks.get(retailer_name), until=run_started)
+                # Keys recomputed for a previous retailer already include this one
+                keys -= done
+                written, deleted = recompute_best_offers(keys)
+                done |= keys
+            except Exception as e:
+                # Watermark not advanced: this retailer is retried next run
+                self.stdout.write(self.style.ERROR(f'✗ {retailer_name} error: {e}'))
+                continue
+
+            if newest is not None:
+                watermarks[retailer_name] = newest
+            save_checkpoint(CHECKPOINT, watermarks)
+
+            total_keys += len(keys)
+            total_written += written
+            total_deleted += deleted
+            self.stdout.write(
+                f'{retailer_name}: {len(keys)} changed keys, {written} offers written, '
+                f'{deleted} removed in {time.monotonic() - started:.1f}s'
+            )
+
+        if pending and not full:
+            # Keys queued by match_products (old and new product groups)
+            started = time.monotonic()
+            keys = pending - done
+            try:
+                written, deleted = recompute_best_offers(keys)
+            except Exception as e:
+                # Left in the queue: retried next run
+                self.stdout.write(self.style.ERROR(f'✗ queued keys error: {e}'))
+            else:
+                done |= keys
+                pull_from_state(CHECKPOINT, PENDING_KEYS, pending)
+                total_keys += len(keys)
+                total_written += written
+                total_deleted += deleted
+                self.stdout.write(
+                    f'queued: {len(keys)} keys, {written} offers written, '
+                    f'{deleted} removed in {time.monotonic() - started:.1f}s'
+                )
+
+        if full:
+            # Every current key was recomputed above
+            pull_from_state(CHECKPOINT, PENDING_KEYS, pending)
+            stale = BestOffer._get_collection().delete_many({'updated_at': {'$lt': run_started}})
+            total_deleted += stale.deleted_count
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {total_keys} keys recomputed: {total_written} offers written, {total_deleted} removed'
+        ))
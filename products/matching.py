@@ -0,0 +1,253 @@
+"""
+Cross-retailer product matching (offline, see the match_products command).
+
+Many Otto and Kaufland products have no GTIN, so `by_gtin` can't compare
+them. The matcher clusters equivalent products of different retailers:
+
+1. blocking: every product is put in one block per (brand, model number)
+   key, e.g. ('samsung', 'gq55q80c'); only products sharing a block are
+   compared, which keeps the number of comparisons far below n²/2. Products
+   with the same GTIN are also blocked together.
+2. pair decision (different retailers only): same GTIN is a match, two
+   different GTINs never are; otherwise the title shingle Jaccard similarity
+   (separators inside model numbers removed first) must reach MATCH_TITLE_THRESHOLD and the prices must be within
+   MATCH_MAX_PRICE_RATIO of each other.
+3. clustering: union-find over the matched pairs. Every cluster with products
+   of at least two retailers gets a product_group ID, written back to the
+   product documents (indexed), so "compare prices" is one lookup per
+   retailer.
+"""
+
+import hashlib
+import logging
+import re
+import time
+from itertools import combinations
+
+from .models import RETAILER_MODELS
+from .similarity import title_shingles
+from .text import normalize_name
+
+logger = logging.getLogger(__name__)
+
+MATCH_TITLE_THRESHOLD = 0.5
+MATCH_MAX_PRICE_RATIO = 2.0
+# Blocks larger than this are too generic to say anything (e.g. 'usb c')
+MAX_BLOCK_SIZE = 200
+
+_MODEL_RE = re.compile(r'[a-z0-9]+(?:[-/.][a-z0-9]+)*')
+_SEPARATOR_RE = re.compile(r'(?<=[a-z0-9])[-/.](?=[a-z0-9])')
+# Sizes and units look like model numbers but are shared by unrelated products
+_UNIT_RE = re.compile(r'^\d+(?:[.,]\d+)?(?:gb|tb|mb|w|kw|kg|g|l|ml|cm|mm|m|hz|zoll|mah|v|a|er|x)?$')
+
+
+def _collapse_separators(text):
+    """'gq-55q80c' -> 'gq55q80c', so model numbers compare equal however written"""
+    return _SEPARATOR_RE.sub('', normalize_name(text))
+
+
+def model_tokens(title):
+    """Model-number-like tokens of a title: letters and digits, units excluded.
+
+    'Samsung GQ-55Q80C 55 Zoll QLED' -> {'gq55q80c'}
+    """
+    tokens = set()
+    for raw in _MODEL_RE.findall(normalize_name(title)):
+        token = re.sub(r'[-/.]', '', raw)
+        if len(token) < 4 or _UNIT_RE.match(token):
+            continue
+        if any(c.isdigit() for c in token) and any(c.isalpha() for c in token):
+            tokens.add(token)
+    return tokens
+
+
+class UnionFind:
+    """Disjoint sets over hashable items (path halving, union by size)"""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item):
+        parent = self.parent
+        if item not in parent:
+            parent[item] = item
+            self.size[item] = 1
+            return item
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return list(groups.values())
+
+
+def load_products():
+    """{(retailer, id): record} of all products, with shingles and model tokens"""
+    products = {}
+    for retailer_name, model in RETAILER_MODELS.items():
+        cursor = model._get_collection().find(
+            {}, {'title': 1, 'brand': 1, 'gtin': 1, 'price': 1, 'product_group': 1}
+        )
+        for doc in cursor.batch_size(5000):
+            title = doc.get('title') or ''
+            products[(retailer_name, str(doc['_id']))] = {
+                'brand': normalize_name(doc.get('brand')),
+                'gtin': (doc.get('gtin') or '').strip().lstrip('0') or None,
+                'price': doc.get('price'),
+                'shingles': title_shingles(_collapse_separators(title)),
+                'models': model_tokens(title),
+                'product_group': doc.get('product_group'),
+            }
+    return products
+
+
+def _blocks(products, use_gtin=True):
+    blocks = {}
+    for key, product in products.items():
+        for token in product['models']:
+            blocks.setdefault(('model', product['brand'], token), []).append(key)
+        if use_gtin and product['gtin']:
+            blocks.setdefault(('gtin', product['gtin']), []).append(key)
+    return blocks
+
+
+def _is_match(a, b, use_gtin=True):
+    if use_gtin and a['gtin'] and b['gtin']:
+        return a['gtin'] == b['gtin']
+
+    union = len(a['shingles'] | b['shingles'])
+    if not union or len(a['shingles'] & b['shingles']) / union < MATCH_TITLE_THRESHOLD:
+        return False
+
+    if a['price'] and b['price']:
+        high, low = max(a['price'], b['price']), min(a['price'], b['price'])
+        if low <= 0 or high / low > MATCH_MAX_PRICE_RATIO:
+            return False
+    return True
+
+
+def match_products(products, use_gtin=True):
+    """Cluster equivalent products of different retailers.
+
+    Returns (groups, stats): groups is a list of member key lists (only
+    clusters spanning at least two retailers). With use_gtin=False GTINs are
+    ignored, which is how the matcher is evaluated against GTIN labels.
+    """
+    started = time.monotonic()
+    blocks = _blocks(products, use_gtin)
+    blocked_at = time.monotonic()
+
+    union_find = UnionFind()
+    compared = set()
+    comparisons = skipped_blocks = 0
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if len(members) > MAX_BLOCK_SIZE:
+            skipped_blocks += 1
+            continue
+        for a, b in combinations(members, 2):
+            if a[0] == b[0]:
+                continue  # same retailer
+            pair = (a, b) if a < b else (b, a)
+            if pair in compared:
+                continue
+            compared.add(pair)
+            comparisons += 1
+            if _is_match(products[a], products[b], use_gtin):
+                union_find.union(a, b)
+
+    groups = [
+        sorted(members) for members in union_find.groups()
+        if len({retailer_name for retailer_name, _ in members}) > 1
+    ]
+    finished = time.monotonic()
+
+    n = len(products)
+    stats = {
+        'products': n,
+        'blocks': len(blocks),
+        'skipped_blocks': skipped_blocks,
+        'comparisons': comparisons,
+        'all_pairs': n * (n - 1) // 2,
+        'groups': len(groups),
+        'grouped_products': sum(len(members) for members in groups),
+        'blocking_seconds': round(blocked_at - started, 3),
+        'matching_seconds': round(finished - blocked_at, 3),
+    }
+    return groups, stats
+
+
+def group_id(members):
+    """Stable group ID: derived from the smallest member reference"""
+    retailer_name, pk = min(members)
+    return hashlib.sha1(f'{retailer_name}:{pk}'.encode()).hexdigest()[:16]
+
+
+def _pairs(groups):
+    pairs = set()
+    for members in groups:
+        for a, b in combinations(sorted(members), 2):
+            pairs.add((a, b))
+    return pairs
+
+
+def evaluate(predicted_groups, labeled_groups):
+    """Pairwise precision/recall of predicted clusters on a labeled sample.
+
+    Only pairs between labeled products count: a predicted pair involving an
+    unlabeled product is neither right nor wrong.
+    """
+    labeled = {key for members in labeled_groups for key in members}
+    truth = _pairs(labeled_groups)
+    predicted = {
+        (a, b) for a, b in _pairs(predicted_groups)
+        if a in labeled and b in labeled and a[0] != b[0]
+    }
+    truth = {(a, b) for a, b in truth if a[0] != b[0]}
+    true_positives = len(predicted & truth)
+    return {
+        'labeled_products': len(labeled),
+        'true_pairs': len(truth),
+        'predicted_pairs': len(predicted),
+        'true_positives': true_positives,
+        'precision': round(true_positives / len(predicted), 4) if predicted else None,
+        'recall': round(true_positives / len(truth), 4) if truth else None,
+    }
+
+
+def gtin_label_groups(products):
+    """Labeled sample derived from GTINs: products sharing a GTIN are equivalent.
+
+    Every product with a GTIN is labeled (singletons included), so matching
+    it to a product with another GTIN counts as a false positive.
+    """
+    by_gtin = {}
+    for key, product in products.items():
+        if product['gtin']:
+            by_gtin.setdefault(product['gtin'], []).append(key)
+    return list(by_gtin.values())
+
+
+def assignments(groups):
+    """{(retailer, id): product_group} for all grouped products"""
+    result = {}
+    for members in groups:
+        gid = group_id(members)
+        for key in members:
+            result[key] = gid
+    return result
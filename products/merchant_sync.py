@@ -0,0 +1,233 @@
+"""
+Incremental Google Merchant Center sync.
+
+MerchantSyncState keeps, per product, the hash of the Content API product
+last uploaded. A run walks each retailer by (scraped_at, _id) from the
+job checkpoint, in batches, formats the scraped products and uploads only those
+whose hash changed (new products included), so it costs time proportional
+to the number of scraped products, not to the catalogue. Products whose
+upload failed are marked pending and retried first by the next run. The
+watermark is saved after each batch, so an interrupted run resumes there.
+
+Deleted products leave no trace to walk by, so they are found by a sweep
+(at most every MERCHANT_SYNC_SWEEP_INTERVAL): the synced product IDs and
+the existing product IDs of a retailer are both read sorted by _id and
+diffed in one merge pass; the missing ones are deleted from Merchant Center
+and from the sync state.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import DeleteOne, UpdateOne
+
+from .checkpoints import load_checkpoint, save_checkpoint
+from .google_merchant import format_product_for_google
+from .models import RETAILER_MODELS, MerchantSyncState
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = 'merchant_sync'
+
+MERCHANT_PROJECTION = {
+    'title': 1, 'description': 1, 'price': 1, 'image': 1,
+    'brand': 1, 'gtin': 1, 'category': 1, 'scraped_at': 1,
+}
+
+
+def product_data(doc):
+    """Product dict as the merchant service expects it"""
+    return {
+        'id': str(doc['_id']),
+        'title': doc.get('title'),
+        'description': doc.get('description'),
+        'price': doc.get('price'),
+        'image': doc.get('image'),
+        'brand': doc.get('brand'),
+        'gtin': doc.get('gtin'),
+        'category': doc.get('category'),
+    }
+
+
+def content_hash(data):
+    """Hash of the Content API product a product dict is uploaded as"""
+    google_product = format_product_for_google(data)
+    return hashlib.sha1(json.dumps(google_product, sort_keys=True).encode()).hexdigest()
+
+
+class MerchantSync:
+    """One sync run; `stats` counts what it did"""
+
+    def __init__(self, service, batch_size=None, dry_run=False):
+        self.service = service
+        self.batch_size = batch_size or getattr(settings, 'MERCHANT_SYNC_BATCH_SIZE', 500)
+        self.dry_run = dry_run
+        self.stats = {
+            'scanned': 0, 'unchanged': 0, 'uploaded': 0, 'failed': 0,
+            'retried': 0, 'deleted': 0, 'swept': False, 'upload_seconds': 0.0,
+        }
+
+    def _sync_batch(self, retailer_name, docs):
+        """Upload the changed products of a batch of documents"""
+        collection = MerchantSyncState._get_collection()
+        ids = [str(doc['_id']) for doc in docs]
+        known = {
+            state['_id']: state.get('content_hash')
+            for state in collection.find({'_id': {'$in': ids}}, {'content_hash': 1})
+        }
+
+        changed = []
+        for doc in docs:
+            data = product_data(doc)
+            digest = content_hash(data)
+            if known.get(data['id']) == digest:
+                self.stats['unchanged'] += 1
+            else:
+                changed.append((data, digest))
+        self.stats['scanned'] += len(docs)
+        if not changed or self.dry_run:
+            self.stats['uploaded'] += len(changed)
+            return
+
+        started = time.monotonic()
+        result = self.service.batch_insert_products([data for data, _ in changed])
+        self.stats['upload_seconds'] += time.monotonic() - started
+        failed = set(result.get('failed_products') or [])
+        now = datetime.utcnow()
+        operations = []
+        for data, digest in changed:
+            if data['id'] in failed:
+                update = {'retailer': retailer_name, 'pending': True}
+            else:
+                update = {'retailer': retailer_name, 'content_hash': digest, 'synced_at': now, 'pending': False}
+            operations.append(UpdateOne({'_id': data['id']}, {'$set': update}, upsert=True))
+        collection.bulk_write(operations, ordered=False)
+        self.stats['uploaded'] += len(changed) - len(failed)
+        self.stats['failed'] += len(failed)
+
+    def _retry_pending(self, retailer_name, model):
+        pending = [
+            state['_id'] for state in MerchantSyncState._get_collection().find(
+                {'retailer': retailer_name, 'pending': True}, {'_id': 1}
+            )
+        ]
+        for i in range(0, len(pending), self.batch_size):
+            ids = [ObjectId(pk) for pk in pending[i:i + self.batch_size] if ObjectId.is_valid(pk)]
+            docs = list(model._get_collection().find({'_id': {'$in': ids}}, MERCHANT_PROJECTION))
+            self.stats['retried'] += len(docs)
+            if docs:
+                self._sync_batch(retailer_name, docs)
+
+    def sync_changes(self, retailers=None, max_products=None, full=False):
+        """Upload what changed since the checkpoint (since ever with full=True);
+        returns the stats"""
+        watermarks, state = load_checkpoint(CHECKPOINT)
+        for retailer_name, model in RETAILER_MODELS.items():
+            if retailers and retailer_name not in retailers:
+                continue
+            # Plain dict: the loaded one is bound to the checkpoint document
+            last_ids = state['last_ids'] = dict(state.get('last_ids') or {})
+            if full:
+                watermarks.pop(retailer_name, None)
+                last_ids.pop(retailer_name, None)
+            self._retry_pending(retailer_name, model)
+
+            # The position is (scraped_at, _id): a bulk scrape stamps many
+            # products with the same scraped_at, more than max_products may
+            # share it, so a scraped_at watermark alone would never advance
+            query = {}
+            watermark, last_id = watermarks.get(retailer_name), last_ids.get(retailer_name)
+            if watermark and last_id:
+                query = {'$or': [
+                    {'scraped_at': {'$gt': watermark}},
+                    {'scraped_at': watermark, '_id': {'$gt': ObjectId(last_id)}},
+                ]}
+            elif watermark:
+                # Checkpoint from before the _id tiebreaker
+                query = {'scraped_at': {'$gte': watermark}}
+            cursor = model._get_collection().find(query, MERCHANT_PROJECTION).sort(
+                [('scraped_at', 1), ('_id', 1)]
+            )
+            if max_products:
+                cursor = cursor.limit(max_products)
+
+            batch = []
+            for doc in cursor.batch_size(self.batch_size):
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    self._finish_batch(retailer_name, batch, watermarks, state)
+                    batch = []
+            if batch:
+                self._finish_batch(retailer_name, batch, watermarks, state)
+        return self.stats
+
+    def _finish_batch(self, retailer_name, batch, watermarks, state):
+        self._sync_batch(retailer_name, batch)
+        scraped_at = batch[-1].get('scraped_at')
+        if scraped_at is not None and not self.dry_run:
+            watermarks[retailer_name] = scraped_at
+            state['last_ids'][retailer_name] = str(batch[-1]['_id'])
+            save_checkpoint(CHECKPOINT, watermarks, state)
+
+    def sweep_deleted(self, retailers=None):
+        """Delete the synced products that no longer exist; returns the stats"""
+        collection = MerchantSyncState._get_collection()
+        for retailer_name, model in RETAILER_MODELS.items():
+            if retailers and retailer_name not in retailers:
+                continue
+            synced = (state['_id'] for state in collection.find(
+                {'retailer': retailer_name}, {'_id': 1}
+            ).sort('_id', 1).batch_size(10000))
+            # ObjectId order is the order of their hex strings
+            existing = (str(doc['_id']) for doc in model._get_collection().find(
+                {}, {'_id': 1}
+            ).sort('_id', 1).batch_size(10000))
+
+            operations = []
+            for pk in _missing(synced, existing):
+                # delete_product is also True when Merchant Center never had it (404)
+                if self.dry_run or self.service.delete_product(pk):
+                    operations.append(DeleteOne({'_id': pk}))
+                else:
+                    self.stats['failed'] += 1
+            if operations and not self.dry_run:
+                collection.bulk_write(operations, ordered=False)
+            self.stats['deleted'] += len(operations)
+
+        if not self.dry_run:
+            watermarks, state = load_checkpoint(CHECKPOINT)
+            last_sweeps = state['last_sweeps'] = dict(state.get('last_sweeps') or {})
+            now = datetime.utcnow()
+            for retailer_name in RETAILER_MODELS:
+                if not retailers or retailer_name in retailers:
+                    last_sweeps[retailer_name] = now
+            save_checkpoint(CHECKPOINT, watermarks, state)
+        self.stats['swept'] = True
+        return self.stats
+
+    def sweep_due(self, retailers=None):
+        """Whether any of the retailers was last swept over an interval ago"""
+        _, state = load_checkpoint(CHECKPOINT)
+        last_sweeps = state.get('last_sweeps') or {}
+        interval = timedelta(seconds=getattr(settings, 'MERCHANT_SYNC_SWEEP_INTERVAL', 24 * 3600))
+        now = datetime.utcnow()
+        return any(
+            last_sweeps.get(retailer_name) is None or now - last_sweeps[retailer_name] >= interval
+            for retailer_name in RETAILER_MODELS
+            if not retailers or retailer_name in retailers
+        )
+
+
+def _missing(synced, existing):
+    """Items of sorted iterator `synced` that are not in sorted iterator `existing`"""
+    current = next(existing, None)
+    for pk in synced:
+        while current is not None and current < pk:
+            current = next(existing, None)
+        if current != pk:
+            yield pk
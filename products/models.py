@@ -1,6 +1,6 @@
 from mongoengine import (
     Document, StringField, URLField, DateTimeField,
-    FloatField, IntField
+    FloatField, IntField, ListField, DictField, BooleanField, BinaryField
 )
 from datetime import datetime
 
@@ -22,6 +22,10 @@ class SaturnProduct(Document):
     url = URLField(required=True)
     produktbeschreibung = StringField(null=True, blank=True, db_field='Produktbeschreibung')
     produktdaten = StringField(null=True, blank=True, db_field='Produktdaten')
+    # Cross-retailer group of equivalent products (match_products)
+    product_group = StringField(max_length=32, null=True, blank=True)
+    # Numeric discount derived from old_price/price/discount (backfill_discounts)
+    discount_pct = FloatField(null=True, blank=True)
 
     meta = {
         'collection': 'Db',
@@ -32,6 +36,10 @@ class SaturnProduct(Document):
             'category',
             'brand',
             'scraped_at',
+            ('scraped_at', '_id'),
+            {'fields': ['product_group'], 'sparse': True},
+            ('category', '-discount_pct'),
+            '-discount_pct',
         ]
     }
 
@@ -56,6 +64,10 @@ class MediaMarktProduct(Document):
     url = URLField(required=True)
     produktbeschreibung = StringField(null=True, blank=True, db_field='Produktbeschreibung')
     produktdaten = StringField(null=True, blank=True, db_field='Produktdaten')
+    # Cross-retailer group of equivalent products (match_products)
+    product_group = StringField(max_length=32, null=True, blank=True)
+    # Numeric discount derived from old_price/price/discount (backfill_discounts)
+    discount_pct = FloatField(null=True, blank=True)
 
     meta = {
         'collection': 'Db',
@@ -66,6 +78,10 @@ class MediaMarktProduct(Document):
             'category',
             'brand',
             'scraped_at',
+            ('scraped_at', '_id'),
+            {'fields': ['product_group'], 'sparse': True},
+            ('category', '-discount_pct'),
+            '-discount_pct',
         ]
     }
 
@@ -90,6 +106,10 @@ class OttoProduct(Document):
     url = URLField(required=True)
     produktbeschreibung = StringField(null=True, blank=True, db_field='Produktbeschreibung')
     produktdaten = StringField(null=True, blank=True, db_field='Produktdaten')
+    # Cross-retailer group of equivalent products (match_products)
+    product_group = StringField(max_length=32, null=True, blank=True)
+    # Numeric discount derived from old_price/price/discount (backfill_discounts)
+    discount_pct = FloatField(null=True, blank=True)
 
     meta = {
         'collection': 'Db',
@@ -100,6 +120,10 @@ class OttoProduct(Document):
             'category',
             'brand',
             'scraped_at',
+            ('scraped_at', '_id'),
+            {'fields': ['product_group'], 'sparse': True},
+            ('category', '-discount_pct'),
+            '-discount_pct',
         ]
     }
 
@@ -124,6 +148,10 @@ class KauflandProduct(Document):
     url = URLField(required=True)
     produktbeschreibung = StringField(null=True, blank=True, db_field='Produktbeschreibung')
     produktdaten = StringField(null=True, blank=True, db_field='Produktdaten')
+    # Cross-retailer group of equivalent products (match_products)
+    product_group = StringField(max_length=32, null=True, blank=True)
+    # Numeric discount derived from old_price/price/discount (backfill_discounts)
+    discount_pct = FloatField(null=True, blank=True)
 
     meta = {
         'collection': 'Db',
@@ -134,8 +162,191 @@ class KauflandProduct(Document):
             'category',
             'brand',
             'scraped_at',
+            ('scraped_at', '_id'),
+            {'fields': ['product_group'], 'sparse': True},
+            ('category', '-discount_pct'),
+            '-discount_pct',
         ]
     }
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+# Retailer name -> product document, in the order retailers are queried
+RETAILER_MODELS = {
+    'saturn': SaturnProduct,
+    'mediamarkt': MediaMarktProduct,
+    'otto': OttoProduct,
+    'kaufland': KauflandProduct,
+}
+
+
+# --- Derived data (precomputed by management commands) ----------------------
+
+class SimilarProducts(Document):
+    """Precomputed similar products of one product (precompute_similar)"""
+    product_id = StringField(primary_key=True)
+    retailer = StringField(max_length=20)
+    # 'retailer:id' references, best match first, with their scores
+    similar = ListField(StringField())
+    scores = ListField(FloatField())
+    computed_at = DateTimeField()
+
+    meta = {
+        'collection': 'similar_products',
+        'db_alias': 'derived',
+        'indexes': [
+            'computed_at',
+        ]
+    }
+
+
+class JobCheckpoint(Document):
+    """Progress of an incremental batch job: scraped_at watermark per retailer"""
+    name = StringField(primary_key=True)
+    watermarks = DictField()
+    state = DictField()
+    updated_at = DateTimeField()
+
+    meta = {
+        'collection': 'job_checkpoints',
+        'db_alias': 'derived',
+    }
+
+
+class BestOffer(Document):
+    """Cheapest current offer of a GTIN or product group (update_best_offers)"""
+    # 'gtin:<gtin without leading zeros>' or 'group:<product_group>'
+    key = StringField(primary_key=True)
+    # [{'retailer', 'id', 'price'}], cheapest first
+    offers = ListField(DictField())
+    best_retailer = StringField(max_length=20)
+    best_product_id = StringField()
+    best_price = FloatField()
+    max_price = FloatField()
+    spread = FloatField()
+    offer_count = IntField()
+    updated_at = DateTimeField()
+
+    meta = {
+        'collection': 'best_offers',
+        'db_alias': 'derived',
+        'indexes': [
+            'updated_at',
+        ]
+    }
+
+
+class PriceHistoryChunk(Document):
+    """Up to HISTORY_CHUNK_SIZE price observations of one product (price_history.py)"""
+    product_id = StringField(required=True)
+    retailer = StringField(max_length=20)
+    start = DateTimeField(required=True)
+    end = DateTimeField(required=True)
+    count = IntField()
+    last_price = FloatField()
+    # Only the latest chunk of a product is appended to
+    is_latest = BooleanField(default=True)
+    # Packed little-endian arrays: uint32 second deltas, float32 prices
+    times = BinaryField()
+    prices = BinaryField()
+
+    meta = {
+        'collection': 'price_history',
+        'db_alias': 'derived',
+        'indexes': [
+            ('product_id', 'start'),
+        ]
+    }
+
+
+class PriceRollup(Document):
+    """Daily or weekly min/max/last prices of one product (price_history.py)"""
+    # "<product_id>:<resolution>"
+    key = StringField(primary_key=True)
+    product_id = StringField(required=True)
+    resolution = StringField(choices=('day', 'week'))
+    # Packed little-endian arrays: uint32 bucket numbers, float32 prices
+    buckets = BinaryField()
+    mins = BinaryField()
+    maxs = BinaryField()
+    lasts = BinaryField()
+    # Last observation folded in
+    end = DateTimeField()
+    updated_at = DateTimeField()
+
+    meta = {
+        'collection': 'price_rollups',
+        'db_alias': 'derived',
+    }
+
+
+class PriceDropEvent(Document):
+    """A price decrease detected by record_price_history (price_drops.py)"""
+    # "<product_id>:<epoch seconds>": replaying a batch rewrites the same event
+    key = StringField(primary_key=True)
+    product_id = StringField(required=True)
+    retailer = StringField(max_length=20)
+    old_price = FloatField()
+    price = FloatField()
+    drop = FloatField()
+    drop_pct = FloatField()
+    # scraped_at of the observation with the lower price
+    detected_at = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'price_drops',
+        'db_alias': 'derived',
+        'indexes': [
+            ('retailer', '-detected_at'),
+            # Old events expire (also serves the "latest drops" sort)
+            {'fields': ['detected_at'], 'expireAfterSeconds': 90 * 24 * 3600},
+        ]
+    }
+
+
+class PriceAlert(Document):
+    """"Notify me below X €" subscription on a product or a GTIN (alerts.py)"""
+    email = StringField(required=True, max_length=254)
+    # Exactly one of product_id (with its retailer) and gtin (normalized)
+    product_id = StringField()
+    retailer = StringField(max_length=20)
+    gtin = StringField(max_length=14)
+    threshold = FloatField(required=True)
+    # Secret of the unsubscribe link
+    token = StringField(required=True, unique=True)
+    active = BooleanField(default=True)
+    created_at = DateTimeField()
+    triggered_at = DateTimeField()
+    triggered_price = FloatField()
+    triggered_product = StringField()
+
+    meta = {
+        'collection': 'price_alerts',
+        'db_alias': 'derived',
+        'indexes': [
+            'active',
+            'email',
+        ]
+    }
+
+
+class MerchantSyncState(Document):
+    """What was last uploaded to Merchant Center for a product (merchant_sync.py)"""
+    # Product ID (the Merchant Center offerId)
+    product_id = StringField(primary_key=True)
+    retailer = StringField(max_length=20)
+    # Hash of the uploaded Content API product, None until an upload succeeded
+    content_hash = StringField()
+    synced_at = DateTimeField()
+    # Last upload failed: retried by the next run
+    pending = BooleanField(default=False)
+
+    meta = {
+        'collection': 'merchant_sync',
+        'db_alias': 'derived',
+        'indexes': [
+            ('retailer', 'pending'),
+        ]
+    }
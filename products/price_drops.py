@@ -0,0 +1,99 @@
+"""
+Price drops: products that just got cheaper.
+
+record_price_history already walks the retailer collections by scraped_at
+watermark and compares every price with the product's last recorded one
+(the latest PriceHistoryChunk), so drops are detected there, in time
+proportional to the number of scraped products, and share its checkpoint.
+Every decrease of at least PRICE_DROP_MIN_PCT percent is stored as a
+PriceDropEvent (derived database, expiring after 90 days). Event IDs are
+derived from the product and the observation time, so replaying a batch
+after a crash rewrites the same events instead of duplicating them.
+"""
+
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from pymongo import ReplaceOne
+
+from .cache import cache
+from .lookup import get_products_data
+from .models import PriceDropEvent
+
+logger = logging.getLogger(__name__)
+
+
+def drop_event(product_id, retailer, ts, old_price, price, detected_at):
+    """PriceDropEvent document of a price change, None unless it is a large enough drop"""
+    if old_price is None or old_price <= 0 or price >= old_price:
+        return None
+    drop_pct = (old_price - price) / old_price * 100
+    if drop_pct < getattr(settings, 'PRICE_DROP_MIN_PCT', 1.0):
+        return None
+    return {
+        '_id': f'{product_id}:{ts}',
+        'product_id': product_id,
+        'retailer': retailer,
+        'old_price': round(old_price, 2),
+        'price': round(price, 2),
+        'drop': round(old_price - price, 2),
+        'drop_pct': round(drop_pct, 1),
+        'detected_at': detected_at,
+    }
+
+
+def record_drops(events):
+    """Store drop events (idempotent)"""
+    if events:
+        PriceDropEvent._get_collection().bulk_write(
+            [ReplaceOne({'_id': event['_id']}, event, upsert=True) for event in events],
+            ordered=False,
+        )
+
+
+def get_price_drops(since, retailer='all', min_pct=0, limit=24):
+    """Latest drops since a datetime, newest first, with the current product data.
+
+    Products that no longer exist are left out.
+    """
+    cache_params = f"{since:%Y-%m-%dT%H}:{retailer}:{min_pct}:{limit}"
+    cache_key = f"price_drops_{hashlib.md5(cache_params.encode()).hexdigest()}"
+    drops = cache.get(cache_key)
+    if drops is not None:
+        return drops
+
+    started = time.monotonic()
+    query = {'detected_at': {'$gte': since}}
+    if retailer != 'all':
+        query['retailer'] = retailer
+    if min_pct:
+        query['drop_pct'] = {'$gte': min_pct}
+    events = list(
+        PriceDropEvent._get_collection().find(query).sort('detected_at', -1).limit(limit)
+    )
+
+    products = {
+        product['id']: product
+        for product in get_products_data([(event['retailer'], event['product_id']) for event in events])
+    }
+    drops = []
+    for event in events:
+        product = products.get(event['product_id'])
+        if product is None:
+            continue
+        drops.append({
+            'product': product,
+            'old_price': event['old_price'],
+            'price': event['price'],
+            'drop': event['drop'],
+            'drop_pct': event['drop_pct'],
+            'detected_at': event['detected_at'].isoformat(),
+        })
+
+    cache.set(
+        cache_key, drops, getattr(settings, 'CACHE_PRICE_DROPS_DURATION', 300),
+        cost=time.monotonic() - started,
+    )
+    return drops
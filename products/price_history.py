@@ -0,0 +1,392 @@
+"""
+Append-only price history.
+
+Product documents only hold the latest price, so every scrape overwrites
+the previous one. The record_price_history command walks the retailer
+collections by scraped_at watermark and appends an observation (timestamp,
+price) to the history of every product whose price changed.
+
+Storage is columnar and chunked per product (PriceHistoryChunk, derived
+database): each chunk holds up to HISTORY_CHUNK_SIZE observations as two
+packed arrays, timestamps as uint32 second deltas from the previous one and
+prices as float32, i.e. 8 bytes per observation. Only the latest chunk of a
+product is ever rewritten. A time window is read with an indexed range query
+on the chunk bounds and only the matching chunks are decoded.
+
+Long windows are served from rollups instead (PriceRollup): per product and
+resolution (day, week) the min, max and last price of every bucket, packed
+the same way. They are updated together with the chunks, so a 1-year chart
+reads one document of at most 366 buckets whatever the number of
+observations. A bucket's min/max include the price carried over from the
+previous bucket, since that price was current when the bucket started.
+"""
+
+import logging
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+
+from .models import PriceHistoryChunk, PriceRollup
+from .price_drops import drop_event, record_drops
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CHUNK_SIZE = 512
+
+ROLLUP_RESOLUTIONS = ('day', 'week')
+# Points a history response aims to stay under
+HISTORY_MAX_POINTS = 300
+# Raw observations are assumed to be at most about one per hour
+RAW_POINT_SECONDS = 3600
+# Products whose rollups are rebuilt per bulk write
+ROLLUP_REBUILD_BATCH = 1000
+
+DAY = 86400
+# Epoch day 0 is a Thursday: shift so that weeks start on Monday
+_WEEK_SHIFT = 3
+
+
+def _pack(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode, data):
+    values = array(typecode)
+    values.frombytes(data or b'')
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def to_timestamp(dt):
+    """Epoch seconds of a naive UTC (as stored by MongoDB) or aware datetime"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def from_timestamp(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None)
+
+
+class Chunk:
+    """Decoded chunk: absolute timestamps and prices as arrays"""
+
+    def __init__(self, doc=None, product_id=None, retailer=None):
+        self.doc = doc
+        if doc is not None:
+            self.product_id = doc['product_id']
+            self.retailer = doc.get('retailer')
+            start = to_timestamp(doc['start'])
+            deltas = _unpack('I', doc.get('times'))
+            self.times = array('q')
+            ts = start
+            for delta in deltas:
+                ts += delta
+                self.times.append(ts)
+            self.prices = _unpack('f', doc.get('prices'))
+        else:
+            self.product_id = product_id
+            self.retailer = retailer
+            self.times = array('q')
+            self.prices = array('f')
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def last_price(self):
+        return self.prices[-1] if self.prices else None
+
+    @property
+    def full(self):
+        return len(self.times) >= HISTORY_CHUNK_SIZE
+
+    def append(self, ts, price):
+        self.times.append(ts)
+        self.prices.append(price)
+
+    def window(self, start_ts, end_ts):
+        """(timestamps, prices) of the observations within [start_ts, end_ts]"""
+        lo = bisect_left(self.times, start_ts)
+        hi = bisect_right(self.times, end_ts)
+        return self.times[lo:hi], self.prices[lo:hi]
+
+    def encode(self, is_latest=True):
+        """Fields of the chunk document"""
+        start = self.times[0]
+        deltas = array('I', [0])
+        deltas.extend(b - a for a, b in zip(self.times, self.times[1:]))
+        return {
+            'product_id': self.product_id,
+            'retailer': self.retailer,
+            'start': from_timestamp(start),
+            'end': from_timestamp(self.times[-1]),
+            'count': len(self.times),
+            'last_price': float(self.prices[-1]),
+            'is_latest': is_latest,
+            'times': _pack(deltas),
+            'prices': _pack(self.prices),
+        }
+
+
+def bucket_of(ts, resolution):
+    """Bucket number of an epoch timestamp: days, or Monday-based weeks"""
+    day = ts // DAY
+    return day if resolution == 'day' else (day + _WEEK_SHIFT) // 7
+
+
+def bucket_start(bucket, resolution):
+    """Epoch timestamp at which a bucket starts"""
+    return bucket * DAY if resolution == 'day' else (bucket * 7 - _WEEK_SHIFT) * DAY
+
+
+class Rollup:
+    """Decoded rollup: bucket numbers with the min, max and last price of each"""
+
+    def __init__(self, doc=None, product_id=None, resolution=None):
+        self.product_id = doc['product_id'] if doc is not None else product_id
+        self.resolution = doc['resolution'] if doc is not None else resolution
+        doc = doc or {}
+        self.buckets = _unpack('I', doc.get('buckets'))
+        self.mins = _unpack('f', doc.get('mins'))
+        self.maxs = _unpack('f', doc.get('maxs'))
+        self.lasts = _unpack('f', doc.get('lasts'))
+        self.end = to_timestamp(doc['end']) if doc.get('end') else None
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def add(self, ts, price):
+        """Fold an observation in (older than the last one folded: ignored)"""
+        if self.end is not None and ts <= self.end:
+            return
+        self.end = ts
+        bucket = bucket_of(ts, self.resolution)
+        if self.buckets and self.buckets[-1] == bucket:
+            self.mins[-1] = min(self.mins[-1], price)
+            self.maxs[-1] = max(self.maxs[-1], price)
+            self.lasts[-1] = price
+            return
+        carried = self.lasts[-1] if self.lasts else price
+        self.buckets.append(bucket)
+        self.mins.append(min(carried, price))
+        self.maxs.append(max(carried, price))
+        self.lasts.append(price)
+
+    def window(self, start_ts, end_ts):
+        """(bucket start timestamps, mins, maxs, lasts) of the buckets overlapping a window.
+
+        Buckets only exist where the price changed: when the window's first
+        bucket has none, the last price of the bucket before it is carried
+        in as that first bucket.
+        """
+        first = bucket_of(start_ts, self.resolution)
+        lo = bisect_left(self.buckets, first)
+        hi = bisect_right(self.buckets, bucket_of(end_ts, self.resolution))
+        starts = array('q', (bucket_start(bucket, self.resolution) for bucket in self.buckets[lo:hi]))
+        mins, maxs, lasts = self.mins[lo:hi], self.maxs[lo:hi], self.lasts[lo:hi]
+        if lo > 0 and (lo == hi or self.buckets[lo] != first) and start_ts <= end_ts:
+            carried = self.lasts[lo - 1]
+            starts.insert(0, bucket_start(first, self.resolution))
+            mins.insert(0, carried)
+            maxs.insert(0, carried)
+            lasts.insert(0, carried)
+        return starts, mins, maxs, lasts
+
+    def encode(self):
+        """Rollup document"""
+        return {
+            '_id': rollup_key(self.product_id, self.resolution),
+            'product_id': self.product_id,
+            'resolution': self.resolution,
+            'buckets': _pack(self.buckets),
+            'mins': _pack(self.mins),
+            'maxs': _pack(self.maxs),
+            'lasts': _pack(self.lasts),
+            'end': from_timestamp(self.end) if self.end is not None else None,
+            'updated_at': datetime.utcnow(),
+        }
+
+
+def rollup_key(product_id, resolution):
+    return f'{product_id}:{resolution}'
+
+
+def update_rollups(added):
+    """Fold {product_id: [(ts, price)]} (oldest first) into the rollups"""
+    collection = PriceRollup._get_collection()
+    keys = [rollup_key(product_id, resolution) for product_id in added for resolution in ROLLUP_RESOLUTIONS]
+    existing = {doc['_id']: doc for doc in collection.find({'_id': {'$in': keys}})}
+
+    operations = []
+    for product_id, observations in added.items():
+        for resolution in ROLLUP_RESOLUTIONS:
+            doc = existing.get(rollup_key(product_id, resolution))
+            rollup = Rollup(doc) if doc is not None else Rollup(product_id=product_id, resolution=resolution)
+            for ts, price in observations:
+                rollup.add(ts, price)
+            document = rollup.encode()
+            operations.append(ReplaceOne({'_id': document['_id']}, document, upsert=True))
+    collection.bulk_write(operations, ordered=False)
+
+
+def rebuild_rollups():
+    """Recompute all rollups from the raw chunks. Returns the number of products"""
+    chunks = PriceHistoryChunk._get_collection().find({}, {'is_latest': 0}).sort(
+        [('product_id', 1), ('start', 1)]
+    )
+    collection = PriceRollup._get_collection()
+    operations, products, current = [], 0, None
+
+    def flush(rollups):
+        operations.extend(
+            ReplaceOne({'_id': rollup_key(r.product_id, r.resolution)}, r.encode(), upsert=True)
+            for r in rollups
+        )
+
+    rollups = []
+    for doc in chunks.batch_size(1000):
+        if doc['product_id'] != current:
+            flush(rollups)
+            if len(operations) >= ROLLUP_REBUILD_BATCH * len(ROLLUP_RESOLUTIONS):
+                collection.bulk_write(operations, ordered=False)
+                operations = []
+            current = doc['product_id']
+            rollups = [Rollup(product_id=current, resolution=resolution) for resolution in ROLLUP_RESOLUTIONS]
+            products += 1
+        chunk = Chunk(doc)
+        for ts, price in zip(chunk.times, chunk.prices):
+            for rollup in rollups:
+                rollup.add(ts, price)
+    flush(rollups)
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return products
+
+
+def append_observations(observations):
+    """Append (product_id, retailer, scraped_at, price) observations.
+
+    An observation is only stored when the price differs from the product's
+    last recorded price and is newer than its last observation, so replaying
+    a batch (e.g. after a crash) does not duplicate anything. Price drops
+    are recorded as PriceDropEvents. Returns (observations stored, drops).
+    """
+    collection = PriceHistoryChunk._get_collection()
+    product_ids = list({product_id for product_id, _, _, _ in observations})
+    latest = {
+        doc['product_id']: Chunk(doc)
+        for doc in collection.find({'product_id': {'$in': product_ids}, 'is_latest': True})
+    }
+
+    # Chunk each product appends to, and chunks that filled up in this batch
+    pending, finished = {}, []
+    added = {}
+    drops = []
+    stored = 0
+    for product_id, retailer, scraped_at, price in sorted(observations, key=lambda o: o[2]):
+        if price is None or scraped_at is None:
+            continue
+        ts = to_timestamp(scraped_at)
+        chunk = pending.get(product_id)
+        if chunk is None:
+            chunk = latest.get(product_id)
+        if chunk is not None and len(chunk):
+            # float32 storage: compare at that precision
+            if ts <= chunk.times[-1] or array('f', [price])[0] == chunk.last_price:
+                continue
+            event = drop_event(product_id, retailer, ts, chunk.last_price, price, scraped_at)
+            if event is not None:
+                drops.append(event)
+        if chunk is None or chunk.full:
+            if chunk is not None:
+                finished.append(chunk)
+            chunk = Chunk(product_id=product_id, retailer=retailer)
+        chunk.append(ts, price)
+        pending[product_id] = chunk
+        added.setdefault(product_id, []).append((ts, price))
+        stored += 1
+
+    def write(chunk, is_latest):
+        if chunk.doc is None:
+            return InsertOne(dict(chunk.encode(is_latest), _id=ObjectId()))
+        return UpdateOne({'_id': chunk.doc['_id']}, {'$set': chunk.encode(is_latest)})
+
+    # Rollups and drops first: if the chunk write fails the batch is
+    # replayed, rollups skip what they already hold and drops are rewritten
+    if added:
+        update_rollups(added)
+    record_drops(drops)
+
+    operations = [write(chunk, False) for chunk in finished]
+    operations += [write(chunk, True) for chunk in pending.values()]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return stored, len(drops)
+
+
+def _price_before(product_id, start_ts):
+    """Last observed price of a product before a timestamp (None if none)"""
+    # Chunks don't overlap: the last one starting earlier holds that observation
+    doc = PriceHistoryChunk._get_collection().find_one(
+        {'product_id': str(product_id), 'start': {'$lt': from_timestamp(start_ts)}},
+        {'is_latest': 0},
+        sort=[('start', -1)],
+    )
+    if doc is None:
+        return None
+    chunk = Chunk(doc)
+    i = bisect_left(chunk.times, start_ts)
+    return chunk.prices[i - 1] if i else None
+
+
+def get_history(product_id, start, end):
+    """(timestamps, prices) of a product between two datetimes, oldest first.
+
+    Only price changes are stored, so the price in effect at `start` (the
+    last observation before it) opens the series, stamped `start`.
+    """
+    start_ts, end_ts = to_timestamp(start), to_timestamp(end)
+    docs = PriceHistoryChunk._get_collection().find(
+        {'product_id': str(product_id), 'start': {'$lte': end}, 'end': {'$gte': start}},
+        {'is_latest': 0},
+    ).sort('start', 1)
+
+    times, prices = array('q'), array('f')
+    for doc in docs:
+        chunk_times, chunk_prices = Chunk(doc).window(start_ts, end_ts)
+        times.extend(chunk_times)
+        prices.extend(chunk_prices)
+
+    if (not times or times[0] > start_ts) and start_ts <= end_ts:
+        carried = _price_before(product_id, start_ts)
+        if carried is not None:
+            times.insert(0, start_ts)
+            prices.insert(0, carried)
+    return times, prices
+
+
+def choose_resolution(start, end):
+    """Finest resolution that keeps a window under about HISTORY_MAX_POINTS points"""
+    seconds = (end - start).total_seconds()
+    if seconds <= HISTORY_MAX_POINTS * RAW_POINT_SECONDS:
+        return 'raw'
+    if seconds <= HISTORY_MAX_POINTS * DAY:
+        return 'day'
+    return 'week'
+
+
+def get_rollup(product_id, resolution, start, end):
+    """(bucket start timestamps, mins, maxs, lasts) of a product between two datetimes"""
+    doc = PriceRollup._get_collection().find_one({'_id': rollup_key(product_id, resolution)})
+    if doc is None:
+        return array('q'), array('f'), array('f'), array('f')
+    return Rollup(doc).window(to_timestamp(start), to_timestamp(end))
@@ -0,0 +1,99 @@
+"""
+Shared product filters.
+
+The list endpoint, the search facets and the other aggregation endpoints all
+need the same per-retailer filter (category, brand, search, price range), so
+it is built here once.
+"""
+
+from mongoengine.queryset.visitor import Q
+
+from .category_map import get_category_map
+from .models import RETAILER_MODELS
+
+
+def german_search_variants(search_query):
+    """Generate search variants for German umlaut substitutions.
+
+    'waermepumpe' → {'waermepumpe', 'wärmepumpe'}
+    'kühlschrank' → {'kühlschrank', 'kuehlschrank'}
+    """
+    variants = {search_query}
+    # ae→ä, oe→ö, ue→ü, ss→ß (user types Latin digraph, DB has umlaut)
+    umlaut = search_query
+    for lat, um in [('ae', 'ä'), ('oe', 'ö'), ('ue', 'ü'), ('ss', 'ß')]:
+        umlaut = umlaut.replace(lat, um)
+    variants.add(umlaut)
+    # ä→ae, ö→oe, ü→ue, ß→ss (user types umlaut, DB has Latin)
+    latin = search_query
+    for um, lat in [('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')]:
+        latin = latin.replace(um, lat)
+    variants.add(latin)
+    return list(variants)
+
+
+def parse_price(value):
+    """Convert a price query parameter to float, None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def category_filter_kwargs(category, retailer_name=None):
+    """Filter on a category and all its aliases in a retailer (category map)"""
+    aliases = get_category_map().aliases(category, retailer_name)
+    if len(aliases) == 1:
+        return {'category': aliases[0]}
+    return {'category__in': aliases}
+
+
+def build_query(model, category_filter, brand_filter, search_query, min_price_filter=None, max_price_filter=None,
+                retailer_name=None):
+    """Build a filtered query for any product model"""
+    query = model.objects()
+    if category_filter:
+        query = query.filter(**category_filter_kwargs(category_filter, retailer_name))
+    if brand_filter:
+        query = query.filter(brand=brand_filter)
+    if search_query:
+        search_q = Q()
+        for variant in german_search_variants(search_query):
+            search_q |= (
+                Q(title__icontains=variant) |
+                Q(description__icontains=variant) |
+                Q(brand__icontains=variant)
+            )
+        # SKU/GTIN: no umlaut variants needed
+        search_q |= (
+            Q(sku__icontains=search_query) |
+            Q(sku=search_query) |
+            Q(gtin__icontains=search_query) |
+            Q(gtin=search_query)
+        )
+        query = query.filter(search_q)
+    # Price filters
+    if min_price_filter is not None:
+        query = query.filter(price__gte=min_price_filter)
+    if max_price_filter is not None:
+        query = query.filter(price__lte=max_price_filter)
+    return query
+
+
+def build_retailer_queries(retailer, category, brand, search, min_price=None, max_price=None):
+    """Build the filtered query of every selected retailer: {retailer: query}
+
+    `retailer` is a retailer name or 'all'.
+    """
+    return {
+        retailer_name: build_query(model, category, brand, search, min_price, max_price, retailer_name)
+        for retailer_name, model in RETAILER_MODELS.items()
+        if retailer in ('all', retailer_name)
+    }
+
+
+def raw_filter(query):
+    """The MongoDB filter document of a MongoEngine queryset (for aggregations)"""
+    return query._query
@@ -0,0 +1,86 @@
+"""
+Background refresh of in-memory tables.
+
+Tables such as the category/brand facets are expensive to build (one
+aggregation per retailer) but cheap to serve. A PeriodicRefresher builds the
+table on first use and then keeps it fresh from a daemon thread, so requests
+never wait for MongoDB once the process is warm.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicRefresher:
+    """Hold a value rebuilt every `interval` seconds in a background thread.
+
+    `build(previous)` receives the previous value (None on the first build),
+    which lets builders reuse parts of it or refresh incrementally.
+    """
+
+    def __init__(self, name, build, interval):
+        self.name = name
+        self.interval = interval
+        self._build = build
+        self._value = None
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def built_at(self):
+        return self._built_at
+
+    def get(self):
+        """Return the current value, building it synchronously the first time"""
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._refresh()
+                    self._start()
+        return self._value
+
+    def get_nowait(self):
+        """Return the current value, or None while the first build runs in the background"""
+        if self._value is None:
+            self._start(build_first=True)
+        return self._value
+
+    def refresh(self):
+        """Rebuild the value now (used by the background thread and commands)"""
+        with self._lock:
+            self._refresh()
+        return self._value
+
+    def _refresh(self):
+        started = time.monotonic()
+        self._value = self._build(self._value)
+        self._built_at = time.time()
+        logger.info(f"Refreshed {self.name} in {time.monotonic() - started:.2f}s")
+
+    def _start(self, build_first=False):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, args=(build_first,), name=f'refresh-{self.name}', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, build_first=False):
+        if build_first:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not build {self.name}: {e}")
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the previous value
+                logger.warning(f"Could not refresh {self.name}: {e}")
@@ -0,0 +1,49 @@
+"""
+Fast JSON rendering based on orjson.
+
+orjson serializes dicts/lists several times faster than the stdlib json module
+used by DRF's JSONRenderer and Django's JsonResponse, and it produces bytes
+directly, which is what we store in the cache and write to the socket.
+"""
+
+import orjson
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+
+# Options shared by the renderer, the response class and the cache helpers
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Fallback for types orjson doesn't know (Decimal, ObjectId, lazy strings...)"""
+    return str(obj)
+
+
+def dumps(data) -> bytes:
+    """Encode data to JSON bytes with orjson"""
+    return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """DRF renderer that encodes responses with orjson"""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class ORJSONResponse(HttpResponse):
+    """Drop-in replacement for JsonResponse (plain Django views) using orjson"""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                'In order to allow non-dict objects to be serialized set the '
+                'safe parameter to False.'
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -20,6 +20,8 @@ class BaseProductSerializer(serializers.Serializer):
     url = serializers.URLField()
     produktbeschreibung = serializers.CharField(required=False, allow_null=True)
     produktdaten = serializers.CharField(required=False, allow_null=True)
+    product_group = serializers.CharField(required=False, allow_null=True)
+    discount_pct = serializers.FloatField(required=False, allow_null=True)
 
 
 class SaturnProductSerializer(BaseProductSerializer):
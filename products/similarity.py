@@ -0,0 +1,307 @@
+"""
+Content-based similar products (MinHash + LSH over product titles).
+
+Every product title of the four retailers is normalized (normalize_name),
+split into word shingles (words and word pairs) and summarized by a MinHash
+signature of NUM_PERM values: the share of equal values between two
+signatures estimates the Jaccard similarity of the shingle sets.
+
+Signatures are cut into LSH_BANDS bands; products sharing a band are
+candidates. Each band is a sorted uint64 array of band hashes plus the
+matching row numbers, so a lookup is one searchsorted per band instead of a
+scan. Candidates are ranked by estimated Jaccard similarity plus a price
+proximity bonus.
+
+Storage is array-backed: only the lowest 16 bits of each MinHash value are
+kept (b-bit MinHash, 128 bytes per product), prices are float32.
+
+The index is held in memory by a PeriodicRefresher. Refreshes are
+incremental: only products scraped since the previous watermark of their
+retailer get new signatures. Deleted products only disappear on the full
+rebuild done every SIMILARITY_FULL_REFRESH_EVERY-th refresh.
+
+The nightly `precompute_similar` command stores the top matches of every
+product in the SimilarProducts collection; `similar` reads that first and
+only uses the in-memory index for products newer than the last run.
+"""
+
+import logging
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from .models import RETAILER_MODELS, SimilarProducts
+from .refresh import PeriodicRefresher
+from .text import normalize_name
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // LSH_BANDS
+
+# Rows looked at per band: huge buckets (identical generic titles) are cut
+MAX_BUCKET_SIZE = 500
+# Candidates below this estimated Jaccard similarity are dropped
+MIN_JACCARD = 0.2
+# Products hashed per numpy batch (bounds the temporary NUM_PERM x shingles matrix)
+SIGNATURE_BATCH = 2000
+
+RETAILER_NAMES = tuple(RETAILER_MODELS)
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+# Fixed seed: signatures must be comparable across refreshes and processes
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 2 ** 31, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 31, NUM_PERM).astype(np.uint64)
+_BAND_MIX = _rng.randint(1, 2 ** 62, ROWS_PER_BAND).astype(np.uint64) | np.uint64(1)
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def title_shingles(title):
+    """Words and adjacent word pairs of a normalized title"""
+    words = _WORD_RE.findall(normalize_name(title))
+    shingles = set(words)
+    shingles.update(f'{a} {b}' for a, b in zip(words, words[1:]))
+    return shingles
+
+
+def minhash_signatures(titles):
+    """Return (uint16 signatures of shape (len(titles), NUM_PERM), valid mask)
+
+    Titles without any shingle get an all-zero signature and valid=False.
+    """
+    signatures = np.zeros((len(titles), NUM_PERM), dtype=np.uint16)
+    valid = np.zeros(len(titles), dtype=bool)
+
+    for start in range(0, len(titles), SIGNATURE_BATCH):
+        hashes, lengths = [], []
+        for title in titles[start:start + SIGNATURE_BATCH]:
+            shingle_hashes = [zlib.crc32(s.encode()) for s in title_shingles(title)]
+            hashes.extend(shingle_hashes)
+            lengths.append(len(shingle_hashes))
+        if not hashes:
+            continue
+
+        x = np.array(hashes, dtype=np.uint64)
+        # (a * x + b) mod p for every permutation and shingle: NUM_PERM x shingles
+        values = (_A[:, None] * x[None, :] + _B[:, None]) % _PRIME
+        lengths = np.array(lengths)
+        nonempty = lengths > 0
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[nonempty]
+        rows = start + np.flatnonzero(nonempty)
+        signatures[rows] = np.minimum.reduceat(values, offsets, axis=1).T.astype(np.uint16)
+        valid[rows] = True
+
+    return signatures, valid
+
+
+def band_hashes(signatures):
+    """uint64 hash of every band: shape (len(signatures), LSH_BANDS)"""
+    bands = signatures.reshape(len(signatures), LSH_BANDS, ROWS_PER_BAND).astype(np.uint64)
+    # Wraps modulo 2**64, which is fine for a hash
+    return (bands * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+class SimilarityIndex:
+    """Signatures of all products with sorted LSH band tables"""
+
+    def __init__(self, segments):
+        """`segments` is {retailer: {'ids', 'prices', 'signatures', 'valid'}}"""
+        self.ids = []
+        codes, prices, signatures, valid = [], [], [], []
+        for code, retailer_name in enumerate(RETAILER_NAMES):
+            segment = segments.get(retailer_name)
+            if segment is None or not segment['ids']:
+                continue
+            self.ids.extend(segment['ids'])
+            codes.append(np.full(len(segment['ids']), code, dtype=np.uint8))
+            prices.append(segment['prices'])
+            signatures.append(segment['signatures'])
+            valid.append(segment['valid'])
+
+        self.codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.uint8)
+        self.prices = np.concatenate(prices) if prices else np.zeros(0, dtype=np.float32)
+        self.signatures = (
+            np.concatenate(signatures) if signatures else np.zeros((0, NUM_PERM), dtype=np.uint16)
+        )
+        self.valid = np.concatenate(valid) if valid else np.zeros(0, dtype=bool)
+        self._positions = {pk: i for i, pk in enumerate(self.ids)}
+
+        # Per band: hashes sorted, and the row each sorted hash belongs to
+        indexed = np.flatnonzero(self.valid).astype(np.uint32)
+        hashes = band_hashes(self.signatures[indexed]).T
+        order = np.argsort(hashes, axis=1, kind='stable')
+        self._band_keys = np.take_along_axis(hashes, order, axis=1)
+        self._band_rows = indexed[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def candidates(self, signature):
+        """Rows sharing at least one LSH band with a signature"""
+        keys = band_hashes(signature[None, :])[0]
+        found = []
+        for band in range(LSH_BANDS):
+            band_keys = self._band_keys[band]
+            lo = np.searchsorted(band_keys, keys[band], side='left')
+            hi = np.searchsorted(band_keys, keys[band], side='right')
+            if hi > lo:
+                found.append(self._band_rows[band][lo:min(hi, lo + MAX_BUCKET_SIZE)])
+        if not found:
+            return np.zeros(0, dtype=np.uint32)
+        return np.unique(np.concatenate(found))
+
+    def __iter__(self):
+        """(id, retailer, price) of every indexed product"""
+        for i, pk in enumerate(self.ids):
+            price = float(self.prices[i])
+            yield pk, RETAILER_NAMES[self.codes[i]], None if np.isnan(price) else price
+
+    def similar(self, product_id, title, price=None, limit=6):
+        """Most similar products as [(id, retailer, score)], best first.
+
+        Products that are not indexed yet (newer than the last refresh) are
+        hashed on the fly from their title.
+        """
+        position = self._positions.get(str(product_id))
+        if position is not None and self.valid[position]:
+            signature = self.signatures[position]
+        else:
+            signatures, valid = minhash_signatures([title or ''])
+            if not valid[0]:
+                return []
+            signature = signatures[0]
+
+        rows = self.candidates(signature)
+        if position is not None:
+            rows = rows[rows != position]
+        if not len(rows):
+            return []
+
+        jaccard = (self.signatures[rows] == signature).mean(axis=1)
+        keep = jaccard >= MIN_JACCARD
+        rows, jaccard = rows[keep], jaccard[keep]
+
+        score = jaccard
+        if price:
+            candidate_prices = self.prices[rows]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                proximity = 1 - np.abs(candidate_prices - price) / np.maximum(candidate_prices, price)
+            proximity = np.nan_to_num(proximity, nan=0.0).clip(0, 1)
+            score = jaccard + getattr(settings, 'SIMILARITY_PRICE_WEIGHT', 0.2) * proximity
+
+        best = np.argsort(-score, kind='stable')[:limit]
+        return [
+            (self.ids[rows[i]], RETAILER_NAMES[self.codes[rows[i]]], round(float(score[i]), 4))
+            for i in best
+        ]
+
+
+def _load_products(model, since=None):
+    """(ids, titles, prices, newest scraped_at) of a retailer, optionally only recent ones"""
+    query = {'scraped_at': {'$gt': since}} if since else {}
+    ids, titles, prices, newest = [], [], [], since
+    cursor = model._get_collection().find(query, {'title': 1, 'price': 1, 'scraped_at': 1})
+    for doc in cursor.batch_size(5000):
+        ids.append(str(doc['_id']))
+        titles.append(doc.get('title') or '')
+        price = doc.get('price')
+        prices.append(float(price) if price is not None else np.nan)
+        scraped_at = doc.get('scraped_at')
+        if scraped_at is not None and (newest is None or scraped_at > newest):
+            newest = scraped_at
+    return ids, titles, np.array(prices, dtype=np.float32), newest
+
+
+def _refresh_segment(model, previous, full):
+    """New segment of one retailer: full reload or previous + changed products"""
+    since = None if (previous is None or full) else previous['watermark']
+    ids, titles, prices, newest = _load_products(model, since)
+    signatures, valid = minhash_signatures(titles)
+
+    if since is not None:
+        changed = set(ids)
+        keep = np.array([pk not in changed for pk in previous['ids']], dtype=bool)
+        ids = [pk for pk, kept in zip(previous['ids'], keep) if kept] + ids
+        prices = np.concatenate([previous['prices'][keep], prices])
+        signatures = np.concatenate([previous['signatures'][keep], signatures])
+        valid = np.concatenate([previous['valid'][keep], valid])
+
+    return {
+        'ids': ids,
+        'prices': prices,
+        'signatures': signatures,
+        'valid': valid,
+        'watermark': newest,
+    }
+
+
+def build_similarity_index(previous=None):
+    """Build (or incrementally refresh) the similarity index of all retailers"""
+    refreshes = previous['refreshes'] + 1 if previous else 0
+    full = refreshes % getattr(settings, 'SIMILARITY_FULL_REFRESH_EVERY', 24) == 0
+
+    def refresh(item):
+        retailer_name, model = item
+        segment = previous['segments'].get(retailer_name) if previous else None
+        try:
+            return retailer_name, _refresh_segment(model, segment, full)
+        except Exception as e:
+            logger.warning(f"Could not refresh {retailer_name} similarity index: {e}")
+            return retailer_name, segment
+
+    with ThreadPoolExecutor(max_workers=len(RETAILER_MODELS)) as executor:
+        segments = {
+            name: segment
+            for name, segment in executor.map(refresh, RETAILER_MODELS.items())
+            if segment is not None
+        }
+
+    return {
+        'segments': segments,
+        'refreshes': refreshes,
+        'index': SimilarityIndex(segments),
+    }
+
+
+similarity_store = PeriodicRefresher(
+    'similarity',
+    build_similarity_index,
+    interval=getattr(settings, 'SIMILARITY_REFRESH_INTERVAL', 1800),
+)
+
+
+def find_similar(product, limit=6):
+    """[(id, retailer, score)] for a serialized product, None until the index is built.
+
+    The first call starts building the index in the background instead of
+    making the request wait for it.
+    """
+    state = similarity_store.get_nowait()
+    if state is None:
+        return None
+    return state['index'].similar(product['id'], product.get('title'), product.get('price'), limit)
+
+
+def get_precomputed_similar(product_id, limit=6):
+    """[(id, retailer, score)] stored by precompute_similar, None if not computed"""
+    try:
+        doc = SimilarProducts._get_collection().find_one(
+            {'_id': str(product_id)}, {'similar': 1, 'scores': 1}
+        )
+    except Exception as e:
+        logger.warning(f"Could not read precomputed similar products of {product_id}: {e}")
+        return None
+    if doc is None:
+        return None
+
+    matches = []
+    for ref, score in zip(doc.get('similar', []), doc.get('scores', [])):
+        retailer_name, _, match_id = ref.partition(':')
+        matches.append((match_id, retailer_name, score))
+    return matches[:limit]
@@ -0,0 +1,276 @@
+"""
+Streaming product sitemap.
+
+The sitemap lists the most recently scraped products of all retailers.
+Each retailer collection is read with a cursor sorted by -scraped_at on the
+server (indexed) and the cursors are merged lazily with heapq.merge, so
+only one pending document per retailer (plus the cursors' current batches)
+is held in memory whatever the limit. The entries are rendered as JSON or
+sitemap XML while they are read and sent through a StreamingHttpResponse.
+
+For crawlers, the generate_sitemaps command pre-renders all products into
+gzipped shards of SITEMAP_SHARD_SIZE URLs (sitemap-products-N.xml.gz) plus
+a sitemap index, served as static files by `sitemap_file`. Products are
+merged in _id order, so new products land in the last shard and the other
+shards only change when one of their products is re-scraped on another day
+(lastmod has day precision) or deleted. Every file is written to a temporary
+file and moved into place with os.replace; a file whose content hash equals
+the previous run's (sitemap-manifest.json) is left untouched, which keeps
+its Last-Modified/ETag and the crawlers' conditional requests cheap.
+
+The index lists the shards under SITE_URL (the frontend host, where
+robots.txt announces the index); the frontend rewrites /sitemap-products-*
+to this API, so crawlers never leave the site's host.
+"""
+
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from .models import RETAILER_MODELS
+
+logger = logging.getLogger(__name__)
+
+MAX_SITEMAP_ENTRIES = 50000
+# Documents per cursor round trip
+CURSOR_BATCH_SIZE = 1000
+# Entries rendered per chunk written to the response
+WRITE_BATCH_SIZE = 500
+
+SHARD_PREFIX = 'sitemap-products-'
+INDEX_NAME = 'sitemap-products-index.xml'
+MANIFEST_NAME = 'sitemap-manifest.json'
+# Files sitemap_file may serve
+SITEMAP_FILE_RE = re.compile(r'^sitemap-products-(?:\d+\.xml\.gz|index\.xml)$')
+
+
+def _retailer_entries(model, limit):
+    """(scraped_at, id) of a retailer's products, newest first"""
+    cursor = model._get_collection().find({}, {'scraped_at': 1}).sort('scraped_at', -1)
+    for doc in cursor.limit(limit).batch_size(CURSOR_BATCH_SIZE):
+        yield doc.get('scraped_at'), str(doc['_id'])
+
+
+def _merge_key(entry):
+    # Products without scraped_at come last, as in the server sort
+    return entry[0] or datetime.min
+
+
+def sitemap_entries(limit):
+    """(scraped_at, id) of the `limit` most recently scraped products of all retailers"""
+    cursors = [_retailer_entries(model, limit) for model in RETAILER_MODELS.values()]
+    return islice(heapq.merge(*cursors, key=_merge_key, reverse=True), limit)
+
+
+def product_count():
+    """Products of all retailers, from the collection metadata (no scan)"""
+    return sum(model._get_collection().estimated_document_count() for model in RETAILER_MODELS.values())
+
+
+def _batched(entries):
+    while True:
+        batch = list(islice(entries, WRITE_BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def _last_modified(scraped_at, now):
+    return (scraped_at or now).isoformat()
+
+
+def render_json(entries, count, limit):
+    """Chunks of {"count", "limit", "results": [{"id", "lastModified"}], "returned"}"""
+    now = datetime.now()
+    yield f'{{"count": {count}, "limit": {limit}, "results": ['
+    returned = 0
+    try:
+        for batch in _batched(entries):
+            chunk = ', '.join(
+                f'{{"id": "{pk}", "lastModified": "{_last_modified(scraped_at, now)}"}}'
+                for scraped_at, pk in batch
+            )
+            yield (', ' if returned else '') + chunk
+            returned += len(batch)
+    except Exception as e:
+        # Headers are gone: end the document, the short count shows the failure
+        logger.error(f"Sitemap streaming error after {returned} entries: {e}")
+    yield f'], "returned": {returned}}}'
+
+
+def render_xml(entries):
+    """Chunks of a sitemap.org urlset"""
+    site_url = getattr(settings, 'SITE_URL', 'https://preisradio.de')
+    now = datetime.utcnow()
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    )
+    returned = 0
+    try:
+        for batch in _batched(entries):
+            yield ''.join(
+                f'<url><loc>{escape(f"{site_url}/product/{pk}")}</loc>'
+                f'<lastmod>{scraped_at or now:%Y-%m-%dT%H:%M:%S}+00:00</lastmod></url>\n'
+                for scraped_at, pk in batch
+            )
+            returned += len(batch)
+    except Exception as e:
+        logger.error(f"Sitemap streaming error after {returned} entries: {e}")
+    yield '</urlset>\n'
+
+
+# --- Pre-rendered shards (generate_sitemaps) ---------------------------------
+
+def _all_entries():
+    """(scraped_at, id) of all products of all retailers, merged in _id order"""
+    cursors = [
+        model._get_collection().find({}, {'scraped_at': 1}).sort('_id', 1).batch_size(CURSOR_BATCH_SIZE)
+        for model in RETAILER_MODELS.values()
+    ]
+    for doc in heapq.merge(*cursors, key=lambda doc: doc['_id']):
+        yield doc.get('scraped_at'), str(doc['_id'])
+
+
+class _Counter:
+    """Iterator wrapper counting the items it yields"""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        self.count += 1
+        return item
+
+
+def _urlset(entries, site_url):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    )
+    for batch in _batched(entries):
+        yield ''.join(
+            f'<url><loc>{escape(f"{site_url}/product/{pk}")}</loc>'
+            + (f'<lastmod>{scraped_at:%Y-%m-%d}</lastmod>' if scraped_at else '')
+            + '</url>\n'
+            for scraped_at, pk in batch
+        )
+    yield '</urlset>\n'
+
+
+def _sitemap_index(shards, site_url):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    )
+    for name, lastmod in shards:
+        yield f'<sitemap><loc>{escape(f"{site_url}/{name}")}</loc><lastmod>{lastmod}</lastmod></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def write_if_changed(path, chunks, previous_hash=None):
+    """Write text chunks to `path` atomically (gzipped for .gz paths).
+
+    The content is streamed into a temporary file in the same directory
+    while it is hashed; it replaces `path` only if its SHA-256 differs from
+    `previous_hash`. Returns (sha256 of the uncompressed content, written).
+    """
+    directory = os.path.dirname(path)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            # mtime=0: identical content gives identical bytes
+            out = gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) if path.endswith('.gz') else raw
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                digest.update(data)
+                out.write(data)
+            if out is not raw:
+                out.close()
+
+        sha256 = digest.hexdigest()
+        if sha256 == previous_hash and os.path.exists(path):
+            os.unlink(tmp_path)
+            return sha256, False
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return sha256, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_sitemaps(directory, shard_size=MAX_SITEMAP_ENTRIES, site_url=None):
+    """Write the product sitemap shards and their index; return statistics"""
+    site_url = site_url or getattr(settings, 'SITE_URL', 'https://preisradio.de')
+    os.makedirs(directory, exist_ok=True)
+    previous = _load_manifest(directory)
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+
+    manifest = {}
+    stats = {'products': 0, 'shards': 0, 'written': 0, 'unchanged': 0, 'removed': 0}
+    entries = _all_entries()
+    while True:
+        first = next(entries, None)
+        if first is None:
+            break
+        name = f'{SHARD_PREFIX}{stats["shards"] + 1}.xml.gz'
+        shard_entries = _Counter(chain([first], islice(entries, shard_size - 1)))
+        old = previous.get(name, {})
+        sha256, written = write_if_changed(
+            os.path.join(directory, name), _urlset(shard_entries, site_url), old.get('sha256')
+        )
+        manifest[name] = {
+            'sha256': sha256,
+            'urls': shard_entries.count,
+            'lastmod': today if written else old.get('lastmod', today),
+        }
+        stats['shards'] += 1
+        stats['products'] += shard_entries.count
+        stats['written' if written else 'unchanged'] += 1
+
+    shards = [(name, info['lastmod']) for name, info in manifest.items()]
+    index_hash, index_written = write_if_changed(
+        os.path.join(directory, INDEX_NAME), _sitemap_index(shards, site_url),
+        previous.get(INDEX_NAME, {}).get('sha256'),
+    )
+    manifest[INDEX_NAME] = {'sha256': index_hash, 'lastmod': today}
+    stats['index_written'] = index_written
+
+    # Shards beyond the last one (fewer products than last time), removed
+    # only once the index no longer lists them
+    for name in previous:
+        if name not in manifest and name != INDEX_NAME and SITEMAP_FILE_RE.match(name):
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+            stats['removed'] += 1
+
+    write_if_changed(os.path.join(directory, MANIFEST_NAME), [json.dumps(manifest, indent=2)])
+    return stats
@@ -0,0 +1,113 @@
+import smtplib
+from unittest import mock
+
+from django.core import mail
+from django.test import SimpleTestCase, override_settings
+
+from products import alerts
+from products.alerts import AlertIndex, AlertMailer, deliver
+
+
+def make_alert(pk, email, threshold, product_id=None, gtin=None):
+    return {
+        '_id': pk, 'email': email, 'threshold': threshold, 'token': f'token-{pk}',
+        'product_id': product_id, 'gtin': gtin, 'active': True,
+    }
+
+
+def product(pk, price, gtin=None, retailer='saturn'):
+    return {'id': pk, 'retailer': retailer, 'title': f'Produkt {pk}', 'gtin': gtin, 'price': price}
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   DEFAULT_FROM_EMAIL='alarm@preisradio.de')
+@mock.patch.object(alerts.time, 'sleep', lambda seconds: None)
+class PriceAlertTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = AlertIndex([
+            make_alert('a1', 'anna@example.com', 500.0, product_id='p1'),
+            make_alert('a2', 'anna@example.com', 300.0, gtin='4006381333931'),
+            make_alert('a3', 'ben@example.com', 450.0, product_id='p1'),
+            make_alert('a4', 'ben@example.com', 100.0, product_id='p1'),
+        ])
+        collection = mock.patch.object(alerts.PriceAlert, '_get_collection')
+        self.collection = collection.start().return_value
+        self.addCleanup(collection.stop)
+
+    def test_match_by_product_and_gtin(self):
+        matches = self.index.match([
+            product('p1', 449.0),
+            # Same GTIN at another retailer, zero-padded
+            product('p9', 299.0, gtin='04006381333931', retailer='otto'),
+        ])
+        self.assertEqual(set(matches), {'a1', 'a2', 'a3'})
+        self.assertEqual(matches['a2']['id'], 'p9')
+
+    def test_match_numeric_gtin(self):
+        matches = self.index.match([product('p9', 299.0, gtin=4006381333931, retailer='otto')])
+        self.assertEqual(set(matches), {'a2'})
+
+    def test_one_email_per_recipient(self):
+        matches = self.index.match([product('p1', 290.0, gtin='4006381333931')])
+        with AlertMailer(batch_size=10) as mailer:
+            delivered = deliver(self.index, matches, mailer)
+
+        self.assertEqual(delivered, 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['anna@example.com', 'ben@example.com'])
+        anna = next(message for message in mail.outbox if message.to == ['anna@example.com'])
+        self.assertIn('2 Produkte', anna.subject)
+        self.assertIn('token-a1', anna.body)
+        self.assertIn('token-a2', anna.body)
+
+    def test_fired_alerts_are_deactivated(self):
+        matches = self.index.match([product('p1', 449.0)])
+        with AlertMailer() as mailer:
+            deliver(self.index, matches, mailer)
+
+        operations = self.collection.bulk_write.call_args[0][0]
+        updates = {op._filter['_id']: op._doc['$set'] for op in operations}
+        self.assertEqual(set(updates), {'a1', 'a3'})
+        self.assertFalse(updates['a1']['active'])
+        self.assertEqual(updates['a1']['triggered_price'], 449.0)
+        self.assertEqual(updates['a1']['triggered_product'], 'saturn:p1')
+        # Fired alerts don't match again in the same run
+        self.assertEqual(self.index.match([product('p1', 449.0)]), {})
+
+    def test_retry_after_smtp_error_resends_only_unsent_messages(self):
+        matches = self.index.match([product('p1', 90.0, gtin='4006381333931')])
+        mailer = AlertMailer(batch_size=10, max_retries=2)
+        send_messages = mailer.connection.send_messages
+        calls = []
+
+        def flaky_send(messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise smtplib.SMTPServerDisconnected('connection lost')
+            return send_messages(messages)
+
+        with mock.patch.object(mailer.connection, 'send_messages', flaky_send):
+            with mailer:
+                delivered = deliver(self.index, matches, mailer)
+
+        self.assertEqual(delivered, 4)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len({tuple(message.to) for message in mail.outbox}), 2)
+        self.assertEqual(mailer.stats['retries'], 1)
+        self.assertEqual(mailer.stats['sent'], 2)
+        self.assertEqual(mailer.stats['failed'], 0)
+
+    def test_undelivered_alerts_stay_active(self):
+        matches = self.index.match([product('p1', 449.0)])
+        mailer = AlertMailer(max_retries=1)
+        failing = mock.Mock(side_effect=smtplib.SMTPException('down'))
+
+        with mock.patch.object(mailer.connection, 'send_messages', failing):
+            with mailer:
+                delivered = deliver(self.index, matches, mailer)
+
+        self.assertEqual(delivered, 0)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(mailer.stats['failed'], 2)
+        self.collection.bulk_write.assert_not_called()
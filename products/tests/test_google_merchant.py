@@ -0,0 +1,95 @@
+import json
+
+from django.test import SimpleTestCase
+from googleapiclient.http import HttpMockSequence
+
+from products.google_merchant import GoogleMerchantService
+
+
+class RecordingHttp(HttpMockSequence):
+    """HttpMockSequence that keeps the custombatch entries it was sent"""
+
+    def __init__(self, iterable):
+        super().__init__(iterable)
+        self.sent = []
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        self.sent.append([entry['batchId'] for entry in json.loads(body)['entries']])
+        return super().request(uri, method, body, headers, *args, **kwargs)
+
+
+def batch_response(*entries):
+    return ({'status': '200'}, json.dumps({'kind': 'content#productsCustomBatchResponse', 'entries': list(entries)}))
+
+
+def entry_error(batch_id, reason):
+    return {'batchId': batch_id, 'errors': {'code': 400, 'errors': [{'reason': reason, 'message': reason}]}}
+
+
+class CustomBatchUploadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.products = [{'id': f'p{i}', 'title': f'Produkt {i}', 'price': 10.0 + i} for i in range(4)]
+
+    def upload(self, responses, **kwargs):
+        http = RecordingHttp(responses)
+        service = GoogleMerchantService('123', http=http)
+        service.RETRY_BACKOFF = 0
+        return service.batch_insert_products(self.products, **kwargs), http.sent
+
+    def test_whole_call_retried_after_503(self):
+        stats, sent = self.upload([
+            ({'status': '503'}, json.dumps({'error': {'code': 503, 'message': 'unavailable'}})),
+            batch_response(*({'batchId': i} for i in range(4))),
+        ])
+        self.assertEqual(stats['success'], 4)
+        self.assertEqual(stats['failed_products'], [])
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(sent, [[0, 1, 2, 3], [0, 1, 2, 3]])
+
+    def test_backend_error_entry_retried_alone(self):
+        stats, sent = self.upload([
+            batch_response({'batchId': 0}, entry_error(1, 'backendError'), {'batchId': 2}, {'batchId': 3}),
+            batch_response({'batchId': 1}),
+        ])
+        self.assertEqual(stats['success'], 4)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(sent, [[0, 1, 2, 3], [1]])
+
+    def test_non_retriable_entry_error_is_failed(self):
+        stats, sent = self.upload([
+            batch_response({'batchId': 0}, {'batchId': 1}, entry_error(2, 'invalid'), {'batchId': 3}),
+        ])
+        self.assertEqual(stats['success'], 3)
+        self.assertEqual(stats['failed_products'], ['p2'])
+        self.assertEqual(stats['errors'], {'invalid': 1})
+        self.assertEqual(sent, [[0, 1, 2, 3]])
+
+    def test_missing_entry_retried(self):
+        stats, sent = self.upload([
+            batch_response({'batchId': 0}, {'batchId': 1}, {'batchId': 3}),
+            batch_response({'batchId': 2}),
+        ])
+        self.assertEqual(stats['success'], 4)
+        self.assertEqual(stats['failed_products'], [])
+        self.assertEqual(sent, [[0, 1, 2, 3], [2]])
+
+    def test_batches_split_at_batch_size(self):
+        stats, sent = self.upload([
+            batch_response({'batchId': 0}, {'batchId': 1}, {'batchId': 2}),
+            batch_response({'batchId': 0}),
+        ], batch_size=3)
+        self.assertEqual(stats['batches'], 2)
+        self.assertEqual(stats['success'], 4)
+        self.assertEqual(sent, [[0, 1, 2], [0]])
+
+
+class DeleteProductTests(SimpleTestCase):
+
+    def test_not_found_counts_as_deleted(self):
+        http = HttpMockSequence([({'status': '404'}, json.dumps({'error': {'code': 404, 'message': 'item not found'}}))])
+        self.assertTrue(GoogleMerchantService('123', http=http).delete_product('p1'))
+
+    def test_other_errors_fail(self):
+        http = HttpMockSequence([({'status': '400'}, json.dumps({'error': {'code': 400, 'message': 'invalid'}}))])
+        self.assertFalse(GoogleMerchantService('123', http=http).delete_product('p1'))
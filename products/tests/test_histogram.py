@@ -0,0 +1,42 @@
+from bisect import bisect_right
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from products import histogram
+
+PRICES = [5.0, 9.5, 12.49, 19.99, 19.99]
+
+
+def count_buckets(query, boundaries):
+    """$bucket semantics: [lower, upper), anything else in 'outside'"""
+    counts = {}
+    for price in PRICES:
+        i = bisect_right(boundaries, price) - 1
+        key = boundaries[i] if 0 <= i < len(boundaries) - 1 else 'outside'
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+@mock.patch.object(histogram, '_count_buckets', count_buckets)
+class PriceHistogramTests(SimpleTestCase):
+    queries = {'saturn': object()}
+
+    def test_upper_edge_is_above_two_decimal_prices(self):
+        for price in (19.99, 2.01, 4.35, 1299.0, 0.07):
+            self.assertGreater(histogram._upper_edge(price), price)
+
+    @mock.patch.object(histogram, '_price_bounds', lambda query: (min(PRICES), max(PRICES)))
+    def test_fixed_mode_counts_the_most_expensive_product(self):
+        result = histogram.compute_price_histogram(self.queries, buckets=4, mode='fixed')
+        self.assertEqual(result['count'], len(PRICES))
+        self.assertGreater(result['max'], 19.99)
+        self.assertEqual(result['buckets'][-1]['count'], 2)
+
+    @mock.patch.object(histogram, '_auto_buckets', lambda query, buckets: [
+        (5.0, 12.49, 2), (12.49, 19.99, 3),
+    ])
+    def test_quantile_mode_counts_the_most_expensive_product(self):
+        result = histogram.compute_price_histogram(self.queries, buckets=2, mode='quantile')
+        self.assertEqual(result['count'], len(PRICES))
+        self.assertGreater(result['max'], 19.99)
@@ -0,0 +1,26 @@
+"""
+Text normalization shared by the facet tables, the brand directory and the
+category map.
+"""
+
+import unicodedata
+
+_UMLAUTS = [('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')]
+
+
+def normalize_name(text):
+    """Normalize a facet value or a search query for matching.
+
+    Lowercase, German umlauts folded to their digraphs (so 'Kühl' and 'kuehl'
+    match), remaining accents stripped and whitespace collapsed.
+    """
+    if not text:
+        return ''
+    text = text.lower()
+    for um, lat in _UMLAUTS:
+        text = text.replace(um, lat)
+    text = ''.join(
+        c for c in unicodedata.normalize('NFD', text)
+        if unicodedata.category(c) != 'Mn'
+    )
+    return ' '.join(text.split())
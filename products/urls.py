@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import RetailerViewSet, ProductViewSet
-from .health import health_check, api_status
+from .health import health_check, api_status, cache_stats
 
 router = DefaultRouter()
 router.register(r'retailers', RetailerViewSet, basename='retailer')
@@ -11,4 +11,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('health/', health_check, name='health-check'),
     path('status/', api_status, name='api-status'),
+    path('status/cache/', cache_stats, name='cache-stats'),
 ]
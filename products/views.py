@@ -2,46 +2,49 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from django.http import HttpResponse
-from django.core.cache import cache
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.conf import settings
-from mongoengine.queryset.visitor import Q
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import hashlib
 import logging
+import os
+import time
+
+from bson import ObjectId
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
 
 logger = logging.getLogger(__name__)
 
-def _german_search_variants(search_query):
-    """Generate search variants for German umlaut substitutions.
-
-    'waermepumpe' → {'waermepumpe', 'wärmepumpe'}
-    'kühlschrank' → {'kühlschrank', 'kuehlschrank'}
-    """
-    variants = {search_query}
-    # ae→ä, oe→ö, ue→ü, ss→ß (user types Latin digraph, DB has umlaut)
-    umlaut = search_query
-    for lat, um in [('ae', 'ä'), ('oe', 'ö'), ('ue', 'ü'), ('ss', 'ß')]:
-        umlaut = umlaut.replace(lat, um)
-    variants.add(umlaut)
-    # ä→ae, ö→oe, ü→ue, ß→ss (user types umlaut, DB has Latin)
-    latin = search_query
-    for um, lat in [('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')]:
-        latin = latin.replace(um, lat)
-    variants.add(latin)
-    return list(variants)
-
-from .models import SaturnProduct, MediaMarktProduct, OttoProduct, KauflandProduct
+from .models import SaturnProduct, MediaMarktProduct, OttoProduct, KauflandProduct, PriceAlert, RETAILER_MODELS
 from .serializers import (
     SaturnProductSerializer,
     MediaMarktProductSerializer,
     OttoProductSerializer,
     KauflandProductSerializer,
 )
+from .alerts import create_alert
 from .google_merchant import get_merchant_service
-from datetime import datetime
-from xml.etree.ElementTree import Element, SubElement, tostring
-from xml.dom import minidom
+from .cache import get_cached_response, cache_response
+from .category_map import get_category_map
+from .category_stats import category_stats_store, get_category_stats, get_category_stats_row
+from .deals import get_deals
+from .best_offers import get_best_offers, normalize_gtin
+from .brand_directory import get_brand_directory
+from .facets import facet_store, get_facet_table, get_search_facets
+from .feeds import feed_chunks, gunzip_file_chunks, gzip_chunks
+from .histogram import get_price_histogram
+from .lookup import get_product_data, get_products_data
+from .merchant_sync import MerchantSync
+from .price_drops import get_price_drops
+from .price_history import ROLLUP_RESOLUTIONS, choose_resolution, get_history, get_rollup
+from .queries import build_retailer_queries, category_filter_kwargs, parse_price
+from .sitemap import MAX_SITEMAP_ENTRIES, SITEMAP_FILE_RE, product_count, render_json, render_xml, sitemap_entries
+from .similarity import find_similar, get_precomputed_similar
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -339,6 +342,7 @@ class ProductViewSet(viewsets.ViewSet):
 
     def list(self, request):
         """List products from both retailers with filtering and search"""
+        started = time.monotonic()
         search = request.query_params.get('search', '')
         category = request.query_params.get('category', '')
         brand = request.query_params.get('brand', '')
@@ -347,26 +351,20 @@ class ProductViewSet(viewsets.ViewSet):
         page_size = int(request.query_params.get('page_size', 20))
 
         # Price filters
-        min_price = request.query_params.get('min_price', None)
-        max_price = request.query_params.get('max_price', None)
+        min_price = parse_price(request.query_params.get('min_price', None))
+        max_price = parse_price(request.query_params.get('max_price', None))
 
-        # Convert to float if provided
-        if min_price:
-            try:
-                min_price = float(min_price)
-            except (ValueError, TypeError):
-                min_price = None
-        if max_price:
-            try:
-                max_price = float(max_price)
-            except (ValueError, TypeError):
-                max_price = None
+        # Facet counts (brands, retailers, price ranges) for filter sidebars
+        with_facets = request.query_params.get('facets', '') in ('1', 'true')
 
         # Sort parameter: 'price_asc', 'price_desc', 'newest' (default)
         sort = request.query_params.get('sort', 'newest')
 
         # Generate cache key based on query parameters
-        cache_params = f"{search}:{category}:{brand}:{retailer}:{page}:{page_size}:{min_price}:{max_price}:{sort}"
+        cache_params = (
+            f"{search}:{category}:{brand}:{retailer}:{page}:{page_size}:{min_price}:{max_price}:{sort}:"
+            f"{with_facets}:{get_category_map().version}"
+        )
         cache_key = f"products_list_{hashlib.md5(cache_params.encode()).hexdigest()}"
 
         # Determine cache duration based on request type
@@ -374,46 +372,25 @@ class ProductViewSet(viewsets.ViewSet):
         is_homepage = not search and not category and not brand and retailer == 'all' and page == 1
         cache_duration = getattr(settings, 'CACHE_HOMEPAGE_DURATION', 3600) if is_homepage else getattr(settings, 'CACHE_SEARCH_DURATION', 600)
 
-        # Try to get from cache
-        cached_response = cache.get(cache_key)
+        # Try to get from cache (pre-encoded JSON bytes, no re-serialization)
+        cached_response = get_cached_response(request, cache_key)
         if cached_response is not None:
-            return Response(cached_response)
+            return cached_response
+
+        # Facets are computed (or read from their own cache) while products load
+        facets_executor = None
+        if with_facets:
+            facets_executor = ThreadPoolExecutor(max_workers=1)
+            facets_future = facets_executor.submit(
+                get_search_facets, retailer, category, brand, search, min_price, max_price
+            )
 
         # Build queries with filters using helper function
-        def build_query(model, category_filter, brand_filter, search_query, min_price_filter=None, max_price_filter=None):
-            """Build a filtered query for any product model"""
-            query = model.objects()
-            if category_filter:
-                query = query.filter(category=category_filter)
-            if brand_filter:
-                query = query.filter(brand=brand_filter)
-            if search_query:
-                search_q = Q()
-                for variant in _german_search_variants(search_query):
-                    search_q |= (
-                        Q(title__icontains=variant) |
-                        Q(description__icontains=variant) |
-                        Q(brand__icontains=variant)
-                    )
-                # SKU/GTIN: no umlaut variants needed
-                search_q |= (
-                    Q(sku__icontains=search_query) |
-                    Q(sku=search_query) |
-                    Q(gtin__icontains=search_query) |
-                    Q(gtin=search_query)
-                )
-                query = query.filter(search_q)
-            # Price filters
-            if min_price_filter is not None:
-                query = query.filter(price__gte=min_price_filter)
-            if max_price_filter is not None:
-                query = query.filter(price__lte=max_price_filter)
-            return query
-
-        saturn_query = build_query(SaturnProduct, category, brand, search, min_price, max_price) if retailer in ['all', 'saturn'] else None
-        mediamarkt_query = build_query(MediaMarktProduct, category, brand, search, min_price, max_price) if retailer in ['all', 'mediamarkt'] else None
-        otto_query = build_query(OttoProduct, category, brand, search, min_price, max_price) if retailer in ['all', 'otto'] else None
-        kaufland_query = build_query(KauflandProduct, category, brand, search, min_price, max_price) if retailer in ['all', 'kaufland'] else None
+        queries = build_retailer_queries(retailer, category, brand, search, min_price, max_price)
+        saturn_query = queries.get('saturn')
+        mediamarkt_query = queries.get('mediamarkt')
+        otto_query = queries.get('otto')
+        kaufland_query = queries.get('kaufland')
 
         # Apply pagination
         start = (page - 1) * page_size
@@ -517,181 +494,326 @@ class ProductViewSet(viewsets.ViewSet):
             'results': results
         }
 
-        # Cache the response
-        cache.set(cache_key, response_data, cache_duration)
-
-        return Response(response_data)
+        if facets_executor is not None:
+            try:
+                response_data['facets'] = facets_future.result()
+            except Exception as e:
+                logger.warning(f"Could not compute search facets: {e}")
+                response_data['facets'] = None
+            finally:
+                facets_executor.shutdown(wait=False)
+
+        # Cache the encoded response and serve the same bytes
+        return cache_response(
+            request, cache_key, response_data, cache_duration,
+            cost=time.monotonic() - started,
+        )
 
     def retrieve(self, request, pk=None):
-        """Retrieve a product by ID"""
-        # Try Kaufland
-        try:
-            product = KauflandProduct.objects.get(id=pk)
-            serializer = KauflandProductSerializer(product)
-            data = serializer.data
-            data['retailer'] = 'kaufland'
-            return Response(data)
-        except KauflandProduct.DoesNotExist:
-            pass
-        except Exception as e:
-            logger.error(f"Kaufland product retrieve error for ID {pk}: {type(e).__name__}: {e}")
-            pass
+        """Retrieve a product by ID (cached, see products.lookup)"""
+        data = get_product_data(pk)
+        if data is None:
+            return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
 
-        # Try Saturn
-        try:
-            product = SaturnProduct.objects.get(id=pk)
-            serializer = SaturnProductSerializer(product)
-            data = serializer.data
-            data['retailer'] = 'saturn'
-            return Response(data)
-        except SaturnProduct.DoesNotExist:
-            pass
-
-        # Try MediaMarkt
-        try:
-            product = MediaMarktProduct.objects.get(id=pk)
-            serializer = MediaMarktProductSerializer(product)
-            data = serializer.data
-            data['retailer'] = 'mediamarkt'
-            return Response(data)
-        except MediaMarktProduct.DoesNotExist:
-            pass
-
-        # Try Otto
-        try:
-            product = OttoProduct.objects.get(id=pk)
-            serializer = OttoProductSerializer(product)
-            data = serializer.data
-            data['retailer'] = 'otto'
-            return Response(data)
-        except OttoProduct.DoesNotExist:
-            pass
+    def _facet_response(self, request, family, search_rows):
+        """Search and paginate a precomputed facet table (categories or brands)
 
-        return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
-
-    @action(detail=False, methods=['get'])
-    def categories(self, request):
+        `search_rows(retailer, search, mode)` returns the matching facet rows.
         """
-        Get all unique categories, pagination and search.
-
-        Query parameters:
-        - search: Filter categories by name
-        - page: Page number (default: 1)
-        - page_size: Items per page (default: 50, max: 200)
-
-        Returns list of category names.
-        """
-        # Get all unique categories from each retailer
-        saturn_categories = list(SaturnProduct.objects.distinct('category'))
-        mediamarkt_categories = list(MediaMarktProduct.objects.distinct('category'))
-        otto_categories = list(OttoProduct.objects.distinct('category'))
-
-        try:
-            kaufland_categories = list(KauflandProduct.objects.distinct('category'))
-        except Exception as e:
-            logger.warning(f"Could not get Kaufland categories: {e}")
-            kaufland_categories = []
-
-        # Combine all unique categories
-        all_categories = sorted(set(
-            saturn_categories +
-            mediamarkt_categories +
-            otto_categories +
-            kaufland_categories
-        ))
-
-        # Filter by search query
+        started = time.monotonic()
+        retailer = request.query_params.get('retailer', 'all').lower()
         search = request.query_params.get('search', '').lower()
-        if search:
-            all_categories = [c for c in all_categories if search in c.lower()]
-
-        # Pagination
+        mode = request.query_params.get('mode', '')
         page = int(request.query_params.get('page', 1))
         page_size = min(int(request.query_params.get('page_size', 50)), 200)
 
-        total_count = len(all_categories)
+        # The table build time is part of the key: a refresh invalidates pages
+        facet_store.get()
+        cache_params = f"{facet_store.built_at}:{retailer}:{search}:{mode}:{page}:{page_size}"
+        cache_key = f"{family}_{hashlib.md5(cache_params.encode()).hexdigest()}"
+        cached_response = get_cached_response(request, cache_key)
+        if cached_response is not None:
+            return cached_response
+
+        rows = search_rows(retailer, search, mode)
+
+        total_count = len(rows)
         start = (page - 1) * page_size
         end = start + page_size
 
-        paginated_categories = all_categories[start:end]
+        paginated_rows = rows[start:end]
 
         # Calculate pagination info
         has_next = end < total_count
         has_prev = page > 1
 
-        return Response({
+        response_data = {
             'count': total_count,
             'next': f'?page={page + 1}&page_size={page_size}&search={search}' if has_next else None,
             'previous': f'?page={page - 1}&page_size={page_size}&search={search}' if has_prev else None,
             'page': page,
             'page_size': page_size,
             'total_pages': (total_count + page_size - 1) // page_size,
-            'results': paginated_categories
-        })
+            'results': [row['name'] for row in paginated_rows],
+            'items': [
+                {
+                    'name': row['name'],
+                    'count': row['count'],
+                    'min_price': row['min_price'],
+                    'max_price': row['max_price'],
+                    'last_seen': row['last_seen'].isoformat() if row['last_seen'] else None,
+                }
+                for row in paginated_rows
+            ],
+        }
+        return cache_response(
+            request, cache_key, response_data, getattr(settings, 'FACET_REFRESH_INTERVAL', 900),
+            cost=time.monotonic() - started,
+        )
+
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        """
+        Get all unique categories, pagination and search.
+
+        Served from the in-memory facet table (refreshed in the background).
+        Names are canonical: the spellings of the same category at different
+        retailers are merged (category map), and filtering the list with a
+        canonical name matches all of them.
+
+        Query parameters:
+        - search: Filter categories by name (case- and umlaut-insensitive)
+        - retailer: Restrict to one retailer (default: all)
+        - page: Page number (default: 1)
+        - page_size: Items per page (default: 50, max: 200)
+
+        Returns list of category names, plus per-category counts and price
+        range in 'items'.
+        """
+        return self._facet_response(
+            request, 'categories',
+            lambda retailer, search, mode: get_facet_table('category', retailer).search(search),
+        )
 
     @action(detail=False, methods=['get'])
     def brands(self, request):
         """
         Get all unique brands, pagination and search.
 
+        Served from the in-memory brand directory (rebuilt with the facet
+        tables): prefix matches come first, then other substring matches.
+
         Query parameters:
-        - search: Filter brands by name
+        - search: Filter brands by name (case- and umlaut-insensitive)
+        - mode: 'prefix' to only return brands starting with search (typeahead)
+        - retailer: Restrict to one retailer (default: all)
         - page: Page number (default: 1)
         - page_size: Items per page (default: 50, max: 200)
 
-        Returns list of brand names.
+        Returns list of brand names, plus per-brand counts and price range
+        in 'items'.
         """
-        # Get all unique brands from each retailer
-        saturn_brands = list(SaturnProduct.objects.distinct('brand'))
-        mediamarkt_brands = list(MediaMarktProduct.objects.distinct('brand'))
-        otto_brands = list(OttoProduct.objects.distinct('brand'))
+        return self._facet_response(
+            request, 'brands',
+            lambda retailer, search, mode: get_brand_directory(retailer).search(
+                search, prefix_only=(mode == 'prefix')
+            ),
+        )
 
-        try:
-            kaufland_brands = list(KauflandProduct.objects.distinct('brand'))
-        except Exception as e:
-            logger.warning(f"Could not get Kaufland brands: {e}")
-            kaufland_brands = []
-
-        # Combine all unique brands and filter out None/empty values
-        all_brands = sorted(set(
-            b for b in (
-                saturn_brands +
-                mediamarkt_brands +
-                otto_brands +
-                kaufland_brands
-            )
-            if b and b.strip()  # Filter out None and empty strings
-        ))
+    def _serialize_category_stats(self, row):
+        return {
+            'name': row['name'],
+            'count': row['count'],
+            'retailers': row['retailers'],
+            'min_price': row['min_price'],
+            'median_price': row['median_price'],
+            'max_price': row['max_price'],
+            'newest': row['newest'].isoformat() if row['newest'] else None,
+            'image_share': row['image_share'],
+        }
 
-        # Filter by search query
-        search = request.query_params.get('search', '').lower()
-        if search:
-            all_brands = [b for b in all_brands if search in b.lower()]
+    @action(detail=False, methods=['get'])
+    def category_stats(self, request):
+        """
+        Get precomputed statistics per category (served from memory).
+
+        Query parameters:
+        - category: Return the statistics of this category only
+        - search: Filter categories by name (case- and umlaut-insensitive)
+        - ordering: 'count' (default, most products first) or 'name'
+        - page: Page number (default: 1)
+        - page_size: Items per page (default: 50, max: 200)
+
+        Each row has the product count per retailer, min/median/max price,
+        newest scraped_at and the share of products with an image.
+        """
+        stats = get_category_stats()
+
+        category = request.query_params.get('category', '')
+        if category:
+            row = get_category_stats_row(stats, category)
+            if row is None:
+                return Response({'detail': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(self._serialize_category_stats(row))
+
+        rows = stats['table'].search(request.query_params.get('search', ''))
+        if request.query_params.get('ordering', 'count') == 'count':
+            rows = sorted(rows, key=lambda r: (-r['count'], r['name']))
 
-        # Pagination
         page = int(request.query_params.get('page', 1))
         page_size = min(int(request.query_params.get('page_size', 50)), 200)
-
-        total_count = len(all_brands)
         start = (page - 1) * page_size
         end = start + page_size
 
-        paginated_brands = all_brands[start:end]
-
-        # Calculate pagination info
-        has_next = end < total_count
-        has_prev = page > 1
-
         return Response({
-            'count': total_count,
-            'next': f'?page={page + 1}&page_size={page_size}&search={search}' if has_next else None,
-            'previous': f'?page={page - 1}&page_size={page_size}&search={search}' if has_prev else None,
+            'count': len(rows),
             'page': page,
             'page_size': page_size,
-            'total_pages': (total_count + page_size - 1) // page_size,
-            'results': paginated_brands
+            'total_pages': (len(rows) + page_size - 1) // page_size,
+            'updated_at': (
+                datetime.fromtimestamp(category_stats_store.built_at, tz=dt_timezone.utc).isoformat()
+                if category_stats_store.built_at else None
+            ),
+            'results': [self._serialize_category_stats(row) for row in rows[start:end]],
         })
 
+    @action(detail=False, methods=['get'])
+    def price_histogram(self, request):
+        """
+        Get bucketed price counts for a filter set (price range sliders).
+
+        Query parameters:
+        - search, category, brand, retailer, min_price, max_price: Same filters as the list
+        - buckets: Number of buckets (default: 20, max: 100)
+        - mode: 'fixed' (default, equal-width buckets) or 'quantile' (buckets
+          holding roughly the same number of products)
+        """
+        try:
+            buckets = int(request.query_params.get('buckets', 20))
+        except ValueError:
+            return Response({'detail': 'buckets must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        histogram = get_price_histogram(
+            retailer=request.query_params.get('retailer', 'all').lower(),
+            category=request.query_params.get('category', ''),
+            brand=request.query_params.get('brand', ''),
+            search=request.query_params.get('search', ''),
+            min_price=parse_price(request.query_params.get('min_price', None)),
+            max_price=parse_price(request.query_params.get('max_price', None)),
+            buckets=buckets,
+            mode=request.query_params.get('mode', 'fixed'),
+        )
+        return Response(histogram)
+
+    @action(detail=False, methods=['get'])
+    def deals(self, request):
+        """
+        Get the products with the highest discount across retailers.
+
+        Query parameters:
+        - category: Restrict to a category (canonical name or alias)
+        - retailer: Restrict to one retailer (default: all)
+        - limit: Number of deals (default: 24, max: 100)
+
+        Sorted by discount_pct (derived from old_price/price, see
+        backfill_discounts), cached per category.
+        """
+        category = request.query_params.get('category', '')
+        retailer = request.query_params.get('retailer', 'all').lower()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 24)), 1), 100)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        deals = get_deals(category, retailer, limit)
+        return Response({'count': len(deals), 'results': deals})
+
+    @action(detail=False, methods=['get'])
+    def price_drops(self, request):
+        """
+        Get the products whose price dropped recently, newest first.
+
+        Query parameters:
+        - hours: How far back to look (default: 24, max: 720)
+        - retailer: Restrict to one retailer (default: all)
+        - min_pct: Minimum drop in percent (default: 0)
+        - limit: Number of drops (default: 24, max: 100)
+
+        Drops are detected by record_price_history.
+        """
+        retailer = request.query_params.get('retailer', 'all').lower()
+        try:
+            hours = min(max(int(request.query_params.get('hours', 24)), 1), 720)
+            limit = min(max(int(request.query_params.get('limit', 24)), 1), 100)
+            min_pct = float(request.query_params.get('min_pct', 0))
+        except ValueError:
+            return Response(
+                {'detail': 'hours, limit and min_pct must be numbers'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+        drops = get_price_drops(since, retailer, min_pct, limit)
+        return Response({'count': len(drops), 'results': drops})
+
+    @action(detail=False, methods=['post'])
+    def alerts(self, request):
+        """
+        Subscribe to a price alert ("notify me below X €").
+
+        Body: email, threshold and either product_id or gtin. The alert is
+        emailed once, by send_price_alerts, when a scraped price of the
+        product (or of any offer of the GTIN) is at or below the threshold.
+        """
+        fields = [request.data.get(name) for name in ('email', 'product_id', 'gtin')]
+        if not all(value is None or isinstance(value, (str, int)) for value in fields):
+            return Response(
+                {'detail': 'email, product_id and gtin must be strings'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        email, product_id, gtin = fields
+        email = str(email or '').strip()
+        product_id = str(product_id or '').strip()
+        gtin = normalize_gtin(gtin)
+        try:
+            validate_email(email)
+        except ValidationError:
+            return Response({'detail': 'A valid email is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            threshold = float(request.data.get('threshold'))
+        except (TypeError, ValueError):
+            threshold = 0
+        if threshold <= 0:
+            return Response({'detail': 'threshold must be a positive price'}, status=status.HTTP_400_BAD_REQUEST)
+        if bool(product_id) == bool(gtin):
+            return Response({'detail': 'Either product_id or gtin is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        retailer = None
+        if product_id:
+            product = get_product_data(product_id) if ObjectId.is_valid(product_id) else None
+            if product is None:
+                return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+            retailer = product['retailer']
+
+        max_alerts = getattr(settings, 'PRICE_ALERTS_PER_EMAIL', 50)
+        if PriceAlert.objects(email=email, active=True).count() >= max_alerts:
+            return Response(
+                {'detail': f'At most {max_alerts} active alerts per email'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        alert = create_alert(email, threshold, product_id=product_id or None, retailer=retailer, gtin=gtin)
+        return Response(
+            {'id': str(alert.id), 'threshold': threshold, 'product_id': alert.product_id, 'gtin': alert.gtin},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=False, methods=['get', 'post'], url_path='alerts/unsubscribe')
+    def unsubscribe_alert(self, request):
+        """Deactivate a price alert (?token= from the alert email)"""
+        token = request.query_params.get('token') or request.data.get('token')
+        if not token or not PriceAlert.objects(token=token).update_one(set__active=False):
+            return Response({'detail': 'Alert not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'success': 'Alert deactivated'})
+
     @action(detail=False, methods=['get'])
     def by_gtin(self, request):
         """Get products by GTIN (cross-retailer comparison)"""
@@ -742,150 +864,225 @@ class ProductViewSet(viewsets.ViewSet):
 
         return Response({'results': products})
 
-    @action(detail=True, methods=['get'])
-    def similar(self, request, pk=None):
-        """Get similar products based on category from all retailers"""
-        # Find the product across all retailers
-        product = None
-        retailer = None
+    @action(detail=False, methods=['get'])
+    def by_group(self, request):
+        """Get the products of a cross-retailer product group (match_products)
 
-        retailers_config = [
-            ('saturn', SaturnProduct, SaturnProductSerializer),
-            ('mediamarkt', MediaMarktProduct, MediaMarktProductSerializer),
-            ('otto', OttoProduct, OttoProductSerializer),
-            ('kaufland', KauflandProduct, KauflandProductSerializer),
-        ]
+        Groups also cover products without a GTIN; every product carries its
+        'product_group' (if any) in the API output.
+        """
+        group = request.query_params.get('group', '')
+        if not group:
+            return Response({'detail': 'group parameter required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Find the original product
-        for ret_name, model, _ in retailers_config:
+        def load(item):
+            retailer_name, model = item
             try:
-                product = model.objects.get(id=pk)
-                retailer = ret_name
-                break
-            except model.DoesNotExist:
-                continue
+                results = []
+                for product in model.objects(product_group=group):
+                    data = self._get_serializer_for_retailer(retailer_name)(product).data
+                    data['retailer'] = retailer_name
+                    results.append(data)
+                return results
             except Exception as e:
-                logger.warning(f"Error checking {ret_name} for product {pk}: {e}")
+                logger.warning(f"Error fetching product group {group} from {retailer_name}: {e}")
+                return []
+
+        with ThreadPoolExecutor(max_workers=len(RETAILER_MODELS)) as executor:
+            products = [data for results in executor.map(load, RETAILER_MODELS.items()) for data in results]
+
+        if not products:
+            return Response({'detail': 'Product group not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'results': products})
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """
+        Get the price history of a product (price changes recorded by
+        record_price_history).
+
+        Query parameters:
+        - days: Window ending now (default: 365)
+        - from, to: Explicit window (ISO dates or datetimes, UTC) instead of days
+        - resolution: raw, day, week or auto (default: the finest one that
+          keeps the response around a few hundred points)
+
+        Returns parallel 'timestamps' (epoch seconds) and 'prices' arrays; for
+        day/week the timestamps are bucket starts, 'prices' the last price of
+        each bucket and 'min'/'max' its price range.
+        """
+        if not ObjectId.is_valid(str(pk)):
+            return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        end = datetime.utcnow()
+        try:
+            start = end - timedelta(days=min(int(request.query_params.get('days', 365)), 3650))
+        except ValueError:
+            return Response({'detail': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        for param in ('from', 'to'):
+            value = request.query_params.get(param)
+            if not value:
                 continue
+            parsed = parse_datetime(value)
+            if parsed is None and parse_date(value) is not None:
+                parsed = datetime.combine(parse_date(value), datetime.min.time())
+            if parsed is None:
+                return Response({'detail': f'Invalid {param} date'}, status=status.HTTP_400_BAD_REQUEST)
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(dt_timezone.utc).replace(tzinfo=None)
+            if param == 'from':
+                start = parsed
+            else:
+                end = parsed
+
+        resolution = request.query_params.get('resolution', 'auto')
+        if resolution not in ('auto', 'raw') + ROLLUP_RESOLUTIONS:
+            return Response({'detail': 'Invalid resolution'}, status=status.HTTP_400_BAD_REQUEST)
+        if resolution == 'auto':
+            resolution = choose_resolution(start, end)
+
+        # float32 storage: round back to cents
+        def cents(values):
+            return [round(value, 2) for value in values]
+
+        data = {
+            'product_id': pk,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'resolution': resolution,
+        }
+        if resolution == 'raw':
+            times, prices = get_history(pk, start, end)
+        else:
+            times, mins, maxs, prices = get_rollup(pk, resolution, start, end)
+            data['min'] = cents(mins)
+            data['max'] = cents(maxs)
+        data['count'] = len(times)
+        data['timestamps'] = list(times)
+        data['prices'] = cents(prices)
+        return Response(data)
 
-        if not product:
+    @action(detail=False, methods=['get'])
+    def best_offers(self, request):
+        """
+        Get the cheapest current offer of several products in one request.
+
+        Query parameters:
+        - gtin: Comma-separated GTINs
+        - group: Comma-separated product groups (see by_group)
+
+        Returns, per requested GTIN/group that has offers: cheapest retailer,
+        product and price, most expensive price, spread, number of offers
+        and all offers sorted by price (best-offer index, update_best_offers).
+        """
+        gtins = [g for g in request.query_params.get('gtin', '').split(',') if normalize_gtin(g)]
+        groups = [g.strip() for g in request.query_params.get('group', '').split(',') if g.strip()]
+        if not gtins and not groups:
+            return Response({'detail': 'gtin or group parameter required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(gtins) + len(groups) > getattr(settings, 'BEST_OFFERS_MAX_KEYS', 100):
+            return Response({'detail': 'Too many keys'}, status=status.HTTP_400_BAD_REQUEST)
+
+        keys = [f'gtin:{normalize_gtin(g)}' for g in gtins] + [f'group:{g}' for g in groups]
+        offers = get_best_offers(keys)
+
+        return Response({
+            'gtins': {g: offers[f'gtin:{normalize_gtin(g)}'] for g in gtins if f'gtin:{normalize_gtin(g)}' in offers},
+            'groups': {g: offers[f'group:{g}'] for g in groups if f'group:{g}' in offers},
+        })
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Get similar products from all retailers.
+
+        Ranked by title similarity (MinHash/LSH, see similarity.py) and price
+        proximity: read from the table precomputed nightly, or computed from
+        the in-memory index for products newer than the last run. Falls back
+        to the newest products of the same category while the index is being
+        built or when it finds nothing.
+        """
+        # Find the original product (cached, shared with retrieve)
+        product = get_product_data(pk)
+        if product is None:
             return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Find similar products from all retailers
-        similar_products = []
         limit = 6  # Increased limit to show more products from all retailers
 
-        # Search in same retailer first, then others
-        for ret_name, model, serializer_class in retailers_config:
-            if len(similar_products) >= limit:
-                break
+        matches = get_precomputed_similar(pk, limit)
+        if matches is None:
+            matches = find_similar(product, limit)
+        if matches:
+            similar_products = get_products_data(
+                (retailer_name, match_id) for match_id, retailer_name, _ in matches
+            )
+        else:
+            similar_products = self._similar_by_category(product, pk, limit)
+
+        return Response({
+            'count': len(similar_products),
+            'results': similar_products
+        })
 
+    def _similar_by_category(self, product, pk, limit):
+        """Newest products of the same category, all retailers queried in parallel"""
+        retailers_config = [
+            ('saturn', SaturnProduct, SaturnProductSerializer),
+            ('mediamarkt', MediaMarktProduct, MediaMarktProductSerializer),
+            ('otto', OttoProduct, OttoProductSerializer),
+            ('kaufland', KauflandProduct, KauflandProductSerializer),
+        ]
+
+        def load(config):
+            ret_name, model, serializer_class = config
             try:
+                query = model.objects.filter(**category_filter_kwargs(product['category'], ret_name))
                 # Exclude current product if searching in same retailer
-                query = model.objects.filter(category=product.category)
-                if ret_name == retailer:
+                if ret_name == product['retailer']:
                     query = query.filter(id__ne=pk)
 
-                remaining = limit - len(similar_products)
-                similar = query.order_by('-scraped_at').limit(remaining)
-
-                for p in similar:
-                    serializer = serializer_class(p)
-                    data = serializer.data
+                results = []
+                for p in query.order_by('-scraped_at').limit(limit):
+                    data = serializer_class(p).data
                     data['retailer'] = ret_name
-                    similar_products.append(data)
+                    results.append(data)
+                return results
             except Exception as e:
                 logger.warning(f"Error fetching similar products from {ret_name}: {e}")
-                continue
+                return []
 
-        return Response({
-            'count': len(similar_products),
-            'results': similar_products
-        })
+        with ThreadPoolExecutor(max_workers=len(retailers_config)) as executor:
+            per_retailer = list(executor.map(load, retailers_config))
+
+        # Same order as before: Saturn first, then the other retailers
+        return [data for results in per_retailer for data in results][:limit]
 
     @action(detail=False, methods=['get'])
     def sitemap(self, request):
         """
-        Get products for sitemap generation (paginated, optimized for search engines).
-        Returns minimal data (id, lastModified) to keep response small.
+        Get products for sitemap generation (most recently scraped first).
+        Returns minimal data (id, lastModified), streamed while it is read.
 
         Usage:
         - GET /api/products/sitemap/?limit=10000
-        Returns up to 10000 products (default/max)
+        Returns up to 10000 products (default, max 50000)
+        - GET /api/products/sitemap/?output=xml
+        Same products as a sitemap.org urlset
         """
-        limit = int(request.query_params.get('limit', 10000))
-        limit = min(limit, 50000)  # Max 50k per request
-
         try:
-            # Get all products with minimal fields
-            saturn_products = list(
-                SaturnProduct.objects.only('id', 'scraped_at')
-                .order_by('-scraped_at')
-                .limit(limit)
-            )
-
-            mediamarkt_products = list(
-                MediaMarktProduct.objects.only('id', 'scraped_at')
-                .order_by('-scraped_at')
-                .limit(limit)
-            )
-
-            otto_products = list(
-                OttoProduct.objects.only('id', 'scraped_at')
-                .order_by('-scraped_at')
-                .limit(limit)
-            )
+            limit = int(request.query_params.get('limit', 10000))
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), MAX_SITEMAP_ENTRIES)
+        output = request.query_params.get('output', 'json')
 
-            kaufland_products = list(
-                KauflandProduct.objects.only('id', 'scraped_at')
-                .order_by('-scraped_at')
-                .limit(limit)
+        try:
+            entries = sitemap_entries(limit)
+            if output == 'xml':
+                return StreamingHttpResponse(render_xml(entries), content_type='application/xml; charset=utf-8')
+            return StreamingHttpResponse(
+                render_json(entries, product_count(), limit), content_type='application/json'
             )
 
-            # Combine and format for sitemap
-            all_products = []
-
-            for p in saturn_products:
-                all_products.append({
-                    'id': str(p.id),
-                    'lastModified': p.scraped_at.isoformat() if p.scraped_at else datetime.now().isoformat()
-                })
-
-            for p in mediamarkt_products:
-                all_products.append({
-                    'id': str(p.id),
-                    'lastModified': p.scraped_at.isoformat() if p.scraped_at else datetime.now().isoformat()
-                })
-
-            for p in otto_products:
-                all_products.append({
-                    'id': str(p.id),
-                    'lastModified': p.scraped_at.isoformat() if p.scraped_at else datetime.now().isoformat()
-                })
-
-            for p in kaufland_products:
-                all_products.append({
-                    'id': str(p.id),
-                    'lastModified': p.scraped_at.isoformat() if p.scraped_at else datetime.now().isoformat()
-                })
-
-            # Sort by date descending
-            all_products.sort(key=lambda x: x['lastModified'], reverse=True)
-
-            # Get total counts
-            total_saturn = SaturnProduct.objects.count()
-            total_mediamarkt = MediaMarktProduct.objects.count()
-            total_otto = OttoProduct.objects.count()
-            total_kaufland = KauflandProduct.objects.count()
-            total_count = total_saturn + total_mediamarkt + total_otto + total_kaufland
-
-            return Response({
-                'count': total_count,
-                'returned': len(all_products),
-                'limit': limit,
-                'results': all_products[:limit]  # Return only up to limit
-            })
-
         except Exception as e:
             import traceback
             logger.error(f"Sitemap error: {traceback.format_exc()}")
@@ -904,118 +1101,55 @@ class ProductViewSet(viewsets.ViewSet):
 
         Usage: GET /api/products/google_merchant_feed/
 
-        NOTE: Temporarily disabled due to performance issues (loading all products without limit)
-        """
-        # TEMPORARILY DISABLED - Performance issue: loads all products without limit
-        return HttpResponse(
-            '<?xml version="1.0"?><error>This endpoint is temporarily disabled for optimization. Please use /api/products/sitemap/ instead.</error>',
-            content_type='application/xml',
-            status=503
-        )
-
-        # Original code commented out until optimization is complete
+        Serves the file written by generate_merchant_feed while it is younger
+        than MERCHANT_FEED_MAX_AGE, otherwise streams the feed from the
+        database (see products/feeds.py). gzip-encoded when accepted.
         """
+        accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        path = str(getattr(settings, 'MERCHANT_FEED_PATH', ''))
         try:
-            # Fetch all products (limited to 10000 to prevent memory issues)
-            saturn_products = list(SaturnProduct.objects.order_by('-scraped_at').limit(10000))
-            mediamarkt_products = list(MediaMarktProduct.objects.order_by('-scraped_at').limit(10000))
-            otto_products = list(OttoProduct.objects.order_by('-scraped_at').limit(10000))
-            kaufland_products = list(KauflandProduct.objects.order_by('-scraped_at').limit(10000))
-
-            # Create RSS XML structure
-            rss = Element('rss', {
-                'version': '2.0',
-                'xmlns:g': 'http://base.google.com/ns/1.0'
-            })
-
-            channel = SubElement(rss, 'channel')
-            SubElement(channel, 'title').text = 'Preisradio - Vergleichen Sie Preise'
-            SubElement(channel, 'link').text = 'https://preisradio.de'
-            SubElement(channel, 'description').text = 'Finden Sie die besten Angebote von Saturn, MediaMarkt und Otto'
-
-            # Helper function to add product to feed
-            def add_product_to_feed(product, retailer):
-                item = SubElement(channel, 'item')
-
-                # Required fields
-                SubElement(item, 'g:id').text = str(product.id)
-                SubElement(item, 'title').text = product.title[:150] if product.title else 'Produkt'
-                SubElement(item, 'description').text = (product.description[:5000] if product.description else product.title[:5000]) if product.title else 'Keine Beschreibung'
-                SubElement(item, 'link').text = f'https://preisradio.de/product/{product.id}'
-
-                # Image
-                if product.image:
-                    SubElement(item, 'g:image_link').text = product.image
-
-                # Price - format as "99.99 EUR"
-                if product.price:
-                    SubElement(item, 'g:price').text = f'{product.price:.2f} EUR'
-
-                # Availability
-                SubElement(item, 'g:availability').text = 'in stock'
-
-                # Condition
-                SubElement(item, 'g:condition').text = 'new'
-
-                # Brand
-                if product.brand:
-                    SubElement(item, 'g:brand').text = product.brand[:70]
-
-                # GTIN (if available)
-                if product.gtin:
-                    SubElement(item, 'g:gtin').text = str(product.gtin)
-
-                # Additional fields
-                if product.category:
-                    SubElement(item, 'g:product_type').text = product.category
-
-                # Custom attribute for retailer name
-                SubElement(item, 'g:custom_label_0').text = retailer
-
-                # Original retailer URL (optional, for reference)
-                if product.url:
-                    SubElement(item, 'g:custom_label_1').text = product.url[:100]
-
-            # Add all products to feed
-            for product in saturn_products:
-                add_product_to_feed(product, 'Saturn')
-
-            for product in mediamarkt_products:
-                add_product_to_feed(product, 'MediaMarkt')
-
-            for product in otto_products:
-                add_product_to_feed(product, 'Otto')
-
-            for product in kaufland_products:
-                add_product_to_feed(product, 'Kaufland')
-
-            # Convert to pretty XML string
-            xml_string = minidom.parseString(tostring(rss, encoding='utf-8')).toprettyxml(indent='  ', encoding='utf-8')
-
-            # Return XML response with cache headers
-            response = HttpResponse(xml_string, content_type='application/xml; charset=utf-8')
-            response['Cache-Control'] = 'public, s-maxage=86400, stale-while-revalidate=43200'
-
-            return response
+            age = time.time() - os.stat(path).st_mtime
+        except OSError:
+            age = None
+
+        if age is not None and age < getattr(settings, 'MERCHANT_FEED_MAX_AGE', 26 * 3600):
+            if accepts_gzip:
+                response = FileResponse(
+                    open(path, 'rb'), filename='google_merchant_feed.xml',
+                    content_type='application/xml; charset=utf-8',
+                )
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = StreamingHttpResponse(
+                    gunzip_file_chunks(path),
+                    content_type='application/xml; charset=utf-8',
+                )
+        else:
+            chunks = feed_chunks()
+            if accepts_gzip:
+                response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/xml; charset=utf-8')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = StreamingHttpResponse(chunks, content_type='application/xml; charset=utf-8')
 
-        except Exception as e:
-            import traceback
-            logger.error(f"Google Merchant Feed error: {traceback.format_exc()}")
-            return HttpResponse(
-                f'<?xml version="1.0"?><error>{str(e)}</error>',
-                content_type='application/xml',
-                status=500
-            )
-        """
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Cache-Control'] = 'public, s-maxage=86400, stale-while-revalidate=43200'
+        return response
 
     @action(detail=False, methods=['post'])
     def sync_to_google_merchant(self, request):
         """
         Sync products to Google Merchant Center via API.
 
+        Uploads only the products that changed since they were last synced,
+        resuming from the sync checkpoint, and removes deleted products when
+        a sweep is due (see products/merchant_sync.py and the
+        sync_google_merchant command).
+
         Query parameters:
-        - limit (int): Number of products to sync (default: 100, max: 10000)
-        - retailer (str): Filter by retailer (saturn, mediamarkt, otto, or all)
+        - limit (int): Maximum products scanned per retailer (default: 100, max: 10000);
+          the next call continues from there
+        - retailer (str): Filter by retailer (saturn, mediamarkt, otto, kaufland or all)
 
         Returns:
             JSON response with sync statistics
@@ -1025,8 +1159,11 @@ class ProductViewSet(viewsets.ViewSet):
             limit = int(request.query_params.get('limit', 100))
             limit = min(limit, 10000)  # Cap at 10000
             retailer = request.query_params.get('retailer', 'all').lower()
+            if retailer != 'all' and retailer not in RETAILER_MODELS:
+                return Response({'error': f'Unknown retailer: {retailer}'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Initialize Google Merchant service
+            # Shared Google Merchant service (built on the first call of the process)
+            started = time.monotonic()
             try:
                 merchant_service = get_merchant_service()
             except Exception as e:
@@ -1038,104 +1175,28 @@ class ProductViewSet(viewsets.ViewSet):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
-            # Fetch products based on retailer filter
-            all_products = []
+            setup_seconds = time.monotonic() - started
 
-            if retailer in ['saturn', 'all']:
-                saturn_products = list(
-                    SaturnProduct.objects.order_by('-scraped_at').limit(limit)
-                )
-                all_products.extend([
-                    {
-                        'id': str(p.id),
-                        'title': p.title,
-                        'description': p.description,
-                        'price': p.price,
-                        'image': p.image,
-                        'brand': p.brand,
-                        'gtin': p.gtin,
-                        'category': p.category,
-                    }
-                    for p in saturn_products
-                ])
-
-            if retailer in ['mediamarkt', 'all']:
-                mediamarkt_products = list(
-                    MediaMarktProduct.objects.order_by('-scraped_at').limit(limit)
-                )
-                all_products.extend([
-                    {
-                        'id': str(p.id),
-                        'title': p.title,
-                        'description': p.description,
-                        'price': p.price,
-                        'image': p.image,
-                        'brand': p.brand,
-                        'gtin': p.gtin,
-                        'category': p.category,
-                    }
-                    for p in mediamarkt_products
-                ])
-
-            if retailer in ['otto', 'all']:
-                otto_products = list(
-                    OttoProduct.objects.order_by('-scraped_at').limit(limit)
-                )
-                all_products.extend([
-                    {
-                        'id': str(p.id),
-                        'title': p.title,
-                        'description': p.description,
-                        'price': p.price,
-                        'image': p.image,
-                        'brand': p.brand,
-                        'gtin': p.gtin,
-                        'category': p.category,
-                    }
-                    for p in otto_products
-                ])
-
-            if retailer in ['kaufland', 'all']:
-                kaufland_products = list(
-                    KauflandProduct.objects.order_by('-scraped_at').limit(limit)
-                )
-                all_products.extend([
-                    {
-                        'id': str(p.id),
-                        'title': p.title,
-                        'description': p.description,
-                        'price': p.price,
-                        'image': p.image,
-                        'brand': p.brand,
-                        'gtin': p.gtin,
-                        'category': p.category,
-                    }
-                    for p in kaufland_products
-                ])
-
-            # Limit total products if needed
-            all_products = all_products[:limit]
-
-            if not all_products:
-                return Response(
-                    {
-                        'message': 'No products found to sync',
-                        'stats': {
-                            'total': 0,
-                            'success': 0,
-                            'failed': 0
-                        }
-                    },
-                    status=status.HTTP_200_OK
-                )
-
-            # Batch upload products to Google Merchant Center
-            sync_stats = merchant_service.batch_insert_products(all_products)
+            retailers = None if retailer == 'all' else [retailer]
+            sync = MerchantSync(merchant_service)
+            sync.sync_changes(retailers, max_products=limit)
+            if sync.sweep_due(retailers):
+                sync.sweep_deleted(retailers)
 
+            timings = {
+                'setup_seconds': round(setup_seconds, 3),
+                'upload_seconds': round(sync.stats['upload_seconds'], 3),
+                'total_seconds': round(time.monotonic() - started, 3),
+            }
+            logger.info(
+                f"Google Merchant sync: setup {timings['setup_seconds']}s, "
+                f"upload {timings['upload_seconds']}s, total {timings['total_seconds']}s"
+            )
             return Response(
                 {
-                    'message': f'Successfully synced products to Google Merchant Center',
-                    'stats': sync_stats
+                    'message': 'Synced changed products to Google Merchant Center',
+                    'stats': sync.stats,
+                    'timings': timings,
                 },
                 status=status.HTTP_200_OK
             )
@@ -1150,3 +1211,24 @@ class ProductViewSet(viewsets.ViewSet):
                 },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+def sitemap_file(request, name):
+    """Serve a sitemap file written by generate_sitemaps (never queries MongoDB)"""
+    if not SITEMAP_FILE_RE.match(name):
+        raise Http404
+    path = os.path.join(getattr(settings, 'SITEMAP_DIR', ''), name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404
+
+    # Unchanged files are not rewritten, so mtime and size identify the content
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(open(path, 'rb'))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'SITEMAP_MAX_AGE', 3600))
+    return response